@@ -0,0 +1,113 @@
+"""Benchmark LiveImageCopier against rsync -aHAXS on a generated tree.
+
+Usage: python3 benchmarks/bench_live_copy.py [--files N] [--large-mb M] [--workdir DIR]
+
+The generated tree mixes many small files, a few large ones, sparse files,
+hard links and symlinks. Both copies are verified to have the same file
+sizes, link counts and allocated blocks for the sparse files.
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.live_copy import LiveImageCopier
+
+
+def generate_tree(root, small_files, large_mb):
+    rng = random.Random(42)
+    total = 0
+    for i in range(small_files):
+        directory = os.path.join(root, f"usr/share/d{i % 97:02d}/s{i % 13}")
+        os.makedirs(directory, exist_ok=True)
+        size = rng.choice([0, 100, 700, 3000, 12000, 40000])
+        with open(os.path.join(directory, f"f{i}"), 'wb') as f:
+            f.write(os.urandom(size))
+        total += size
+    os.makedirs(os.path.join(root, 'usr/lib'), exist_ok=True)
+    for i in range(4):
+        path = os.path.join(root, f"usr/lib/large{i}.bin")
+        with open(path, 'wb') as f:
+            for _ in range(large_mb // 4):
+                f.write(os.urandom(1024 * 1024))
+        total += (large_mb // 4) * 1024 * 1024
+    # Sparse: 1 GiB apparent size, 2 MiB of data
+    sparse = os.path.join(root, 'var/lib/sparse.img')
+    os.makedirs(os.path.dirname(sparse), exist_ok=True)
+    with open(sparse, 'wb') as f:
+        f.seek(512 * 1024 * 1024)
+        f.write(os.urandom(2 * 1024 * 1024))
+        f.truncate(1024 * 1024 * 1024)
+    for i in range(50):
+        os.link(os.path.join(root, 'usr/lib/large0.bin'), os.path.join(root, f"usr/lib/hardlink{i}"))
+        os.symlink(f"large{i % 4}.bin", os.path.join(root, f"usr/lib/symlink{i}"))
+    return total
+
+
+def drop_caches():
+    try:
+        subprocess.run(['sync'], check=True)
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+    except OSError:
+        pass # Not root: results include page cache effects
+
+
+def verify(source, target):
+    mismatches = 0
+    for dirpath, _, filenames in os.walk(source):
+        for name in filenames:
+            src = os.path.join(dirpath, name)
+            dst = os.path.join(target, os.path.relpath(src, source))
+            s, d = os.lstat(src), os.lstat(dst)
+            if (s.st_size, s.st_mode, s.st_nlink) != (d.st_size, d.st_mode, d.st_nlink):
+                mismatches += 1
+            elif s.st_blocks and d.st_blocks > s.st_blocks * 2:
+                mismatches += 1 # Sparse file was filled in
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--large-mb', type=int, default=256)
+    parser.add_argument('--workdir', default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='live-copy-bench-', dir=args.workdir)
+    try:
+        source = os.path.join(workdir, 'source')
+        print(f"Generating tree in {source}...")
+        total = generate_tree(source, args.files, args.large_mb)
+        print(f"{args.files} small files, {args.large_mb} MiB large files, {total / 1024 ** 2:.0f} MiB data")
+
+        results = {}
+        target = os.path.join(workdir, 'engine')
+        drop_caches()
+        start = time.monotonic()
+        stats = LiveImageCopier(source, target, excluded=()).run()
+        results['LiveImageCopier'] = time.monotonic() - start
+        print(f"LiveImageCopier: {results['LiveImageCopier']:.2f}s, {stats.throughput / 1024 ** 2:.0f} MiB/s, "
+              f"{len(stats.errors)} errors, {verify(source, target)} mismatches")
+
+        if shutil.which('rsync'):
+            target = os.path.join(workdir, 'rsync')
+            drop_caches()
+            start = time.monotonic()
+            subprocess.run(['rsync', '-aHAXS', f"{source}/", f"{target}/"], check=True)
+            results['rsync -aHAXS'] = time.monotonic() - start
+            print(f"rsync -aHAXS:    {results['rsync -aHAXS']:.2f}s, {verify(source, target)} mismatches")
+            print(f"Speedup: {results['rsync -aHAXS'] / results['LiveImageCopier']:.2f}x")
+        else:
+            print("rsync not installed, skipping comparison")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import os
+
+from gi.repository import Gio, GLib
+
+BOSS_BUS_NAME = 'org.fedoraproject.Anaconda.Boss'
+MODULES_BUS_PREFIX = 'org.fedoraproject.Anaconda.Modules'
+PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+# Module calls are quick; a module that does not answer in time is reported as such
+CALL_TIMEOUT_MS = 30000
+
+
+def _module(name, *path):
+    """Returns (bus_name, object_path, interface) of an Anaconda module (or one of its objects)."""
+    bus_name = f"{MODULES_BUS_PREFIX}.{name}"
+    suffix = '/'.join(path)
+    object_path = f"/{bus_name.replace('.', '/')}" + (f"/{suffix}" if suffix else '')
+    return bus_name, object_path, '.'.join((bus_name,) + path)
+
+
+LOCALIZATION = _module('Localization')
+TIMEZONE = _module('Timezone')
+USERS = _module('Users')
+STORAGE = _module('Storage')
+DISK_SELECTION = _module('Storage', 'DiskSelection')
+PAYLOADS = _module('Payloads')
+DNF_PAYLOAD_INTERFACE = f"{PAYLOADS[2]}.Payload.DNF"
+
+
+_connection = None
+_available = None
+
+
+def get_anaconda_connection():
+    """Returns the system bus connection, or None when Anaconda is not running. Main thread only."""
+    global _connection, _available
+    if _available is None:
+        try:
+            _connection = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            reply = _connection.call_sync(
+                'org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus', 'NameHasOwner',
+                GLib.Variant('(s)', (BOSS_BUS_NAME,)), GLib.VariantType('(b)'),
+                Gio.DBusCallFlags.NONE, CALL_TIMEOUT_MS, None)
+            _available = reply.unpack()[0]
+        except GLib.Error as e:
+            print(f"Could not reach the system bus: {e.message}")
+            _available = False
+        if not _available:
+            print("Anaconda is not running; settings are applied when the installation starts")
+    return _connection if _available else None
+
+
+class ModuleResult:
+    """Outcome of a call sequence: module-side errors and warnings, and its value."""
+
+    __slots__ = ('module', 'errors', 'warnings', 'value')
+
+    def __init__(self, module):
+        self.module = module
+        self.errors = []
+        self.warnings = []
+        self.value = None
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class CallSequence:
+    """Drives a generator of DBus calls asynchronously on the main loop.
+
+    The generator yields call tuples (bus name, object path, interface,
+    method, parameters, reply type) and receives each reply. It may also
+    yield ('report', errors, warnings) to pass on the module's own
+    validation, ('wait', milliseconds) to pause, for example between task
+    polls, and ('result', value) to set the outcome's value. A failed
+    call ends the sequence with its error; cancelling the cancellable ends
+    it silently.
+    """
+
+    def __init__(self, connection, calls, result, cancellable, on_finished):
+        self._connection = connection
+        self._calls = calls
+        self.result = result
+        self.cancellable = cancellable
+        self._on_finished = on_finished
+
+    def start(self):
+        self._step(None)
+
+    def _step(self, reply):
+        if self.cancellable.is_cancelled():
+            self._calls.close()
+            return
+        try:
+            call = self._calls.send(reply) if reply is not None else next(self._calls)
+            while call[0] in ('report', 'result'):
+                if call[0] == 'report':
+                    self.result.errors.extend(call[1])
+                    self.result.warnings.extend(call[2])
+                else:
+                    self.result.value = call[1]
+                call = next(self._calls)
+        except StopIteration:
+            self._on_finished(self)
+            return
+        except (GLib.Error, KeyError, ValueError) as e:
+            self.result.errors.append(str(e))
+            self._on_finished(self)
+            return
+        if call[0] == 'wait':
+            GLib.timeout_add(call[1], self._on_wait)
+            return
+        bus_name, object_path, interface, method, parameters, reply_type = call
+
+        def on_reply(connection, async_result):
+            try:
+                value = connection.call_finish(async_result)
+            except GLib.Error as e:
+                if e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                    return # Superseded
+                self.result.errors.append(f"{method}: {e.message}")
+                self._on_finished(self)
+                return
+            # Replies are always tuples; an empty one still moves the generator on
+            self._step(value if value is not None else GLib.Variant('()', ()))
+
+        self._connection.call(bus_name, object_path, interface, method, parameters, reply_type,
+                              Gio.DBusCallFlags.NONE, CALL_TIMEOUT_MS, self.cancellable, on_reply)
+
+    def _on_wait(self):
+        self._step(GLib.Variant('()', ()))
+        return GLib.SOURCE_REMOVE
+
+
+def set_property_call(target, name, value):
+    bus_name, object_path, interface = target
+    return (bus_name, object_path, PROPERTIES_INTERFACE, 'Set',
+            GLib.Variant('(ssv)', (interface, name, value)), None)
+
+
+def method_call(target, method, parameters=None, reply_type=None):
+    bus_name, object_path, interface = target
+    return (bus_name, object_path, interface, method, parameters, reply_type)
+
+
+def _localization_calls(data):
+    keyboard = data['keyboard']
+    yield set_property_call(LOCALIZATION, 'Language', GLib.Variant('s', data['language']))
+    yield set_property_call(LOCALIZATION, 'XLayouts', GLib.Variant('as', keyboard['x_layouts']))
+    yield set_property_call(LOCALIZATION, 'VirtualConsoleKeymap', GLib.Variant('s', keyboard['vc_keymap']))
+
+
+def _timezone_calls(data):
+    yield set_property_call(TIMEZONE, 'Timezone', GLib.Variant('s', data['timezone']))
+    yield set_property_call(TIMEZONE, 'NTPEnabled', GLib.Variant('b', data['ntp_enabled']))
+
+
+def _users_calls(data):
+    user = data['user']
+    if user['name']:
+        user_data = {
+            'name': GLib.Variant('s', user['name']),
+            'gecos': GLib.Variant('s', user['gecos']),
+            'password': GLib.Variant('s', user['password']),
+            'is-crypted': GLib.Variant('b', user['is_crypted']),
+            'groups': GLib.Variant('as', user['groups']),
+        }
+        if user['uid'] is not None:
+            user_data['uid'] = GLib.Variant('u', user['uid'])
+            user_data['uid-mode'] = GLib.Variant('s', 'ID')
+        yield set_property_call(USERS, 'Users', GLib.Variant('aa{sv}', [user_data]))
+    root = data['root']
+    if root['password']:
+        yield method_call(USERS, 'SetCryptedRootPassword', GLib.Variant('(s)', (root['password'],)))
+    yield method_call(USERS, 'SetRootAccountLocked', GLib.Variant('(b)', (root['account_locked'],)))
+
+
+def _storage_calls(data):
+    # The Storage module names disks by device name, not path
+    disks = [os.path.basename(disk) for disk in data['disks']]
+    if not disks:
+        return
+    result = yield method_call(DISK_SELECTION, 'ValidateSelectedDisks', GLib.Variant('(as)', (disks,)),
+                         GLib.VariantType('(a{sv})'))
+    report = result.unpack()[0]
+    errors = list(report.get('error-messages', []))
+    warnings = list(report.get('warning-messages', []))
+    yield ('report', errors, warnings)
+    if not errors:
+        yield set_property_call(DISK_SELECTION, 'SelectedDisks', GLib.Variant('as', disks))
+
+
+def _payloads_calls(data):
+    if 'packages' not in data:
+        return # Nothing selected: the live system is installed as it is
+    result = yield method_call((PAYLOADS[0], PAYLOADS[1], PROPERTIES_INTERFACE), 'Get',
+                         GLib.Variant('(ss)', (PAYLOADS[2], 'ActivePayload')), GLib.VariantType('(v)'))
+    payload_path = result.unpack()[0]
+    if not payload_path or payload_path == '/':
+        result = yield method_call(PAYLOADS, 'CreatePayload', GLib.Variant('(s)', ('DNF',)), GLib.VariantType('(o)'))
+        payload_path = result.unpack()[0]
+        yield method_call(PAYLOADS, 'ActivatePayload', GLib.Variant('(o)', (payload_path,)))
+    payload = (PAYLOADS[0], payload_path, DNF_PAYLOAD_INTERFACE)
+    yield set_property_call(payload, 'PackagesSelection', GLib.Variant('a{sv}', {
+        'environment': GLib.Variant('s', data.get('environment') or ''),
+        'groups': GLib.Variant('as', data.get('groups', [])),
+        'excluded-groups': GLib.Variant('as', data.get('excluded_groups', [])),
+        'packages': GLib.Variant('as', data['packages']),
+        'excluded-packages': GLib.Variant('as', data.get('excluded_packages', [])),
+    }))
+
+
+# Anaconda module -> generator of the DBus calls applying its structure (see CallSequence)
+MODULE_CALLS = {
+    'Localization': _localization_calls,
+    'Timezone': _timezone_calls,
+    'Users': _users_calls,
+    'Storage': _storage_calls,
+    'Payloads': _payloads_calls,
+}
+
+
+class AnacondaConfigSync:
+    """Applies changed configuration sections to the Anaconda modules in the background.
+
+    push() takes the modules an InstallConfig marks as changed and sends
+    each one's settings with asynchronous DBus calls on the main loop. A
+    newer push for a module cancels the one still in flight. The callback
+    gets a ModuleResult per module once its calls have finished.
+    """
+
+    def __init__(self, result_callback=None):
+        self.result_callback = result_callback
+        self.results = {}
+        self._cancellables = {}
+
+    def push(self, config):
+        """Sends the modules changed in config; returns the names of the modules sent."""
+        connection = get_anaconda_connection()
+        if connection is None:
+            return []
+        try:
+            changed = config.take_changed()
+        except ValueError as e:
+            print(f"Warning: Not sending configuration to Anaconda: {e}")
+            return []
+        for module, data in changed.items():
+            previous = self._cancellables.pop(module, None)
+            if previous is not None:
+                previous.cancel()
+            cancellable = Gio.Cancellable()
+            self._cancellables[module] = cancellable
+            self.results.pop(module, None)
+            CallSequence(connection, MODULE_CALLS[module](data), ModuleResult(module),
+                         cancellable, self._done).start()
+        return list(changed)
+
+    def pending(self):
+        return sorted(self._cancellables)
+
+    def _done(self, sequence):
+        result = sequence.result
+        module = result.module
+        if self._cancellables.get(module) is not sequence.cancellable:
+            return
+        del self._cancellables[module]
+        self.results[module] = result
+        status = "ok" if result.ok else f"{len(result.errors)} error(s): {result.errors[0]}"
+        print(f"Anaconda {module} settings applied: {status}"
+              f"{f', {len(result.warnings)} warning(s)' if result.warnings else ''}")
+        if self.result_callback:
+            self.result_callback(result)
@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+
+from src.repo_metadata import BASE_REPO_PATH, CACHE_DIR, _open_compressed, read_repomd
+
+CACHE_SCHEMA_VERSION = 1
+
+
+class CompsEnvironment:
+    __slots__ = ('id', 'name', 'description', 'display_order')
+
+    def __init__(self, id, name, description, display_order):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.display_order = display_order
+
+
+class CompsGroup:
+    __slots__ = ('id', 'name', 'description', 'display_order', 'uservisible')
+
+    def __init__(self, id, name, description, display_order, uservisible):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.display_order = display_order
+        self.uservisible = uservisible
+
+
+def _text(elem, tag):
+    # Untranslated values only; xml:lang variants are skipped
+    for child in elem.findall(tag):
+        if not child.attrib:
+            return (child.text or '').strip()
+    return ''
+
+
+def _display_order(elem):
+    value = elem.findtext('display_order')
+    return int(value) if value and value.isdigit() else 1024
+
+
+class CompsCatalog:
+    """Environments and groups from the repo's comps.xml.
+
+    comps is indexed once per repomd checksum into SQLite by a streaming
+    parser. Listing environments and groups only reads the small summary
+    tables; package lists are queried when a group is expanded.
+    """
+
+    def __init__(self, repo_path=BASE_REPO_PATH, cache_dir=CACHE_DIR):
+        records = read_repomd(repo_path)
+        record = records.get('group') or records.get('group_gz') or records.get('group_xz')
+        if not record:
+            raise OSError(f"No comps metadata in {repo_path}")
+        self._comps_path, checksum = record
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, f"comps-{CACHE_SCHEMA_VERSION}-{checksum[:16]}.sqlite")
+        if not os.path.exists(self.db_path):
+            self._build()
+        self._db = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _build(self):
+        tmp_path = f"{self.db_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        db = sqlite3.connect(tmp_path)
+        db.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE environments (id TEXT PRIMARY KEY, name TEXT, description TEXT, display_order INTEGER);
+            CREATE TABLE environment_groups (environment TEXT, group_id TEXT, optional INTEGER);
+            CREATE TABLE groups (id TEXT PRIMARY KEY, name TEXT, description TEXT,
+                                 display_order INTEGER, uservisible INTEGER);
+            CREATE TABLE group_packages (group_id TEXT, name TEXT, type TEXT);
+        """)
+        groups = environments = 0
+        with _open_compressed(self._comps_path) as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == 'group':
+                    group_id = elem.findtext('id')
+                    db.execute("INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?, ?)",
+                               (group_id, _text(elem, 'name'), _text(elem, 'description'),
+                                _display_order(elem), elem.findtext('uservisible', 'true').lower() == 'true'))
+                    db.executemany("INSERT INTO group_packages VALUES (?, ?, ?)",
+                                   [(group_id, req.text, req.get('type', 'mandatory'))
+                                    for req in elem.iter('packagereq')])
+                    groups += 1
+                    elem.clear()
+                elif elem.tag == 'environment':
+                    env_id = elem.findtext('id')
+                    db.execute("INSERT OR REPLACE INTO environments VALUES (?, ?, ?, ?)",
+                               (env_id, _text(elem, 'name'), _text(elem, 'description'), _display_order(elem)))
+                    rows = [(env_id, g.text, 0) for g in elem.findall('grouplist/groupid')]
+                    rows += [(env_id, g.text, 1) for g in elem.findall('optionlist/groupid')]
+                    db.executemany("INSERT INTO environment_groups VALUES (?, ?, ?)", rows)
+                    environments += 1
+                    elem.clear()
+                elif elem.tag == 'langpacks':
+                    # Langpack rules are not needed by the installer UI
+                    elem.clear()
+        db.executescript("""
+            CREATE INDEX environment_groups_env ON environment_groups (environment);
+            CREATE INDEX group_packages_group ON group_packages (group_id);
+        """)
+        db.commit()
+        db.close()
+        os.replace(tmp_path, self.db_path)
+        print(f"Indexed {environments} environments and {groups} groups from {self._comps_path}")
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def get_environments(self):
+        rows = self._query("SELECT id, name, description, display_order FROM environments "
+                           "ORDER BY display_order, name")
+        return [CompsEnvironment(*row) for row in rows]
+
+    def get_optional_groups(self, environment_id):
+        """Returns the add-on groups offered for an environment."""
+        rows = self._query("SELECT g.id, g.name, g.description, g.display_order, g.uservisible "
+                           "FROM environment_groups e JOIN groups g ON g.id = e.group_id "
+                           "WHERE e.environment = ? AND e.optional = 1 ORDER BY g.display_order, g.name",
+                           (environment_id,))
+        return [CompsGroup(*row) for row in rows]
+
+    def get_group_packages(self, group_id, types=('mandatory', 'default', 'optional')):
+        """Returns (name, type) of the packages in a group; read on demand."""
+        placeholders = ','.join('?' * len(types))
+        return self._query(f"SELECT name, type FROM group_packages WHERE group_id = ? AND type IN ({placeholders}) "
+                           "ORDER BY type, name", (group_id, *types))
+
+    def expand(self, group_ids):
+        """Returns the mandatory and default packages of groups or environments."""
+        packages = []
+        for group_id in group_ids:
+            members = [row[0] for row in self._query(
+                "SELECT group_id FROM environment_groups WHERE environment = ? AND optional = 0", (group_id,))]
+            for member in members or [group_id]:
+                packages.extend(name for name, _ in self.get_group_packages(member, ('mandatory', 'default')))
+        return packages
+
+    def close(self):
+        self._db.close()
+
+
+# Stored instead of a catalog when loading failed, so it is not retried
+_LOAD_FAILED = object()
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_comps_catalog(repo_path=BASE_REPO_PATH):
+    """Opens the comps catalog once; returns None if the repo has no comps.
+
+    May index comps.xml first, so call it from a worker thread.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            try:
+                _catalog = CompsCatalog(repo_path)
+            except (OSError, ET.ParseError, sqlite3.Error) as e:
+                print(f"Warning: Could not load comps from {repo_path}: {e}")
+                _catalog = _LOAD_FAILED
+        return None if _catalog is _LOAD_FAILED else _catalog
+
+
+def loaded_comps_catalog():
+    """Returns the catalog if a worker has already opened it, else None; never blocks."""
+    return None if _catalog is _LOAD_FAILED else _catalog
+
+
+def load_comps_catalog_async(callback, repo_path=BASE_REPO_PATH):
+    """Opens (and if needed indexes) the catalog on a worker thread."""
+    thread = threading.Thread(target=lambda: callback(get_comps_catalog(repo_path)),
+                              name="comps-catalog", daemon=True)
+    thread.start()
+    return thread
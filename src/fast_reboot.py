@@ -0,0 +1,191 @@
+import glob
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+BLS_ENTRIES_DIR = 'boot/loader/entries'
+GRUBENV_PATHS = ('boot/grub2/grubenv', 'boot/efi/EFI/grubenv')
+KEXEC_LOAD_TIMEOUT = 60
+
+KEXEC_OFF, KEXEC_ON, KEXEC_DRY_RUN = 'off', 'on', 'dry-run'
+
+
+def kexec_mode(kickstart_settings=None):
+    """Returns how to reboot: the CENTRIO_KEXEC environment variable, then the
+    inst.kexec boot option, then kickstart's reboot --kexec."""
+    value = os.environ.get('CENTRIO_KEXEC')
+    if value is None:
+        try:
+            with open('/proc/cmdline', 'r') as f:
+                for option in f.read().split():
+                    if option == 'inst.kexec':
+                        value = KEXEC_ON
+                    elif option.startswith('inst.kexec='):
+                        value = option.split('=', 1)[1]
+        except OSError:
+            pass
+    if value is None:
+        return KEXEC_ON if (kickstart_settings or {}).get('kexec') else KEXEC_OFF
+    if value in ('1', 'yes', 'on', KEXEC_ON):
+        return KEXEC_ON
+    if value in ('dry-run', 'dryrun', 'test'):
+        return KEXEC_DRY_RUN
+    return KEXEC_OFF
+
+
+class BootEntry:
+    """A Boot Loader Specification entry of the installed system."""
+
+    __slots__ = ('path', 'title', 'version', 'linux', 'initrd', 'options')
+
+    def __init__(self, path):
+        self.path = path
+        self.title = self.version = self.linux = None
+        self.initrd = []
+        self.options = ''
+
+    @property
+    def id(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+
+def read_grubenv(target_root):
+    for relative in GRUBENV_PATHS:
+        try:
+            with open(os.path.join(target_root, relative), 'r') as f:
+                return dict(line.rstrip('\n').split('=', 1) for line in f
+                            if '=' in line and not line.startswith('#'))
+        except OSError:
+            continue
+    return {}
+
+
+def read_boot_entries(target_root):
+    entries = []
+    for path in glob.glob(os.path.join(target_root, BLS_ENTRIES_DIR, '*.conf')):
+        entry = BootEntry(path)
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    key, _, value = line.strip().partition(' ')
+                    value = value.strip()
+                    if key in ('title', 'version', 'linux', 'options'):
+                        setattr(entry, key, value)
+                    elif key == 'initrd':
+                        entry.initrd.extend(value.split())
+        except OSError as e:
+            print(f"Warning: Could not read boot entry {path}: {e}")
+            continue
+        if entry.linux:
+            entries.append(entry)
+    return entries
+
+
+def _version_key(entry):
+    # Natural ordering: 6.12.0-55.el10 sorts above 6.9.0-1.el10
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', entry.version or entry.id)]
+
+
+def default_boot_entry(target_root):
+    """Returns the entry the bootloader would start by default, or None."""
+    entries = read_boot_entries(target_root)
+    saved = read_grubenv(target_root).get('saved_entry')
+    for entry in entries:
+        if saved and entry.id == saved:
+            return entry
+    entries = [entry for entry in entries if 'rescue' not in entry.id]
+    return max(entries, key=_version_key, default=None)
+
+
+def _resolve_path(target_root, path):
+    # BLS paths are relative to the partition holding the entries: /boot, or / without a separate /boot
+    for base in (os.path.join(target_root, 'boot'), target_root):
+        candidate = os.path.join(base, path.lstrip('/'))
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _expand(value, grubenv):
+    # grub variables such as $kernelopts and $tuned_initrd; unset ones expand to nothing
+    return ' '.join(re.sub(r'\$\{?(\w+)\}?', lambda m: grubenv.get(m.group(1), ''), value).split())
+
+
+def kernel_command_line(entry, target_root):
+    return _expand(entry.options, read_grubenv(target_root))
+
+
+def _run(argv):
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=KEXEC_LOAD_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+    return result.returncode == 0, (result.stderr or result.stdout).strip()
+
+
+def load_installed_kernel(target_root):
+    """Loads the installed system's default kernel with kexec.
+
+    Returns (loaded, message). Several initrd lines are concatenated into
+    one image, which the kernel unpacks in order.
+    """
+    if shutil.which('kexec') is None:
+        return False, "kexec is not installed"
+    entry = default_boot_entry(target_root)
+    if entry is None:
+        return False, "no boot entry found on the installed system"
+    kernel = _resolve_path(target_root, entry.linux)
+    grubenv = read_grubenv(target_root)
+    initrds = [_resolve_path(target_root, initrd)
+               for initrd in _expand(' '.join(entry.initrd), grubenv).split()]
+    if kernel is None or None in initrds:
+        return False, f"kernel or initramfs of boot entry {entry.id} is missing"
+
+    combined = None
+    try:
+        if len(initrds) > 1:
+            with tempfile.NamedTemporaryFile(prefix='centrio-initrd-', delete=False) as combined:
+                for initrd in initrds:
+                    with open(initrd, 'rb') as f:
+                        shutil.copyfileobj(f, combined)
+            initrds = [combined.name]
+        argv = [kernel, f"--command-line={kernel_command_line(entry, target_root)}"]
+        if initrds:
+            argv.append(f"--initrd={initrds[0]}")
+        # kexec_file_load first: it is the only loader allowed under Secure Boot lockdown
+        ok, message = _run(['kexec', '-s', '-l'] + argv)
+        if not ok:
+            ok, message = _run(['kexec', '-l'] + argv)
+    except OSError as e:
+        return False, str(e)
+    finally:
+        if combined is not None:
+            os.unlink(combined.name)
+    if not ok:
+        return False, f"kexec load of {entry.id} failed: {message}"
+    return True, f"loaded {entry.title or entry.id}"
+
+
+def reboot_into_target(target_root, mode):
+    """Reboots into the installed system, through kexec when mode asks for it.
+
+    In dry-run mode the kexec load is checked, unloaded and reported before
+    a normal reboot. Anything that keeps kexec from working falls back to a
+    normal reboot; that one raises CalledProcessError or OSError on failure.
+    """
+    if mode != KEXEC_OFF:
+        loaded, message = load_installed_kernel(target_root)
+        print(f"kexec{' dry run' if mode == KEXEC_DRY_RUN else ''}: {message}")
+        if loaded and mode == KEXEC_ON:
+            # systemd stops services and unmounts the target before jumping
+            if subprocess.run(['systemctl', 'kexec']).returncode == 0:
+                return
+            print("Warning: systemctl kexec failed, rebooting normally")
+        if loaded:
+            subprocess.run(['kexec', '-u'], capture_output=True)
+        elif mode == KEXEC_ON:
+            print("Warning: Falling back to a normal reboot")
+    subprocess.run(['systemctl', 'reboot'], check=True)
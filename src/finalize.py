@@ -0,0 +1,100 @@
+import glob
+import os
+import subprocess
+from contextlib import contextmanager
+
+from src.post_install import PostInstallStep
+from src.repo_metadata import BASE_REPO_PATH
+
+FINALIZE_LOG_PATH = '/tmp/centrio-finalize.log'
+DRACUT_TIMEOUT = 20 * 60
+RELABEL_TIMEOUT = 30 * 60
+CACHE_TIMEOUT = 10 * 60
+
+# API filesystems bind-mounted into the target for chrooted tools
+CHROOT_BIND_MOUNTS = ('dev', 'dev/pts', 'proc', 'sys', 'run')
+
+
+@contextmanager
+def chroot_mounts(target_root):
+    """Bind-mounts the API filesystems into the target for the duration of the block."""
+    mounted = []
+    try:
+        for name in CHROOT_BIND_MOUNTS:
+            mount_point = os.path.join(target_root, name)
+            if os.path.ismount(mount_point):
+                continue # Anaconda or an earlier stage already set it up
+            os.makedirs(mount_point, exist_ok=True)
+            subprocess.run(['mount', '--bind', f'/{name}', mount_point], check=True)
+            mounted.append(mount_point)
+        yield
+    finally:
+        for mount_point in reversed(mounted):
+            subprocess.run(['umount', mount_point], check=False)
+
+
+def _has_tool(target_root, name):
+    return any(os.access(os.path.join(target_root, directory, name), os.X_OK)
+               for directory in ('usr/bin', 'usr/sbin'))
+
+
+def _selinux_file_contexts(target_root):
+    """Returns the target's file_contexts path (as seen in the chroot), or None."""
+    try:
+        with open(os.path.join(target_root, 'etc/selinux/config'), 'r') as f:
+            settings = dict(line.strip().split('=', 1) for line in f if '=' in line and not line.startswith('#'))
+    except OSError:
+        return None
+    if settings.get('SELINUX', 'disabled') == 'disabled':
+        return None
+    path = f"/etc/selinux/{settings.get('SELINUXTYPE', 'targeted')}/contexts/files/file_contexts"
+    return path if os.path.exists(os.path.join(target_root, path.lstrip('/'))) else None
+
+
+def finalization_steps(target_root):
+    """Returns the finalization steps that apply to the installed system.
+
+    Cache generation and the initramfs are independent and run in
+    parallel within the CPU limit; the SELinux relabel runs last because
+    every other step creates files.
+    """
+    steps = []
+
+    def add(name, command, resource='cpu', timeout=CACHE_TIMEOUT, after_finished=(), chroot=True):
+        steps.append(PostInstallStep(name, command=command, resource=resource, timeout=timeout,
+                                     after_finished=after_finished, chroot=chroot))
+
+    if _has_tool(target_root, 'ldconfig'):
+        add('ldconfig', ['ldconfig'])
+    if _has_tool(target_root, 'dracut'):
+        add('dracut', ['dracut', '--force', '--regenerate-all'], timeout=DRACUT_TIMEOUT)
+    if _has_tool(target_root, 'fc-cache'):
+        add('fc-cache', ['fc-cache', '--system-only'])
+    if _has_tool(target_root, 'gtk-update-icon-cache'):
+        for theme in sorted(glob.glob(os.path.join(target_root, 'usr/share/icons/*/index.theme'))):
+            theme_dir = '/' + os.path.relpath(os.path.dirname(theme), target_root)
+            add(f'icon-cache-{os.path.basename(theme_dir)}',
+                ['gtk-update-icon-cache', '--force', '--quiet', theme_dir], resource='io')
+    if _has_tool(target_root, 'glib-compile-schemas'):
+        add('glib-schemas', ['glib-compile-schemas', '/usr/share/glib-2.0/schemas'])
+    if _has_tool(target_root, 'update-mime-database'):
+        add('mime-database', ['update-mime-database', '/usr/share/mime'])
+    if _has_tool(target_root, 'mandb'):
+        add('mandb', ['mandb', '--quiet'], resource='io')
+    if os.path.isdir(os.path.join(BASE_REPO_PATH, 'repodata')) and _has_tool(target_root, 'dnf'):
+        # Runs from the live system so the media repository is reachable
+        add('dnf-makecache', ['dnf', f'--installroot={target_root}', 'makecache',
+                              f'--repofrompath=centrio-media,{BASE_REPO_PATH}', '--repo=centrio-media'],
+            resource='io', chroot=False)
+
+    file_contexts = _selinux_file_contexts(target_root)
+    if file_contexts and _has_tool(target_root, 'setfiles'):
+        # setfiles labels with one thread per CPU (-T 0); it must see every file written above,
+        # whether or not the step that wrote it succeeded
+        add('selinux-relabel', ['setfiles', '-F', '-T', '0', '-e', '/proc', '-e', '/sys', '-e', '/dev',
+                                '-e', '/run', file_contexts, '/'],
+            resource='exclusive', timeout=RELABEL_TIMEOUT, after_finished=[step.name for step in steps])
+        # Labels are already correct; skip the relabel-on-boot
+        steps.append(PostInstallStep('autorelabel-clear', command=['rm', '-f', '/.autorelabel'],
+                                     resource='io', after=['selinux-relabel']))
+    return steps
@@ -0,0 +1,102 @@
+import os
+import threading
+
+from src.post_install import PostInstallStep
+
+# Flatpak content on the install media:
+#   repo/               OSTree repo with collection IDs (flatpak create-usb output;
+#                       OCI images are imported with flatpak build-import-bundle --oci)
+#   refs.list           refs to preinstall, one per line
+#   flathub.flatpakrepo remote the installed refs are tracked from afterwards
+FLATPAK_MEDIA_PATH = '/run/install/repo/flatpak'
+FLATPAK_REMOTE_NAME = 'flathub'
+PRESEED_TIMEOUT = 60 * 60
+
+
+class FlatpakMedia:
+    """Flatpak refs that can be installed offline from the install media."""
+
+    def __init__(self, path=FLATPAK_MEDIA_PATH):
+        self.path = path
+        self.repo_path = os.path.join(path, 'repo')
+        self.remote_file = os.path.join(path, f'{FLATPAK_REMOTE_NAME}.flatpakrepo')
+        self.refs = []
+        with open(os.path.join(path, 'refs.list'), 'r') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    self.refs.append(line)
+        if not os.path.isdir(self.repo_path) or not os.path.exists(self.remote_file):
+            raise OSError(f"{path} has no repo/ or {FLATPAK_REMOTE_NAME}.flatpakrepo")
+        self.size = None
+
+    @property
+    def apps(self):
+        return [ref for ref in self.refs if ref.startswith('app/')]
+
+    def compute_size(self):
+        """Sums the repo's objects; shared runtimes are stored once, as on the target."""
+        total = 0
+        pending = [os.path.join(self.repo_path, 'objects')]
+        while pending:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        self.size = total
+        return total
+
+    def to_config(self):
+        return {'repo': self.repo_path, 'remote_file': self.remote_file, 'refs': list(self.refs),
+                'size': self.size or 0}
+
+
+def load_flatpak_media(path=FLATPAK_MEDIA_PATH):
+    """Returns the media's FlatpakMedia, or None if it carries no usable Flatpak content."""
+    if not os.path.isdir(path):
+        return None
+    try:
+        return FlatpakMedia(path)
+    except OSError as e:
+        print(f"Warning: Ignoring Flatpak content on the media: {e}")
+        return None
+
+
+def load_flatpak_media_async(callback):
+    """Loads the media and its size on a worker thread; callback(media) runs on the worker."""
+    def worker():
+        media = load_flatpak_media()
+        if media is not None:
+            try:
+                media.compute_size()
+            except OSError as e:
+                print(f"Warning: Could not size Flatpak repo: {e}")
+        callback(media)
+
+    thread = threading.Thread(target=worker, name="flatpak-media", daemon=True)
+    thread.start()
+    return thread
+
+
+def preseed_steps(preseed, target_root):
+    """Returns the post-install steps that install the preseeded refs into the target.
+
+    flatpak runs from the live system against the target's system
+    installation, so the media does not have to be visible in the chroot.
+    All refs go into one transaction: runtimes shared between apps are
+    resolved once and the OSTree store keeps a single copy of each object.
+    """
+    system_dir = f"FLATPAK_SYSTEM_DIR={os.path.join(target_root, 'var/lib/flatpak')}"
+    add_remote = PostInstallStep(
+        'flatpak-remote',
+        command=['env', system_dir, 'flatpak', 'remote-add', '--system', '--if-not-exists',
+                 FLATPAK_REMOTE_NAME, preseed['remote_file']],
+        resource='io', chroot=False)
+    install = PostInstallStep(
+        'flatpak-preseed',
+        command=['env', system_dir, 'flatpak', 'install', '--system', '--noninteractive',
+                 f"--sideload-repo={preseed['repo']}", FLATPAK_REMOTE_NAME] + list(preseed['refs']),
+        after=[add_remote.name], resource='io', timeout=PRESEED_TIMEOUT, chroot=False)
+    return [add_remote, install]
@@ -0,0 +1,219 @@
+import fcntl
+import hashlib
+import json
+import os
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Prebuilt fleet image on the install media: an index plus concatenated zstd frames
+DISK_IMAGE_INDEX_PATH = '/run/install/repo/images/system.img.json'
+IMAGE_FORMAT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+DEFAULT_WORKERS = os.cpu_count() or 2
+ZSTD_LEVEL = 19
+
+BLKZEROOUT = 0x127f  # _IO(0x12, 127)
+BLKGETSIZE64 = 0x80081272
+
+
+class ImageChunk:
+    __slots__ = ('offset', 'length', 'data_offset', 'data_length', 'sha256')
+
+    def __init__(self, offset, length, data_offset=0, data_length=0, sha256=None):
+        self.offset = offset
+        self.length = length
+        self.data_offset = data_offset
+        self.data_length = data_length
+        # None marks an all-zero chunk with no stored data
+        self.sha256 = sha256
+
+    @property
+    def is_zero(self):
+        return self.sha256 is None
+
+
+class ImageIndex:
+    """Describes a chunked, zstd-compressed raw filesystem image."""
+
+    def __init__(self, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != IMAGE_FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported image format version {data.get('version')}")
+        self.path = path
+        self.data_path = os.path.join(os.path.dirname(path), data['data'])
+        self.image_size = data['image_size']
+        self.filesystem = data.get('filesystem')
+        self.chunks = [ImageChunk(*entry) for entry in data['chunks']]
+
+    @property
+    def data_bytes(self):
+        return sum(chunk.length for chunk in self.chunks if not chunk.is_zero)
+
+
+def build_image(raw_path, index_path, filesystem, chunk_size=DEFAULT_CHUNK_SIZE, level=ZSTD_LEVEL):
+    """Compresses a raw filesystem image into the chunked format (media build step)."""
+    if zstandard is None:
+        raise RuntimeError("python zstandard module is required to build images")
+    compressor = zstandard.ZstdCompressor(level=level)
+    data_name = os.path.basename(index_path).rsplit('.json', 1)[0] + '.zst'
+    data_path = os.path.join(os.path.dirname(index_path), data_name)
+    chunks = []
+    image_size = os.path.getsize(raw_path)
+    data_offset = 0
+    with open(raw_path, 'rb') as src, open(data_path, 'wb') as out:
+        offset = 0
+        while offset < image_size:
+            block = src.read(chunk_size)
+            if not block:
+                break
+            if block.count(0) == len(block):
+                chunks.append([offset, len(block)])
+            else:
+                frame = compressor.compress(block)
+                out.write(frame)
+                chunks.append([offset, len(block), data_offset, len(frame), hashlib.sha256(block).hexdigest()])
+                data_offset += len(frame)
+            offset += len(block)
+    with open(index_path, 'w') as f:
+        json.dump({'version': IMAGE_FORMAT_VERSION, 'data': data_name, 'image_size': image_size,
+                   'filesystem': filesystem, 'chunks': chunks}, f)
+    print(f"Built {index_path}: {len(chunks)} chunks, {image_size} bytes -> {data_offset} bytes compressed")
+
+
+class ImageDeployer:
+    """Streams a chunked image onto a partition.
+
+    Chunks are read sequentially, decompressed and checksummed on a thread
+    pool (zstandard and hashlib release the GIL) and written with pwrite()
+    at their offsets. All-zero chunks are never transferred: block devices
+    get BLKZEROOUT for the coalesced ranges, files stay sparse. The
+    filesystem is grown to the partition size afterwards.
+    """
+
+    def __init__(self, index, target, workers=DEFAULT_WORKERS, progress_callback=None, cancel_event=None):
+        self.index = index
+        self.target = target
+        self.workers = workers
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event or threading.Event()
+        self.written_bytes = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _decompressor(self):
+        # ZstdDecompressor objects are not thread-safe; keep one per worker
+        if not hasattr(self._local, 'dctx'):
+            self._local.dctx = zstandard.ZstdDecompressor()
+        return self._local.dctx
+
+    def _write_chunk(self, fd, chunk, frame):
+        if self.cancel_event.is_set():
+            raise InterruptedError("image deployment cancelled")
+        data = self._decompressor().decompress(frame, max_output_size=chunk.length)
+        if len(data) != chunk.length or hashlib.sha256(data).hexdigest() != chunk.sha256:
+            raise ValueError(f"Checksum mismatch in image chunk at offset {chunk.offset}")
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += os.pwrite(fd, view[written:], chunk.offset + written)
+        with self._lock:
+            self.written_bytes += chunk.length
+            done = self.written_bytes
+        if self.progress_callback:
+            self.progress_callback(done, self.index.data_bytes)
+
+    def _zero_ranges(self, fd, is_block_device):
+        if not is_block_device:
+            return # Regular files were truncated and read back zeros
+        start = length = 0
+        for chunk in self.index.chunks:
+            if chunk.is_zero and chunk.offset == start + length:
+                length += chunk.length
+                continue
+            if length:
+                fcntl.ioctl(fd, BLKZEROOUT, struct.pack('QQ', start, length))
+            start, length = (chunk.offset, chunk.length) if chunk.is_zero else (chunk.offset + chunk.length, 0)
+        if length:
+            fcntl.ioctl(fd, BLKZEROOUT, struct.pack('QQ', start, length))
+
+    def run(self):
+        if zstandard is None:
+            raise RuntimeError("python zstandard module is not installed")
+        start = time.monotonic()
+        fd = os.open(self.target, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            is_block_device = stat.S_ISBLK(os.fstat(fd).st_mode)
+            if is_block_device:
+                device_size = struct.unpack('Q', fcntl.ioctl(fd, BLKGETSIZE64, b'\0' * 8))[0]
+                if device_size < self.index.image_size:
+                    raise ValueError(f"{self.target} is smaller than the image "
+                                     f"({device_size} < {self.index.image_size} bytes)")
+            else:
+                os.ftruncate(fd, self.index.image_size)
+
+            # Keep a bounded number of chunks in flight so memory stays flat
+            max_in_flight = self.workers * 2
+            in_flight = []
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-deploy") as pool, \
+                    open(self.index.data_path, 'rb') as data:
+                for chunk in self.index.chunks:
+                    if chunk.is_zero:
+                        continue
+                    if self.cancel_event.is_set():
+                        break
+                    data.seek(chunk.data_offset)
+                    in_flight.append(pool.submit(self._write_chunk, fd, chunk, data.read(chunk.data_length)))
+                    if len(in_flight) >= max_in_flight:
+                        in_flight.pop(0).result()
+                for future in in_flight:
+                    future.result()
+            if self.cancel_event.is_set():
+                raise InterruptedError("image deployment cancelled")
+            self._zero_ranges(fd, is_block_device)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.elapsed = time.monotonic() - start
+        print(f"Deployed {self.written_bytes} bytes to {self.target} in {self.elapsed:.1f}s")
+
+    def grow_filesystem(self):
+        """Grows the deployed filesystem to fill the target partition."""
+        filesystem = self.index.filesystem or ''
+        if filesystem.startswith('ext'):
+            subprocess.run(['e2fsck', '-f', '-p', self.target], check=False)
+            subprocess.run(['resize2fs', self.target], check=True)
+            return
+        if filesystem not in ('xfs', 'btrfs'):
+            print(f"Warning: Don't know how to grow '{filesystem}', leaving it at image size")
+            return
+        # xfs and btrfs can only be grown while mounted
+        mount_point = tempfile.mkdtemp(prefix='centrio-grow-')
+        subprocess.run(['mount', self.target, mount_point], check=True)
+        try:
+            if filesystem == 'xfs':
+                subprocess.run(['xfs_growfs', mount_point], check=True)
+            else:
+                subprocess.run(['btrfs', 'filesystem', 'resize', 'max', mount_point], check=True)
+        finally:
+            subprocess.run(['umount', mount_point], check=False)
+            os.rmdir(mount_point)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print(f"Usage: {sys.argv[0]} RAW_IMAGE INDEX_JSON FILESYSTEM", file=sys.stderr)
+        sys.exit(1)
+    build_image(sys.argv[1], sys.argv[2], sys.argv[3])
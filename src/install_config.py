@@ -0,0 +1,269 @@
+import copy
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional
+
+from src.repo_metadata import BASE_REPO_PATH
+
+
+@dataclass(slots=True)
+class LanguageSection:
+    language: str = 'en_US.UTF-8'
+
+
+@dataclass(slots=True)
+class KeyboardSection:
+    layout: str = 'us'
+
+
+@dataclass(slots=True)
+class DestinationSection:
+    disks: list = field(default_factory=list)
+    size_bytes: int = 0
+    config_mode: str = 'Automatic'
+    # Automatic partitioning computed by the Storage module while the page was shown
+    storage_plan: Optional[dict] = None
+
+
+@dataclass(slots=True)
+class UserSection:
+    full_name: str = ''
+    username: str = ''
+    # First regular user ID the payload does not claim; None lets Anaconda choose
+    uid: Optional[int] = None
+    # crypt(3) hashes once is_crypted is set; plaintext never leaves the user page
+    password: str = field(default='', repr=False)
+    is_admin: bool = True
+    root_enabled: bool = False
+    root_password: Optional[str] = field(default=None, repr=False)
+    is_crypted: bool = False
+
+
+@dataclass(slots=True)
+class TimezoneSection:
+    timezone: str = 'UTC'
+    ntp_enabled: bool = True
+
+
+@dataclass(slots=True)
+class SoftwareSection:
+    source_type: str = 'live_image'
+    environment: Optional[str] = None
+    groups: list = field(default_factory=list)
+    packages: list = field(default_factory=list)
+    post_install_commands: list = field(default_factory=list)
+    kickstart_path: Optional[str] = None
+    kickstart_settings: Optional[dict] = None
+    image_index: Optional[str] = None
+    verify_payload: bool = False
+    flatpak_preseed: Optional[dict] = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds the section from the software page's configuration dict."""
+        names = {f.name for f in fields(cls)}
+        unknown = set(data) - names
+        if unknown:
+            raise ValueError(f"Unknown software settings: {', '.join(sorted(unknown))}")
+        return cls(**copy.deepcopy(data))
+
+    def to_dict(self):
+        """Returns the dict the installation stages work from; a deep copy."""
+        return {f.name: copy.deepcopy(getattr(self, f.name)) for f in fields(self)}
+
+
+# Section attribute -> section type
+SECTION_TYPES = {
+    'language': LanguageSection,
+    'keyboard': KeyboardSection,
+    'destination': DestinationSection,
+    'user': UserSection,
+    'timezone': TimezoneSection,
+    'software': SoftwareSection,
+}
+
+# Anaconda module -> sections its structure is built from. Kickstart
+# settings live in the software section and override the pages, so every
+# module depends on it.
+MODULE_SECTIONS = {
+    'Localization': ('language', 'keyboard', 'software'),
+    'Timezone': ('timezone', 'software'),
+    'Users': ('user', 'software'),
+    'Storage': ('destination', 'software'),
+    'Payloads': ('software',),
+}
+
+
+@dataclass(slots=True)
+class InstallConfig:
+    """Everything the pages collect, one typed section per page.
+
+    Sections are replaced whole through update(); a section that compares
+    unequal to the current one marks the Anaconda modules built from it
+    dirty, and only those modules are serialized again.
+    """
+
+    language: LanguageSection = field(default_factory=LanguageSection)
+    keyboard: KeyboardSection = field(default_factory=KeyboardSection)
+    destination: DestinationSection = field(default_factory=DestinationSection)
+    user: UserSection = field(default_factory=UserSection)
+    timezone: TimezoneSection = field(default_factory=TimezoneSection)
+    software: SoftwareSection = field(default_factory=SoftwareSection)
+    # Sections set by a page, as opposed to still holding defaults
+    completed: set = field(default_factory=set, repr=False, compare=False)
+    _dirty_modules: set = field(default_factory=lambda: set(MODULE_SECTIONS), repr=False, compare=False)
+    _serialized: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def update(self, name, section):
+        """Replaces a section; returns True if that changed anything."""
+        if not isinstance(section, SECTION_TYPES[name]):
+            raise TypeError(f"{name} expects {SECTION_TYPES[name].__name__}, got {type(section).__name__}")
+        self.completed.add(name)
+        if getattr(self, name) == section:
+            return False
+        setattr(self, name, section)
+        self._dirty_modules.update(module for module, sections in MODULE_SECTIONS.items() if name in sections)
+        return True
+
+    def mark_dirty(self, module):
+        """Queues a module to be sent again, e.g. after Anaconda rejected it."""
+        self._dirty_modules.add(module)
+
+    def dirty_modules(self):
+        return sorted(self._dirty_modules)
+
+    def snapshot(self):
+        """Returns an independent copy for a worker thread; dirty state is not shared."""
+        return replace(self, **{name: copy.deepcopy(getattr(self, name)) for name in SECTION_TYPES},
+                       completed=set(self.completed), _dirty_modules=set(), _serialized={})
+
+    def to_anaconda(self, modules=None):
+        """Returns {module: structure} for the given Anaconda modules (default: all).
+
+        Modules whose sections have not changed since they were last
+        serialized are returned from the cache.
+        """
+        result = {}
+        for module in MODULE_SECTIONS if modules is None else modules:
+            if module in self._dirty_modules or module not in self._serialized:
+                self._serialized[module] = _SERIALIZERS[module](self)
+                self._dirty_modules.discard(module)
+            result[module] = copy.deepcopy(self._serialized[module])
+        return result
+
+    def is_ready(self, module):
+        """A module is ready once the pages it is built from have been filled in.
+
+        The software section only overrides other modules, so it is not
+        waited for except by the Payloads module.
+        """
+        sections = MODULE_SECTIONS[module]
+        return all(name in self.completed for name in sections if name != 'software' or len(sections) == 1)
+
+    def take_changed(self):
+        """Returns the structures of the ready modules changed since the last call."""
+        return self.to_anaconda([module for module in self.dirty_modules() if self.is_ready(module)])
+
+    def kickstart_settings(self):
+        return self.software.kickstart_settings or {}
+
+
+def _localization(config):
+    ks = config.kickstart_settings()
+    language = ks.get('language', config.language.language)
+    layout = ks.get('keyboard', config.keyboard.layout)
+    return {
+        'language': language,
+        'keyboard': {'x_layouts': [layout], 'vc_keymap': layout},
+    }
+
+
+def _timezone(config):
+    timezone = config.kickstart_settings().get('timezone') or {}
+    return {
+        'timezone': timezone.get('timezone', config.timezone.timezone),
+        'ntp_enabled': config.timezone.ntp_enabled,
+    }
+
+
+def _users(config):
+    user = config.user
+    ks_root = config.kickstart_settings().get('root') or {}
+    # Passwords are crypted by UserCreationView; never forward plaintext
+    if user.username and not user.is_crypted:
+        raise ValueError("User passwords have not been hashed")
+    root = {
+        'password': user.root_password or '',
+        'is_crypted': True,
+        'account_locked': not user.root_enabled,
+    }
+    if ks_root:
+        if ks_root.get('password') and not ks_root.get('is_crypted'):
+            raise ValueError("The kickstart root password has not been hashed")
+        root = {
+            'password': ks_root.get('password') or '',
+            'is_crypted': True,
+            'account_locked': ks_root.get('locked', False),
+        }
+    return {
+        'user': {
+            'name': user.username,
+            'gecos': user.full_name,
+            'uid': user.uid,
+            'password': user.password,
+            'is_crypted': True,
+            'groups': ['wheel'] if user.is_admin else [],
+        },
+        'root': root,
+    }
+
+
+def _storage(config):
+    disks = (config.kickstart_settings().get('storage') or {}).get('disks') or config.destination.disks
+    return {
+        'disks': list(disks),
+        'default_partitioning': config.destination.config_mode == 'Automatic',
+    }
+
+
+def _split_selection(entries):
+    """Splits kickstart %packages entries into (environment, groups, packages)."""
+    environment, groups, packages = None, [], []
+    for entry in entries:
+        if entry.startswith('@^'):
+            environment = entry[2:]
+        elif entry.startswith('@'):
+            groups.append(entry[1:])
+        else:
+            packages.append(entry)
+    return environment, groups, packages
+
+
+def _payloads(config):
+    software = config.software
+    ks = config.kickstart_settings()
+    payload = {
+        # The live system itself, or the repository on the install media
+        'source_type': 'LIVE_OS_IMAGE' if software.source_type == 'live_image' else 'CDROM',
+        'base_repo': BASE_REPO_PATH,
+    }
+    if 'packages' in ks:
+        environment, groups, packages = _split_selection(ks['packages']['include'])
+        _, excluded_groups, excluded = _split_selection(ks['packages']['exclude'])
+        payload.update(environment=environment, groups=groups, packages=packages,
+                       excluded_groups=excluded_groups, excluded_packages=excluded)
+    if software.environment:
+        payload['environment'] = software.environment
+        payload['groups'] = list(software.groups)
+        payload.setdefault('packages', [])
+    if software.packages:
+        payload['packages'] = list(software.packages)
+    return payload
+
+
+_SERIALIZERS = {
+    'Localization': _localization,
+    'Timezone': _timezone,
+    'Users': _users,
+    'Storage': _storage,
+    'Payloads': _payloads,
+}
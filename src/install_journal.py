@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import time
+
+# Kept on the target so a retry against the same disk can resume
+JOURNAL_DIR = 'var/lib/centrio-installer'
+JOURNAL_NAME = 'install-journal.json'
+JOURNAL_DONE_NAME = 'install-journal.done.json'
+JOURNAL_VERSION = 1
+
+
+def fingerprint(inputs):
+    """Hashes a stage's JSON-serializable inputs."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_identity(path):
+    """Returns [size, mtime_ns] for path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class InstallJournal:
+    """Records completed stages and their input fingerprints on the target.
+
+    A later attempt with the same configuration and target skips stages
+    whose fingerprint still matches, up to the first one that does not.
+    The journal only exists while the target root is mounted. Anaconda
+    mounts it partway through an installation, so this is checked on
+    every use and the journal is read the first time it is mounted.
+    """
+
+    def __init__(self, target_root):
+        self.target_root = target_root
+        self.path = os.path.join(target_root, JOURNAL_DIR, JOURNAL_NAME)
+        self.stages = {}
+        self._loaded = False
+
+    @property
+    def enabled(self):
+        if not os.path.ismount(self.target_root):
+            return False
+        if not self._loaded:
+            self._loaded = True
+            self._load()
+        return True
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable install journal {self.path}: {e}")
+            return
+        if data.get('version') == JOURNAL_VERSION:
+            self.stages = data.get('stages', {})
+            print(f"Found install journal with {len(self.stages)} stage(s) at {self.path}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': JOURNAL_VERSION, 'stages': self.stages}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def is_complete(self, name, digest):
+        if not self.enabled:
+            return False
+        entry = self.stages.get(name)
+        return bool(entry) and entry.get('status') == 'complete' and entry.get('fingerprint') == digest
+
+    def record(self, name, digest, status, elapsed=0.0):
+        if not self.enabled:
+            return
+        self.stages[name] = {'fingerprint': digest, 'status': status,
+                             'elapsed': round(elapsed, 3), 'time': int(time.time())}
+        try:
+            self._save()
+        except OSError as e:
+            print(f"Warning: Could not write install journal: {e}")
+
+    def finish(self):
+        """Retires the journal after a successful installation, so a reinstall starts fresh."""
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        try:
+            os.replace(self.path, os.path.join(os.path.dirname(self.path), JOURNAL_DONE_NAME))
+        except OSError as e:
+            print(f"Warning: Could not retire install journal: {e}")
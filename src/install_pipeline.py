@@ -0,0 +1,426 @@
+import json
+import threading
+import time
+import traceback
+
+from src.install_journal import fingerprint
+
+# Rate samples are taken at most this often and smoothed with this factor
+RATE_SAMPLE_INTERVAL = 1.0
+RATE_SMOOTHING = 0.2
+# The ETA is shown once this many samples have been taken
+MIN_RATE_SAMPLES = 3
+PROGRESS_LOG_INTERVAL = 5.0
+# Work units a stage costs unless it estimates its own
+DEFAULT_STAGE_WORK = 64 * 1024 * 1024
+# Time a cancellation may take, from the request to the end of teardown;
+# stages get the first half to stop
+CANCEL_DEADLINE = 15.0
+
+
+class InstallCancelled(InterruptedError):
+    """Raised inside a stage once the installation has been cancelled."""
+
+
+class StageError(Exception):
+    """A stage failed; the message is shown to the user as is."""
+
+
+class CancellationToken:
+    """Cooperative cancellation shared by the pipeline and everything it starts.
+
+    Long-running helpers take the underlying Event (cancel_event=token.event);
+    work that cannot poll, such as child processes, registers a callback that
+    runs when cancel() is called.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Warning: Cancellation callback failed: {e}")
+
+    def add_callback(self, callback):
+        """Runs callback on cancel(), immediately if already cancelled."""
+        with self._lock:
+            if not self.event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise InstallCancelled("installation cancelled")
+
+    def sleep(self, seconds):
+        """Waits up to seconds; raises InstallCancelled if cancelled meanwhile."""
+        if self.event.wait(seconds):
+            raise InstallCancelled("installation cancelled")
+
+
+class ProgressChannel:
+    """Thread-safe hand-off of progress from the pipeline to the UI.
+
+    Progress is measured in work units (roughly bytes moved). Each stage
+    has an estimated amount of work; the overall fraction is the work done
+    over the work done plus still expected, so stages that turn out not to
+    apply shrink the total instead of making the bar jump backwards. The
+    rate is smoothed with an exponential moving average for the ETA.
+
+    Stages write the latest state and the listener, if any, is called on
+    the writing thread after each change; it is expected to hand a
+    snapshot to the UI without blocking. Only the newest value matters,
+    so nothing is queued.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._stage_name = ""
+        self._done = 0.0
+        self._pending = 0.0
+        self._stage_work = 0.0
+        self._stage_fraction = 0.0
+        self._message = ""
+        self._outcome = None
+        self._outcome_message = ""
+        self._rate = None
+        self._samples = 0
+        self._sample_time = time.monotonic()
+        self._sample_work = 0.0
+        self._last_log = 0.0
+
+    def plan(self, total_work):
+        with self._lock:
+            self._pending = float(total_work)
+
+    def begin_stage(self, name, title, work):
+        with self._lock:
+            self._stage_name = name
+            self._pending = max(self._pending - work, 0.0)
+            self._stage_work = float(work)
+            self._stage_fraction = 0.0
+            self._message = title
+        print(f"Installation stage: {title}")
+        self._log(force=True)
+        self._notify()
+
+    def resume_stage(self, name, title, work):
+        """Counts a stage an earlier attempt completed as done without timing it."""
+        self.begin_stage(name, title, work)
+        with self._lock:
+            self._done += self._stage_work
+            self._stage_work = 0.0
+            # Its work took no time now, so it must not inflate the measured rate
+            self._sample_time = time.monotonic()
+            self._sample_work = self._work_done()
+
+    def skip_stage(self, work):
+        with self._lock:
+            self._pending = max(self._pending - work, 0.0)
+
+    def end_stage(self, counted=True):
+        """Closes the current stage; uncounted stages did no work and leave the total."""
+        with self._lock:
+            if counted:
+                self._done += self._stage_work
+            self._stage_work = 0.0
+            self._stage_fraction = 0.0
+
+    def report(self, fraction=None, message=None):
+        """Reports progress within the current stage; fraction is 0..1 of the stage."""
+        with self._lock:
+            if fraction is not None:
+                self._stage_fraction = min(max(fraction, self._stage_fraction), 1.0)
+            if message is not None:
+                self._message = message
+            self._sample()
+        self._log()
+        self._notify()
+
+    def _work_done(self):
+        return self._done + self._stage_work * self._stage_fraction
+
+    def _overall(self):
+        total = self._done + self._stage_work + self._pending
+        return self._work_done() / total if total else 0.0
+
+    def _sample(self):
+        now = time.monotonic()
+        elapsed = now - self._sample_time
+        if elapsed < RATE_SAMPLE_INTERVAL:
+            return
+        work = self._work_done()
+        rate = (work - self._sample_work) / elapsed
+        self._rate = rate if self._rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self._rate
+        self._samples += 1
+        self._sample_time = now
+        self._sample_work = work
+
+    def _eta(self):
+        if self._samples < MIN_RATE_SAMPLES or not self._rate or self._rate <= 0:
+            return None
+        remaining = self._stage_work * (1 - self._stage_fraction) + self._pending
+        return remaining / self._rate
+
+    def _log(self, force=False):
+        """Emits a machine-readable progress line for unattended installs."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_log < PROGRESS_LOG_INTERVAL:
+                return
+            self._last_log = now
+            record = {
+                'stage': self._stage_name,
+                'stage_fraction': round(self._stage_fraction, 4),
+                'fraction': round(self._overall(), 4),
+                'rate': round(self._rate or 0.0),
+                'eta': None if self._eta() is None else round(self._eta()),
+                'message': self._message,
+            }
+        print(f"PROGRESS {json.dumps(record)}", flush=True)
+
+    def finish(self, outcome, message=""):
+        """Records the final outcome: 'complete', 'failed' or 'cancelled'."""
+        with self._lock:
+            self._outcome = outcome
+            self._outcome_message = message
+        print(f"PROGRESS {json.dumps({'outcome': outcome, 'message': message})}", flush=True)
+        self._notify()
+
+    def _notify(self):
+        if self.listener is not None:
+            self.listener(self)
+
+    def snapshot(self):
+        """Returns (fraction, message, eta_seconds or None, outcome, outcome_message)."""
+        with self._lock:
+            fraction = 1.0 if self._outcome == 'complete' else self._overall()
+            return fraction, self._message, self._eta(), self._outcome, self._outcome_message
+
+
+def format_eta(seconds):
+    """Formats a remaining time for the status line."""
+    if seconds < 60:
+        return "less than a minute left"
+    minutes = int(round(seconds / 60))
+    if minutes < 120:
+        return f"about {minutes} minute{'s' if minutes != 1 else ''} left"
+    return f"about {minutes // 60} h {minutes % 60:02d} min left"
+
+
+class StageContext:
+    """State shared by the stages of one installation run."""
+
+    __slots__ = ('config', 'token', 'channel', 'target_root', 'anaconda', 'state')
+
+    def __init__(self, config, token, channel, target_root, anaconda=None):
+        self.config = config
+        self.token = token
+        self.channel = channel
+        self.target_root = target_root
+        self.anaconda = anaconda
+        # Results earlier stages leave for later ones
+        self.state = {}
+
+
+class Stage:
+    """One step of the installation, run on the pipeline's worker thread.
+
+    run() may return False when the stage turns out not to apply, so its
+    estimated work is dropped from the total instead of counted as done.
+    """
+
+    name = 'stage'
+    title = "Installing"
+
+    def estimate_work(self, context):
+        """Expected work in units of roughly one byte moved."""
+        return DEFAULT_STAGE_WORK
+
+    def should_run(self, context):
+        return True
+
+    def fingerprint_inputs(self, context):
+        """Inputs that decide this stage's result, or None if it always runs.
+
+        Stages with inputs are checkpointed in the install journal.
+        """
+        return None
+
+    def resume(self, context):
+        """Called instead of run() when the journal shows the stage done.
+
+        Restores the state later stages expect run() to leave behind.
+        """
+
+    def run(self, context):
+        raise NotImplementedError
+
+
+class InstallPipeline:
+    """Runs stages in order on a worker thread and reports through a ProgressChannel.
+
+    teardown(deadline) is called once after a cancellation, with a
+    time.monotonic() deadline, and returns an object with a summary().
+    An InstallReport, if given, gets every stage's timing and is written
+    out when the run ends, whatever the outcome.
+    """
+
+    def __init__(self, stages, context, journal=None, teardown=None, report=None):
+        self.stages = stages
+        self.context = context
+        self.journal = journal
+        self.teardown = teardown
+        self.report = report
+        self._thread = None
+        self._lock = threading.Lock()
+        self._finished = False
+        self._torn_down = False
+        self._cancel_requested = None
+        self._cancel_deadline = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="install-pipeline", daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def cancel(self, deadline=CANCEL_DEADLINE):
+        """Cancels the run; teardown is finished within deadline seconds even if a stage hangs."""
+        with self._lock:
+            if self._cancel_deadline is None:
+                self._cancel_requested = time.monotonic()
+                self._cancel_deadline = self._cancel_requested + deadline
+        self.context.token.cancel()
+        threading.Thread(target=self._watchdog, args=(deadline / 2,), name="install-cancel", daemon=True).start()
+
+    def _watchdog(self, grace):
+        self._thread.join(grace)
+        if self._thread.is_alive():
+            stage = self.context.channel.snapshot()[1]
+            print(f"Warning: '{stage}' did not stop within {grace:.0f}s of cancellation")
+            # Torn down regardless, so the disks are released within the deadline
+            self._finish('cancelled', self._cancelled_message(
+                f"'{stage}' did not stop in time and may still have been writing to the disk during cleanup"))
+
+    def _cancelled_message(self, note=None):
+        message = "The installation was cancelled."
+        summary = self._run_teardown()
+        details = [part for part in (note, summary) if part]
+        return f"{message} ({'; '.join(details)})" if details else message
+
+    def _run_teardown(self):
+        with self._lock:
+            if self._torn_down or self.teardown is None:
+                return None
+            self._torn_down = True
+            deadline = self._cancel_deadline or time.monotonic() + CANCEL_DEADLINE
+        try:
+            report = self.teardown(deadline)
+        except Exception as e:
+            traceback.print_exc()
+            return f"cleanup failed: {e}"
+        if self._cancel_requested is not None:
+            print(f"Cancellation took {time.monotonic() - self._cancel_requested:.1f}s including teardown")
+        return report.summary()
+
+    def _finish(self, outcome, message):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        if self.report is not None:
+            try:
+                self.report.build(self.context, outcome, message)
+                self.report.write(self.context.target_root)
+            except Exception:
+                traceback.print_exc()
+        self.context.channel.finish(outcome, message)
+
+    def _run(self):
+        context = self.context
+        journal = self.journal
+        report = self.report
+        stage = None
+        digest = None
+        stage_started = None
+        # Journaled stages are skipped until the first one that has to run again
+        resuming = journal is not None
+        try:
+            estimates = [max(stage.estimate_work(context), 1) for stage in self.stages]
+            context.channel.plan(sum(estimates))
+            for stage, work in zip(self.stages, estimates):
+                context.token.raise_if_cancelled()
+                digest = None
+                stage_started = None
+                if not stage.should_run(context):
+                    context.channel.skip_stage(work)
+                    if report is not None:
+                        report.stage_finished(stage.name, stage.title, 'skipped')
+                    continue
+                inputs = stage.fingerprint_inputs(context)
+                if inputs is not None and journal is not None:
+                    digest = fingerprint(inputs)
+                    if resuming and journal.is_complete(stage.name, digest):
+                        print(f"Stage {stage.name} already completed by an earlier attempt, skipping")
+                        stage.resume(context)
+                        context.channel.resume_stage(stage.name, f"{stage.title} (already done)", work)
+                        if report is not None:
+                            report.stage_finished(stage.name, stage.title, 'resumed')
+                        continue
+                    resuming = False
+                context.channel.begin_stage(stage.name, stage.title, work)
+                stage_started = time.monotonic()
+                applied = stage.run(context) is not False
+                context.channel.end_stage(counted=applied)
+                elapsed = time.monotonic() - stage_started
+                if digest is not None:
+                    journal.record(stage.name, digest, 'complete' if applied else 'not-applicable', elapsed)
+                if report is not None:
+                    report.stage_finished(stage.name, stage.title, 'ok' if applied else 'not-applicable', elapsed)
+                stage_started = None
+                print(f"Stage {stage.name} finished in {elapsed:.1f}s")
+            context.token.raise_if_cancelled()
+        except InterruptedError:
+            # InstallCancelled, or a copy engine noticing the shared cancel event
+            self._record_failure(stage, digest, 'cancelled', stage_started)
+            self._finish('cancelled', self._cancelled_message())
+        except StageError as e:
+            self._record_failure(stage, digest, 'failed', stage_started)
+            self._finish('failed', str(e))
+        except Exception as e:
+            traceback.print_exc()
+            self._record_failure(stage, digest, 'failed', stage_started)
+            self._finish('failed', f"{stage.title if stage else 'Installation'} failed: {e}")
+        else:
+            if journal is not None:
+                journal.finish()
+            self._finish('complete', "Installation completed successfully")
+
+    def _record_failure(self, stage, digest, status, stage_started=None):
+        if self.journal is not None and stage is not None and digest is not None:
+            self.journal.record(stage.name, digest, status)
+        if self.report is not None and stage is not None and stage_started is not None:
+            self.report.stage_finished(stage.name, stage.title, status, time.monotonic() - stage_started)
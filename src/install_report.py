@@ -0,0 +1,193 @@
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+
+# Written to the target next to the journal's directory, and to the live log directory
+REPORT_TARGET_DIR = 'var/log/centrio-installer'
+REPORT_LIVE_DIR = '/tmp'
+REPORT_NAME = 'install-report.json'
+REPORT_VERSION = 1
+
+
+def record_phase(context, phase, **facts):
+    """Adds facts about one phase (seconds, bytes, per-step timings) to the run's report."""
+    context.state.setdefault('phases', {}).setdefault(phase, {}).update(facts)
+
+
+def _read(path, default=None):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def _mount_source(mount_point):
+    with open('/proc/self/mounts', 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2 and fields[1] == mount_point:
+                return fields[0]
+    return None
+
+
+def describe_disk(device):
+    """Returns model, size and transport facts for the disk behind a device node.
+
+    Partitions resolve to their disk; device-mapper devices (LVM, LUKS)
+    to the disk under their first underlying device.
+    """
+    if not device or not device.startswith('/dev/'):
+        return {'device': device}
+    name = os.path.basename(os.path.realpath(device))
+    for _ in range(4):
+        sys_path = os.path.realpath(f"/sys/class/block/{name}")
+        if os.path.exists(os.path.join(sys_path, 'partition')):
+            name = os.path.basename(os.path.dirname(sys_path))
+            continue
+        slaves = sorted(os.listdir(os.path.join(sys_path, 'slaves'))) if os.path.isdir(
+            os.path.join(sys_path, 'slaves')) else []
+        if slaves:
+            name = slaves[0]
+            continue
+        break
+    block = f"/sys/block/{name}"
+    size = _read(f"{block}/size")
+    rotational = _read(f"{block}/queue/rotational")
+    return {
+        'device': device,
+        'disk': name,
+        'model': _read(f"{block}/device/model"),
+        'size_bytes': int(size) * 512 if size and size.isdigit() else None,
+        'rotational': rotational == '1' if rotational is not None else None,
+        'transport': 'nvme' if name.startswith('nvme') else (
+            'virtio' if name.startswith('vd') else _read(f"{block}/device/transport")),
+    }
+
+
+def collect_environment(context):
+    """Facts that explain timing differences between machines and media."""
+    cpu_model = None
+    for line in (_read('/proc/cpuinfo', '') or '').splitlines():
+        if line.startswith('model name'):
+            cpu_model = line.split(':', 1)[1].strip()
+            break
+    memory = None
+    for line in (_read('/proc/meminfo', '') or '').splitlines():
+        if line.startswith('MemTotal:'):
+            memory = int(line.split()[1]) * 1024
+            break
+    try:
+        virtualization = subprocess.run(['systemd-detect-virt'], capture_output=True, text=True,
+                                        timeout=5).stdout.strip() or 'none'
+    except (OSError, subprocess.TimeoutExpired):
+        virtualization = None
+    software = context.config.get('software', {})
+    try:
+        target_device = _mount_source(context.target_root)
+        source_device = _mount_source('/run/install/repo') or _mount_source('/run/rootfsbase')
+    except OSError:
+        target_device = source_device = None
+    return {
+        'kernel': platform.release(),
+        'arch': platform.machine(),
+        'cpu_model': cpu_model,
+        'cpu_count': os.cpu_count(),
+        'memory_bytes': memory,
+        'firmware': 'uefi' if os.path.isdir('/sys/firmware/efi') else 'bios',
+        'virtualization': virtualization,
+        'vendor': _read('/sys/class/dmi/id/sys_vendor'),
+        'product': _read('/sys/class/dmi/id/product_name'),
+        'source_type': software.get('source_type'),
+        'source': describe_disk(source_device),
+        'target': describe_disk(target_device),
+        'anaconda': bool(context.state.get('anaconda')),
+    }
+
+
+class InstallReport:
+    """Per-stage timings of one installation run, written out as JSON when it ends."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._started_monotonic = time.monotonic()
+        self._lock = threading.Lock()
+        self.stages = []
+        self.data = None
+
+    def stage_finished(self, name, title, status, seconds=0.0):
+        """status is 'ok', 'not-applicable', 'skipped', 'resumed', 'failed' or 'cancelled'."""
+        with self._lock:
+            self.stages.append({'name': name, 'title': title, 'status': status, 'seconds': round(seconds, 3)})
+
+    def build(self, context, outcome, message):
+        with self._lock:
+            stages = list(self.stages)
+        phases = {name: dict(facts) for name, facts in context.state.get('phases', {}).items()}
+        for facts in phases.values():
+            if facts.get('bytes') and facts.get('seconds'):
+                facts['bytes_per_second'] = round(facts['bytes'] / facts['seconds'])
+        try:
+            environment = collect_environment(context)
+        except Exception as e:
+            environment = {'error': str(e)}
+        self.data = {
+            'version': REPORT_VERSION,
+            'outcome': outcome,
+            'message': message,
+            'started': int(self.started),
+            'total_seconds': round(time.monotonic() - self._started_monotonic, 3),
+            'stages': stages,
+            'phases': phases,
+            'environment': environment,
+        }
+        return self.data
+
+    def write(self, target_root):
+        """Writes the report to the live log directory and, while it is mounted, the target."""
+        paths = [os.path.join(REPORT_LIVE_DIR, f"centrio-{REPORT_NAME}")]
+        if os.path.ismount(target_root):
+            paths.append(os.path.join(target_root, REPORT_TARGET_DIR, REPORT_NAME))
+        written = []
+        for path in paths:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    json.dump(self.data, f, indent=2)
+                written.append(path)
+            except OSError as e:
+                print(f"Warning: Could not write install report {path}: {e}")
+        if written:
+            print(f"Install report written to {', '.join(written)}")
+        return written
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} s"
+    if seconds < 3600:
+        return f"{seconds // 60} min {seconds % 60:02d} s"
+    return f"{seconds // 3600} h {seconds % 3600 // 60:02d} min"
+
+
+def report_breakdown(data):
+    """Returns [(title, detail)] rows for the stages that did work, for display."""
+    rows = []
+    phases = data.get('phases', {})
+    for stage in data.get('stages', []):
+        if stage['status'] not in ('ok', 'failed', 'cancelled'):
+            continue
+        detail = format_duration(stage['seconds'])
+        rate = phases.get(stage['name'], {}).get('bytes_per_second')
+        if rate:
+            detail += f", {rate / (1024 * 1024):.0f} MiB/s"
+        rows.append((stage['title'].rstrip('.'), detail))
+    if 'bootloader' in phases:
+        # Part of the Anaconda stage above, timed from its progress messages
+        rows.append(("Boot loader", format_duration(phases['bootloader']['seconds'])))
+    rows.append(("Total", format_duration(data.get('total_seconds', 0))))
+    return rows
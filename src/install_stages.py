@@ -0,0 +1,424 @@
+import os
+import re
+import subprocess
+import time
+
+from gi.repository import GLib
+
+from src.install_pipeline import Stage, StageError
+from src.kickstart_parser import parse_kickstart
+from src.password_hashing import get_password_hasher
+from src.live_copy import LiveImageCopier, LIVE_ROOT_PATH
+from src.image_deploy import ImageDeployer, ImageIndex
+from src.payload_verify import PayloadVerifier, read_checksums, PAYLOAD_CHECKSUMS_PATH
+from src.payload_manifest import load_payload_manifest, PAYLOAD_MANIFEST_PATH
+from src.install_journal import file_identity
+from src.repo_metadata import estimate_live_image_size
+from src.post_install import PostInstallExecutor, LogRing, steps_from_config, POST_INSTALL_LOG_PATH
+from src.finalize import finalization_steps, chroot_mounts, FINALIZE_LOG_PATH
+from src.install_report import record_phase
+from src.install_teardown import target_mounts
+
+# Number of mismatched paths listed when verification fails
+MAX_REPORTED_MISMATCHES = 10
+# How often the Anaconda payload module is asked for progress
+ANACONDA_POLL_INTERVAL = 0.5
+# Anaconda's progress messages while it installs and configures the boot loader
+BOOTLOADER_MESSAGE = re.compile(r'boot ?loader', re.IGNORECASE)
+# Work estimates, in bytes-moved equivalents, for stages without a byte count
+PREPARE_WORK = 16 * 1024 * 1024
+POST_INSTALL_STEP_WORK = 256 * 1024 * 1024
+FINALIZE_WORK = 1024 * 1024 * 1024
+
+
+def get_mount_source(mount_point):
+    """Returns the device mounted at mount_point, from /proc/self/mounts."""
+    with open('/proc/self/mounts', 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2 and fields[1] == mount_point:
+                return fields[0]
+    return None
+
+
+def payload_bytes(context):
+    """Returns the expected payload size, computed once per installation."""
+    if 'payload_bytes' not in context.state:
+        size = 0
+        software = context.config['software']
+        try:
+            manifest = load_payload_manifest()
+            if software.get('source_type') == 'disk_image':
+                size = ImageIndex(software['image_index']).data_bytes
+            elif manifest is not None:
+                # Bytes plus a per-file cost, so many small files are not underweighted
+                size = manifest.weight
+            else:
+                size = estimate_live_image_size().installed_size
+            if manifest is not None:
+                manifest.close()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Could not estimate the payload size: {e}")
+        context.state['payload_bytes'] = size
+    return context.state['payload_bytes']
+
+
+def anaconda_takes_over(context):
+    """True if Anaconda's services will install the payload; checked once per installation.
+
+    Decided before the work is planned, so the payload is only estimated
+    for the path that actually copies it.
+    """
+    if 'anaconda_available' not in context.state:
+        anaconda = context.anaconda
+        available = anaconda is not None and anaconda.connect_services() and anaconda.storage_available()
+        if anaconda is not None and not available:
+            print("Anaconda storage service not available, falling back to direct installation method")
+        context.state['anaconda_available'] = available
+    return context.state['anaconda_available']
+
+
+class PrepareStage(Stage):
+    """Validates the kickstart file and merges its storage settings."""
+
+    name = 'prepare'
+    title = "Preparing installation..."
+
+    def estimate_work(self, context):
+        return PREPARE_WORK
+
+    def run(self, context):
+        software = context.config['software']
+        ks_path = software.get('kickstart_path')
+        if not ks_path or not os.path.exists(ks_path):
+            return
+        software['source_type'] = 'kickstart'
+        print(f"Using kickstart file: {ks_path}")
+        # Parsed when the file was chosen, so this is normally a cache hit
+        try:
+            ks_document = parse_kickstart(ks_path)
+        except OSError as e:
+            raise StageError(f"Failed to read kickstart file: {e}")
+        if not ks_document.is_valid:
+            raise StageError(f"Invalid kickstart file: {ks_document.errors[0]}")
+        ks_settings = ks_document.to_settings(get_password_hasher())
+        software['kickstart_settings'] = ks_settings
+        if ks_settings.get('storage'):
+            context.config['storage'].update(ks_settings['storage'])
+
+
+class AnacondaStage(Stage):
+    """Hands the installation to Anaconda's DBus services when they are running."""
+
+    name = 'anaconda'
+    title = "Starting installation process..."
+
+    def estimate_work(self, context):
+        return payload_bytes(context) if anaconda_takes_over(context) else 0
+
+    def should_run(self, context):
+        return anaconda_takes_over(context)
+
+    def fingerprint_inputs(self, context):
+        # Anaconda partitions and installs in one task queue, so both are
+        # journaled together on the target it mounts
+        return {
+            'disks': context.config['storage'].get('disks'),
+            'software': context.config['software'],
+        }
+
+    def resume(self, context):
+        context.state['anaconda'] = True
+
+    def run(self, context):
+        anaconda = context.anaconda
+        # Only a missing service falls back, see anaconda_takes_over(); once storage is touched, failures are final
+        storage_started = time.monotonic()
+        storage = context.config['storage']
+        plan = storage.get('plan')
+        # A kickstart naming other disks invalidates the plan
+        precomputed = bool(plan) and plan['disks'] == storage.get('disks')
+        try:
+            if precomputed:
+                # Planned and validated while the destination page was shown
+                print(f"Applying the precomputed storage plan {plan['partitioning']}")
+                anaconda.apply_partitioning(plan['partitioning'])
+            else:
+                anaconda.configure_default_storage(storage.get('disks') or [])
+        except GLib.Error as e:
+            raise StageError(f"Anaconda could not set up storage: {e.message}")
+        except RuntimeError as e:
+            raise StageError(f"Anaconda could not set up storage: {e}")
+        context.token.add_callback(anaconda.cancel_tasks)
+        record_phase(context, 'storage', seconds=round(time.monotonic() - storage_started, 3),
+                     precomputed=precomputed)
+
+        context.channel.report(message="Starting installation...")
+        success, message = anaconda.start_installation()
+        if not success:
+            raise StageError(message)
+
+        context.state['anaconda'] = True
+        # Time spent while Anaconda reports boot loader work, polled
+        bootloader_seconds = 0.0
+        last_poll = time.monotonic()
+        while True:
+            context.token.sleep(ANACONDA_POLL_INTERVAL)
+            progress, message = anaconda.get_installation_progress()
+            if message.startswith("Error"):
+                raise StageError(message)
+            now = time.monotonic()
+            if BOOTLOADER_MESSAGE.search(message):
+                bootloader_seconds += now - last_poll
+            last_poll = now
+            context.channel.report(progress, message)
+            if progress >= 1.0:
+                if bootloader_seconds:
+                    record_phase(context, 'bootloader', seconds=round(bootloader_seconds, 3))
+                return
+
+
+class PayloadStage(Stage):
+    """Writes the live image or the prebuilt system image to the mounted target."""
+
+    name = 'payload'
+    title = "Installing the system..."
+
+    def estimate_work(self, context):
+        return 0 if anaconda_takes_over(context) else payload_bytes(context)
+
+    def should_run(self, context):
+        return not context.state.get('anaconda')
+
+    def fingerprint_inputs(self, context):
+        software = context.config['software']
+        return {
+            'source_type': software['source_type'],
+            'image_index': software.get('image_index'),
+            'image': file_identity(software['image_index']) if software.get('image_index') else None,
+            'manifest': file_identity(PAYLOAD_MANIFEST_PATH),
+            'device': get_mount_source(context.target_root),
+        }
+
+    def run(self, context):
+        source_type = context.config['software']['source_type']
+        if not os.path.ismount(context.target_root):
+            raise StageError(f"No installation target is mounted at {context.target_root} "
+                             "and the Anaconda installer service is unavailable")
+        if source_type == 'live_image':
+            self._copy_live_image(context)
+        elif source_type == 'disk_image':
+            self._deploy_disk_image(context, context.config['software']['image_index'])
+        else:
+            raise StageError(f"Installing from a {source_type.replace('_', ' ')} "
+                             "requires the Anaconda installer service")
+
+    def _copy_live_image(self, context):
+        context.channel.report(0.0, "Copying the live system to disk...")
+
+        def on_progress(copied, total):
+            context.channel.report(copied / total if total else 0.0)
+
+        try:
+            stats = LiveImageCopier(LIVE_ROOT_PATH, context.target_root, progress_callback=on_progress,
+                                    cancel_event=context.token.event).run()
+        except OSError as e:
+            raise StageError(f"Failed to copy the live image: {e}")
+        record_phase(context, self.name, method='live-copy', bytes=stats.copied_bytes, files=stats.files,
+                     hardlinks=stats.hardlinks, reflinked=stats.reflinked, seconds=round(stats.elapsed, 3))
+        if stats.errors:
+            # Fails the stage so the journal does not mark an incomplete copy as done
+            raise StageError(f"Failed to copy {len(stats.errors)} file(s) of the live image, "
+                             f"first: {stats.errors[0]}")
+
+    def _deploy_disk_image(self, context, index_path):
+        context.channel.report(0.0, "Writing the system image to disk...")
+
+        def on_progress(written, total):
+            context.channel.report(written / total if total else 0.0)
+
+        device = get_mount_source(context.target_root)
+        # /boot, /boot/efi etc. go away with the root and are mounted again afterwards
+        mounts = list(reversed(target_mounts(context.target_root)))
+        try:
+            index = ImageIndex(index_path)
+            # The partition must not be mounted while it is overwritten
+            subprocess.run(['umount', '-R', context.target_root], check=True)
+            deployer = ImageDeployer(index, device, progress_callback=on_progress,
+                                     cancel_event=context.token.event)
+            deployer.run()
+            context.channel.report(message="Growing the filesystem...")
+            grow_started = time.monotonic()
+            deployer.grow_filesystem()
+            record_phase(context, self.name, method='disk-image', bytes=deployer.written_bytes,
+                         seconds=round(deployer.elapsed, 3),
+                         grow_seconds=round(time.monotonic() - grow_started, 3))
+            for source, mount_point in mounts:
+                os.makedirs(mount_point, exist_ok=True)
+                # Pseudo filesystems are named after their type
+                type_args = [] if source.startswith('/') else ['-t', source]
+                subprocess.run(['mount', *type_args, source, mount_point], check=True)
+        except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError) as e:
+            raise StageError(f"Failed to deploy the system image: {e}")
+
+
+class VerifyStage(Stage):
+    """Hashes the installed files against the media's manifest or checksums."""
+
+    name = 'verify'
+    title = "Verifying installed files..."
+
+    def estimate_work(self, context):
+        if not context.config['software'].get('verify_payload') or anaconda_takes_over(context):
+            return 0
+        return payload_bytes(context)
+
+    def should_run(self, context):
+        return context.config['software'].get('verify_payload') and not context.state.get('anaconda')
+
+    def fingerprint_inputs(self, context):
+        return {
+            'manifest': file_identity(PAYLOAD_MANIFEST_PATH),
+            'checksums': file_identity(PAYLOAD_CHECKSUMS_PATH),
+            'device': get_mount_source(context.target_root),
+        }
+
+    def run(self, context):
+        # Prefer the payload manifest; plain checksum lists are the fallback
+        manifest = load_payload_manifest()
+        if manifest is not None:
+            entries = manifest.checksum_entries()
+            manifest.close()
+        else:
+            try:
+                entries = read_checksums(PAYLOAD_CHECKSUMS_PATH)
+            except OSError as e:
+                raise StageError(f"Could not read payload checksums: {e}")
+
+        def on_progress(done, total):
+            context.channel.report(done / total if total else 0.0)
+
+        try:
+            result = PayloadVerifier(entries, context.target_root, progress_callback=on_progress,
+                                     cancel_event=context.token.event).run()
+        except ValueError as e:
+            raise StageError(f"Invalid payload checksums: {e}")
+        record_phase(context, self.name, files=result.files, bytes=result.bytes, seconds=round(result.elapsed, 3))
+        if result.ok:
+            return
+        lines = [f"{path}: {problem}" for path, problem in result.mismatches[:MAX_REPORTED_MISMATCHES]]
+        if len(result.mismatches) > MAX_REPORTED_MISMATCHES:
+            lines.append(f"... and {len(result.mismatches) - MAX_REPORTED_MISMATCHES} more")
+        raise StageError(f"{len(result.mismatches)} installed file(s) are corrupt:\n" + "\n".join(lines))
+
+
+class PostInstallStage(Stage):
+    """Runs the post-install steps in the target."""
+
+    name = 'post-install'
+    title = "Configuring additional software..."
+
+    def estimate_work(self, context):
+        software = context.config['software']
+        steps = len(software.get('post_install_commands', []))
+        steps += len((software.get('kickstart_settings') or {}).get('post_scripts', []))
+        preseed = software.get('flatpak_preseed') or {}
+        return steps * POST_INSTALL_STEP_WORK + preseed.get('size', 0)
+
+    def should_run(self, context):
+        return bool(context.config['software'].get('post_install_commands')
+                    or context.config['software'].get('flatpak_preseed')
+                    or (context.config['software'].get('kickstart_settings') or {}).get('post_scripts'))
+
+    def fingerprint_inputs(self, context):
+        software = context.config['software']
+        return {
+            'commands': software.get('post_install_commands', []),
+            'scripts': (software.get('kickstart_settings') or {}).get('post_scripts', []),
+            'flatpak_refs': (software.get('flatpak_preseed') or {}).get('refs', []),
+            'device': get_mount_source(context.target_root),
+        }
+
+    def run(self, context):
+        try:
+            steps = steps_from_config(context.config['software'], context.target_root)
+        except ValueError as e:
+            raise StageError(f"Invalid post-install configuration: {e}")
+        log = LogRing()
+        executor = PostInstallExecutor(steps, context.target_root, log, cancel_event=context.token.event)
+        context.token.add_callback(executor.cancel)
+        try:
+            # Scripts and preseed commands expect /proc, /sys and /dev like the finalize steps
+            with chroot_mounts(context.target_root):
+                executor.run()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise StageError(f"Could not prepare the target for post-install steps: {e}")
+        finally:
+            context.token.remove_callback(executor.cancel)
+            log.close()
+        context.token.raise_if_cancelled()
+        record_phase(context, self.name, steps={name: round(result.elapsed, 3)
+                                                for name, result in executor.results.items()})
+        failed = executor.failed_required
+        if failed:
+            raise StageError(f"Post-install step {failed[0]} failed, see {POST_INSTALL_LOG_PATH}")
+        for name, result in executor.results.items():
+            if not result.ok:
+                print(f"Warning: Post-install step {name} {result.status}")
+
+
+class FinalizeStage(Stage):
+    """Builds the initramfs, system caches and SELinux labels of a directly installed target."""
+
+    name = 'finalize'
+    title = "Finalizing the system..."
+
+    def estimate_work(self, context):
+        return FINALIZE_WORK
+
+    def should_run(self, context):
+        # Anaconda finalizes the systems it installs itself
+        return not context.state.get('anaconda') and os.path.ismount(context.target_root)
+
+    def fingerprint_inputs(self, context):
+        return {
+            'steps': [step.name for step in finalization_steps(context.target_root)],
+            'device': get_mount_source(context.target_root),
+        }
+
+    def run(self, context):
+        steps = finalization_steps(context.target_root)
+        if not steps:
+            return False
+        finished = []
+
+        def on_result(result):
+            finished.append(result.name)
+            context.channel.report(len(finished) / len(steps), f"Finalizing the system ({result.name} done)...")
+
+        log = LogRing(FINALIZE_LOG_PATH)
+        executor = PostInstallExecutor(steps, context.target_root, log, cancel_event=context.token.event,
+                                       result_callback=on_result)
+        context.token.add_callback(executor.cancel)
+        try:
+            with chroot_mounts(context.target_root):
+                executor.run()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise StageError(f"Could not prepare the target for finalization: {e}")
+        finally:
+            context.token.remove_callback(executor.cancel)
+            log.close()
+        context.token.raise_if_cancelled()
+        record_phase(context, self.name, steps={name: round(result.elapsed, 3)
+                                                for name, result in executor.results.items()})
+        failed = [name for name, result in executor.results.items() if not result.ok]
+        # Without an initramfs or labels the system does not boot; the caches rebuild on first use
+        for name in failed:
+            if name in ('dracut', 'selinux-relabel'):
+                raise StageError(f"Finalization step {name} {executor.results[name].status}, see {FINALIZE_LOG_PATH}")
+            print(f"Warning: Finalization step {name} {executor.results[name].status}")
+
+
+def build_install_stages():
+    """Returns the stages of a normal installation, in order."""
+    return [PrepareStage(), AnacondaStage(), PayloadStage(), VerifyStage(), PostInstallStage(), FinalizeStage()]
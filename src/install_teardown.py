@@ -0,0 +1,133 @@
+import os
+import subprocess
+import time
+
+
+class TeardownReport:
+    __slots__ = ('unmounted', 'deactivated', 'errors', 'elapsed')
+
+    def __init__(self):
+        self.unmounted = []
+        self.deactivated = []
+        self.errors = []
+        self.elapsed = 0.0
+
+    def summary(self):
+        text = f"cleanup took {self.elapsed:.1f}s"
+        if self.errors:
+            text += f", {len(self.errors)} problem(s): {self.errors[0]}"
+        return text
+
+
+def target_mounts(target_root):
+    """Returns [(device, mount_point)] at or below target_root, deepest first."""
+    mounts = []
+    prefix = target_root.rstrip('/') + '/'
+    with open('/proc/self/mounts', 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            # /proc/self/mounts escapes spaces as \040
+            mount_point = fields[1].replace('\\040', ' ')
+            if mount_point == target_root or mount_point.startswith(prefix):
+                mounts.append((fields[0], mount_point))
+    # Mount order is creation order; undo it from the end
+    return list(reversed(mounts))
+
+
+def _run(argv, deadline, report):
+    """Runs argv bounded by deadline; returns its output, or None (and records why) if it failed."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        report.errors.append(f"{argv[0]}: teardown deadline reached")
+        return None
+    try:
+        return subprocess.run(argv, check=True, capture_output=True, text=True, timeout=remaining).stdout
+    except subprocess.TimeoutExpired:
+        report.errors.append(f"{' '.join(argv)}: timed out")
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, 'stderr', None)
+        report.errors.append(f"{' '.join(argv)}: {stderr.strip() if stderr else e}")
+    return None
+
+
+def _dm_name(device):
+    if device.startswith('/dev/mapper/'):
+        return device[len('/dev/mapper/'):]
+    if device.startswith('/dev/dm-'):
+        try:
+            with open(f"/sys/block/{os.path.basename(device)}/dm/name", 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+    return None
+
+
+def _dm_uuid(name):
+    try:
+        with open(f"/sys/block/{os.path.basename(os.path.realpath('/dev/mapper/' + name))}/dm/uuid", 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def teardown_target(target_root, deadline):
+    """Unmounts the target in reverse mount order and deactivates its LVM and LUKS devices.
+
+    deadline is a time.monotonic() value; every command is bounded by it.
+    Mounts that do not go away in time are detached lazily so the disks can
+    be reused right away.
+    """
+    report = TeardownReport()
+    started = time.monotonic()
+    devices = []
+    try:
+        mounts = target_mounts(target_root)
+    except OSError as e:
+        report.errors.append(f"mounts: {e}")
+        mounts = []
+
+    for device, mount_point in mounts:
+        # A hung unmount may use half the time left, so the lazy detach still gets its turn
+        now = time.monotonic()
+        if _run(['umount', mount_point], now + (deadline - now) / 2, report) is not None:
+            report.unmounted.append(mount_point)
+        elif _run(['umount', '-l', mount_point], deadline, report) is not None:
+            report.unmounted.append(f"{mount_point} (lazy)")
+        if device.startswith('/dev/'):
+            devices.append(device)
+
+    # Stacked devices: logical volumes first, then the LUKS containers under them
+    volume_groups = []
+    luks = []
+    for device in devices:
+        name = _dm_name(device)
+        if name is None:
+            continue
+        uuid = _dm_uuid(name)
+        if uuid.startswith('LVM-'):
+            vg = (_run(['lvs', '--noheadings', '-o', 'vg_name', device], deadline, report) or '').strip()
+            if vg and vg not in volume_groups:
+                volume_groups.append(vg)
+                # Encrypted physical volumes are closed after the group
+                pvs = _run(['pvs', '--noheadings', '-o', 'pv_name', '-S', f'vg_name={vg}'], deadline, report)
+                for pv in (pvs or '').split():
+                    pv_name = _dm_name(pv)
+                    if pv_name and _dm_uuid(pv_name).startswith('CRYPT-') and pv_name not in luks:
+                        luks.append(pv_name)
+        elif uuid.startswith('CRYPT-') and name not in luks:
+            luks.append(name)
+    for vg in volume_groups:
+        if _run(['vgchange', '-an', vg], deadline, report) is not None:
+            report.deactivated.append(vg)
+    for name in luks:
+        if _run(['cryptsetup', 'close', name], deadline, report) is not None:
+            report.deactivated.append(name)
+
+    report.elapsed = time.monotonic() - started
+    print(f"Teardown: unmounted {len(report.unmounted)}, deactivated {len(report.deactivated)}, "
+          f"{len(report.errors)} errors in {report.elapsed:.1f}s")
+    for error in report.errors:
+        print(f"  {error}")
+    return report
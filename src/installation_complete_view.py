@@ -1,8 +1,12 @@
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
-from gi.repository import Gtk, Adw, Gio
-import os # For simulating reboot (e.g., via systemctl)
+from gi.repository import Gtk, Adw, Gio, GLib
+import threading
+
+from src.live_copy import TARGET_ROOT_PATH
+from src.fast_reboot import reboot_into_target, kexec_mode
+from src.install_report import report_breakdown
 
 @Gtk.Template(filename='ui/installation_complete.ui')
 class InstallationCompleteView(Gtk.Box):
@@ -10,22 +14,51 @@ class InstallationCompleteView(Gtk.Box):
 
     # Template Children
     reboot_button = Gtk.Template.Child()
+    report_group = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.reboot_button.connect('clicked', self.on_reboot_clicked)
+        self._report_rows = []
+        self._kickstart_settings = {}
         print("InstallationCompleteView initialized")
 
+    def set_kickstart_settings(self, settings):
+        """Kickstart settings of the installation, for its reboot command."""
+        self._kickstart_settings = settings or {}
+
+    def set_install_report(self, report):
+        """Shows how long each part of the installation took."""
+        for row in self._report_rows:
+            self.report_group.remove(row)
+        self._report_rows = []
+        if not report:
+            self.report_group.set_visible(False)
+            return
+        for title, detail in report_breakdown(report):
+            row = Adw.ActionRow(title=title)
+            label = Gtk.Label(label=detail)
+            label.add_css_class("dim-label")
+            row.add_suffix(label)
+            self.report_group.add(row)
+            self._report_rows.append(row)
+        self.report_group.set_visible(True)
+
     def on_reboot_clicked(self, button):
-        print("Reboot button clicked. Simulating reboot...")
-        # In a real installer, this would trigger the actual reboot
-        # For example, using os.system or subprocess:
-        # try:
-        #     os.system("systemctl reboot")
-        # except Exception as e:
-        #     print(f"Failed to initiate reboot: {e}")
-        
-        # For simulation purposes, just quit the app
-        app = self.get_ancestor(Adw.Application)
+        print("Reboot button clicked.")
+        button.set_sensitive(False)
+        threading.Thread(target=self._reboot_worker, args=(kexec_mode(self._kickstart_settings),), name="reboot", daemon=True).start()
+
+    def _reboot_worker(self, mode):
+        try:
+            reboot_into_target(TARGET_ROOT_PATH, mode)
+        except Exception as e:
+            print(f"Failed to initiate reboot: {e}")
+            GLib.idle_add(self._quit)
+
+    def _quit(self):
+        # Without a reboot, leave the installer so the user can restart by hand
+        app = self.get_root().get_application() if self.get_root() else None
         if app:
-            app.quit() 
\ No newline at end of file
+            app.quit()
+        return GLib.SOURCE_REMOVE
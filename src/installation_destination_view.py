@@ -4,6 +4,8 @@ gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw, Gio, GLib
 import locale
 
+from src.storage_plan import StoragePlanner
+
 # UDisks2 DBus constants
 UDISKS_BUS_NAME = 'org.freedesktop.UDisks2'
 UDISKS_OBJECT_PATH = '/org/freedesktop/UDisks2'
@@ -12,6 +14,8 @@ BLOCK_INTERFACE = 'org.freedesktop.UDisks2.Block'
 DRIVE_INTERFACE = 'org.freedesktop.UDisks2.Drive'
 PARTITION_TABLE_INTERFACE = 'org.freedesktop.UDisks2.PartitionTable'
 PARTITION_INTERFACE = 'org.freedesktop.UDisks2.Partition'
+# Planned storage actions listed on the page
+MAX_PLAN_ACTIONS_SHOWN = 6
 
 def format_size(size_bytes):
     """Converts bytes to human-readable format (GiB)."""
@@ -32,11 +36,17 @@ class InstallationDestinationView(Gtk.Box):
     config_auto_check = Gtk.Template.Child()
     config_custom_check = Gtk.Template.Child()
     space_summary_label = Gtk.Template.Child()
+    plan_summary_label = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._selected_disks = []
+        self._selected_size = 0
         self._dbus_proxy = None
+        # Automatic partitioning is planned while the user is still on this page
+        self._planner = StoragePlanner(self._on_plan_finished)
+        # Called with the plan, or None, whenever planning ends; see plan_pending()
+        self.plan_finished_callback = None
         self.populate_disk_list()
         self.disk_list_box.connect("selected-rows-changed", self.on_disk_selection_changed)
         self.config_auto_check.connect("toggled", self.on_config_option_changed)
@@ -186,7 +196,8 @@ class InstallationDestinationView(Gtk.Box):
                         "name": clean_device_file.split('/')[-1], # e.g., sda
                         "size": format_size(size),
                         "model": f"{vendor} {model}".strip(),
-                        "path": clean_device_file # Full path, e.g., /dev/sda
+                        "path": clean_device_file, # Full path, e.g., /dev/sda
+                        "size_bytes": size
                     }
                     found_disks.append(disk_info)
                     print(f"  Found suitable disk: {disk_info}")
@@ -208,6 +219,7 @@ class InstallationDestinationView(Gtk.Box):
                     row.add_suffix(Gtk.Label(label=disk['size']))
                     row.set_activatable(True)
                     row.disk_path = disk['path']
+                    row.disk_size = disk['size_bytes']
                     self.disk_list_box.append(row)
 
         except GLib.Error as e:
@@ -224,7 +236,9 @@ class InstallationDestinationView(Gtk.Box):
         """Called when the selected disks change."""
         selected_rows = list_box.get_selected_rows()
         self._selected_disks = [row.disk_path for row in selected_rows if hasattr(row, 'disk_path')]
+        self._selected_size = sum(getattr(row, 'disk_size', 0) for row in selected_rows)
         print(f"Selected disks: {self._selected_disks}")
+        self._update_plan()
         self.update_summary()
 
     def on_config_option_changed(self, check_button):
@@ -236,6 +250,7 @@ class InstallationDestinationView(Gtk.Box):
         elif check_button == self.config_custom_check:
             print("Configuration set to Custom")
             # TODO: Enable/trigger custom partitioning tool/dialog
+        self._update_plan()
         self.update_summary()
 
     def update_summary(self):
@@ -250,12 +265,49 @@ class InstallationDestinationView(Gtk.Box):
             # TODO: Possibly disable the 'Continue' button via a signal/property
 
         self.space_summary_label.set_label(summary)
+        self._update_plan_summary()
+
+    def _update_plan(self):
+        if self.config_auto_check.get_active():
+            self._planner.plan_for(self._selected_disks)
+        else:
+            self._planner.plan_for([])
+
+    def _on_plan_finished(self, result):
+        self._update_plan_summary()
+        if self.plan_finished_callback:
+            self.plan_finished_callback(self._planner.plan())
+
+    def plan_pending(self):
+        """True while the automatic partitioning plan is still being computed."""
+        return self._planner.busy
+
+    def _update_plan_summary(self):
+        result = self._planner.result
+        if self._planner.busy:
+            text = "Planning the partition layout..."
+        elif result is None:
+            text = None # Nothing selected, or no installer service to plan with
+        elif not result.ok:
+            text = f"Automatic partitioning is not possible: {'; '.join(result.errors)}"
+        else:
+            actions = result.value['actions'] if result.value else []
+            lines = actions[:MAX_PLAN_ACTIONS_SHOWN]
+            if len(actions) > MAX_PLAN_ACTIONS_SHOWN:
+                lines.append(f"... and {len(actions) - MAX_PLAN_ACTIONS_SHOWN} more")
+            text = "\n".join([f"Planned changes ({len(actions)}):"] + lines + result.warnings)
+        self.plan_summary_label.set_visible(text is not None)
+        if text is not None:
+            self.plan_summary_label.set_label(text)
 
     def get_selected_config(self):
         """Returns the selected disks and configuration mode."""
         return {
             "disks": self._selected_disks,
-            "config_mode": "Automatic" if self.config_auto_check.get_active() else "Custom"
+            "size_bytes": self._selected_size,
+            "config_mode": "Automatic" if self.config_auto_check.get_active() else "Custom",
+            # Only a finished plan for exactly this selection; otherwise it is computed at install time
+            "storage_plan": self._planner.plan() if self.config_auto_check.get_active() else None,
         }
         
     def show_error_dialog(self, title, message):
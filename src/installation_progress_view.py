@@ -3,10 +3,20 @@ gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 gi.require_version('Gio', '2.0')
 from gi.repository import Gtk, Adw, GLib, Gio
+import copy
 import json
 import os
-import subprocess
-import time
+import threading
+from src.live_copy import TARGET_ROOT_PATH
+from src.install_pipeline import CancellationToken, InstallPipeline, ProgressChannel, StageContext, format_eta
+from src.install_stages import build_install_stages
+from src.install_journal import InstallJournal
+from src.install_teardown import teardown_target
+from src.install_report import InstallReport
+from src.install_config import InstallConfig
+from src.ui_updates import UiUpdateChannel
+from src.log_view import LogPaneController
+from src.fast_reboot import reboot_into_target, kexec_mode
 
 # Anaconda DBus service constants
 BOSS_BUS_NAME = 'org.fedoraproject.Anaconda.Boss'
@@ -21,6 +31,10 @@ PAYLOAD_BUS_NAME = 'org.fedoraproject.Anaconda.Modules.Payloads'
 PAYLOAD_OBJECT_PATH = '/org/fedoraproject/Anaconda/Modules/Payloads'
 PAYLOAD_INTERFACE = 'org.fedoraproject.Anaconda.Modules.Payloads'
 
+TASK_INTERFACE = 'org.fedoraproject.Anaconda.Task'
+# DBus calls made while cancelling must not hold up the teardown
+CANCEL_CALL_TIMEOUT_MS = 2000
+
 class AnacondaDBusClient:
     """Helper class to interact with Anaconda's DBus services."""
     
@@ -28,9 +42,10 @@ class AnacondaDBusClient:
         self._boss_proxy = None
         self._storage_proxy = None
         self._payload_proxy = None
-        self._connect_services()
+        self._task_paths = []
+        self.connect_services()
     
-    def _connect_services(self):
+    def connect_services(self):
         """Connect to all required Anaconda DBus services."""
         try:
             self._boss_proxy = Gio.DBusProxy.new_for_bus_sync(
@@ -70,6 +85,59 @@ class AnacondaDBusClient:
             print(f"Failed to connect to Anaconda DBus services: {e}")
             return False
     
+    def storage_available(self):
+        """True if the Boss and Storage services are running, not merely proxied."""
+        return all(proxy is not None and proxy.get_name_owner() is not None
+                   for proxy in (self._boss_proxy, self._storage_proxy))
+
+    def track_task(self, task_path):
+        """Remembers a task started by a *WithTask call so it can be cancelled."""
+        self._task_paths.append(task_path)
+
+    def cancel_tasks(self):
+        """Asks every tracked Anaconda task to stop."""
+        for task_path in self._task_paths:
+            for bus_name in (STORAGE_BUS_NAME, PAYLOAD_BUS_NAME):
+                if not task_path.startswith(f"/{bus_name.replace('.', '/')}"):
+                    continue
+                try:
+                    Gio.DBusProxy.new_for_bus_sync(
+                        Gio.BusType.SYSTEM, Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES, None,
+                        bus_name, task_path, TASK_INTERFACE, None
+                    ).call_sync('Cancel', None, Gio.DBusCallFlags.NONE, CANCEL_CALL_TIMEOUT_MS, None)
+                    print(f"Cancelled Anaconda task {task_path}")
+                except GLib.Error as e:
+                    print(f"Warning: Could not cancel Anaconda task {task_path}: {e.message}")
+        self._task_paths = []
+
+    def apply_partitioning(self, partitioning_path):
+        """Applies a partitioning the Storage module has already configured and validated.
+
+        Raises GLib.Error if the Storage module refuses it.
+        """
+        self._storage_proxy.call_sync(
+            'ApplyPartitioning', GLib.Variant('(o)', (partitioning_path,)),
+            Gio.DBusCallFlags.NONE, -1, None)
+
+    def configure_default_storage(self, disks):
+        """Configures automatic partitioning of the selected disks. Raises GLib.Error or RuntimeError."""
+        # The Storage module names disks by device name, not path
+        disks = [os.path.basename(disk) for disk in disks]
+        if not disks:
+            raise RuntimeError("No disks were selected for installation")
+
+        storage_config = {
+            'disks': disks,
+            'clear_part_type': 'all',
+            'default_partitioning': True
+        }
+        task = self._storage_proxy.call_sync(
+            'ConfigureWithTask',
+            GLib.Variant('(s)', (json.dumps(storage_config),)),
+            Gio.DBusCallFlags.NONE, -1, None)
+        if task is not None and task.unpack():
+            self.track_task(task.unpack()[0])
+
     def start_installation(self):
         """Start the installation process."""
         if not self._boss_proxy:
@@ -144,14 +212,29 @@ class InstallationProgressView(Gtk.Box):
     progress_bar = Gtk.Template.Child()
     status_label = Gtk.Template.Child()
     cancel_button = Gtk.Template.Child()
+    log_expander = Gtk.Template.Child()
+    log_search_entry = Gtk.Template.Child()
+    log_level_dropdown = Gtk.Template.Child()
+    log_scrolled_window = Gtk.Template.Child()
+    log_list_view = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._timeout_id = None
         self._completion_callback = None
+        # Called when Close is clicked after a failed or cancelled installation
+        self._close_callback = None
         self._anaconda = AnacondaDBusClient()
         self._is_installing = False
-        self._last_progress = 0.0
+        self._is_installed = False
+        self._config = InstallConfig()
+        self._pipeline = None
+        self._report = None
+        self._rebooting = False
+        self._token = None
+        self._channel = None
+        self._ui_updates = UiUpdateChannel(self)
+        self._log_pane = LogPaneController(self.log_list_view, self.log_scrolled_window,
+                                           self.log_search_entry, self.log_level_dropdown, self._ui_updates)
         print("InstallationProgressView initialized")
         
         # Connect cancel button
@@ -161,237 +244,95 @@ class InstallationProgressView(Gtk.Box):
         """Handle cancel button click."""
         if self._is_installing:
             self.cancel_installation()
-        elif self._completion_callback:
-            self._completion_callback()
+        elif self._is_installed:
+            self._reboot_system()
+        elif self._close_callback:
+            self._close_callback()
+
+    def set_config(self, config):
+        """Sets the InstallConfig collected by the window's pages."""
+        self._config = config
 
-    def start_installation(self, completion_callback):
+    def get_install_report(self):
+        """Returns the timing report of the last installation once it has ended, or None."""
+        return self._report.data if self._report is not None else None
+
+    def start_installation(self, completion_callback, close_callback=None):
         """
         Start the actual installation process.
         
         Args:
             completion_callback: Callback function to call when installation is complete
                               or fails. Will be called with (success, message) parameters.
+            close_callback: Called without arguments when Close is clicked after the
+                            installation failed or was cancelled.
         """
         print("Starting installation...")
         self._completion_callback = completion_callback
+        self._close_callback = close_callback
         self.progress_bar.set_fraction(0.0)
         self.progress_bar.set_text("0%")
         self.status_label.set_label("Preparing installation environment...")
         self.cancel_button.set_label("Cancel")
         self._is_installing = True
-        
-        # Start the installation in a separate thread to avoid blocking the UI
-        GLib.idle_add(self._start_installation_thread)
-    
-    def _start_installation_thread(self):
-        """Start the installation in a separate thread."""
-        try:
-            # 1. Get the installation configuration
-            config = {
-                'software': {
-                    'source_type': 'live_image',
-                    'post_install_commands': []
-                },
-                'storage': {
-                    # Default storage configuration
-                }
+        self._is_installed = False
+
+        # The stages run on a worker thread; they get their own copy of the configuration
+        config = {
+            'software': self._config.software.to_dict(),
+            'storage': {
+                'disks': list(self._config.destination.disks),
+                'plan': copy.deepcopy(self._config.destination.storage_plan),
             }
-            
-            # Check if we have a kickstart file
-            if hasattr(self, '_config_data') and 'software' in self._config_data:
-                ks_path = self._config_data['software'].get('kickstart_path')
-                if ks_path and os.path.exists(ks_path):
-                    config['software']['source_type'] = 'kickstart'
-                    config['software']['kickstart_path'] = ks_path
-                    print(f"Using kickstart file: {ks_path}")
-                    
-                    # Read the kickstart file
-                    try:
-                        with open(ks_path, 'r') as f:
-                            ks_content = f.read()
-                        # Here you would parse the kickstart file and apply its settings
-                        print(f"Parsed kickstart file with {len(ks_content)} characters")
-                    except Exception as e:
-                        print(f"Error reading kickstart file: {e}")
-                        GLib.idle_add(self._installation_failed, f"Failed to read kickstart file: {e}")
-                        return False
-            
-            # 2. Start the progress updates
-            GLib.idle_add(lambda: GLib.timeout_add(100, self._update_progress))
-            
-            # 3. Start the actual installation using Anaconda's DBus interface
-            GLib.idle_add(self.status_label.set_label, "Starting installation process...")
-            
-            # Connect to Anaconda's DBus service if available
-            try:
-                if not self._anaconda._connect_services():
-                    print("Warning: Could not connect to Anaconda services, using fallback installation method")
-                    raise Exception("Anaconda services not available")
-                
-                # Try to use Anaconda's storage service if available
-                if hasattr(self._anaconda, '_storage_proxy'):
-                    # Get the first disk
-                    disks = self._anaconda._storage_proxy.call_sync(
-                        'GetDisks',
-                        None,
-                        Gio.DBusCallFlags.NONE,
-                        -1,
-                        None
-                    ).unpack()[0]
-                    
-                    if not disks:
-                        raise Exception("No disks found for installation")
-                    
-                    # Use the first disk for installation
-                    disk = disks[0]
-                    
-                    # Create a simple storage configuration
-                    storage_config = {
-                        'disks': [disk],
-                        'clear_part_type': 'all',
-                        'default_partitioning': True
-                    }
-                    
-                    # Apply the storage configuration
-                    self._anaconda._storage_proxy.call_sync(
-                        'ConfigureWithTask',
-                        GLib.Variant('(s)', (json.dumps(storage_config),)),
-                        Gio.DBusCallFlags.NONE,
-                        -1,
-                        None
-                    )
-                    
-                    # Start the installation
-                    GLib.idle_add(self.status_label.set_label, "Starting installation...")
-                    success, message = self._anaconda.start_installation()
-                    if not success:
-                        raise Exception(f"Installation failed: {message}")
-                    
-                    # If we got here, installation started successfully
-                    return
-                
-            except Exception as e:
-                print(f"Warning: Could not use Anaconda storage service: {e}")
-                print("Falling back to direct installation method")
-            
-            # Fallback installation method
-            GLib.idle_add(self.status_label.set_label, "Preparing installation...")
-            
-            # Simulate installation progress since we can't use Anaconda's service
-            for i in range(1, 101):
-                if not self._is_installing:
-                    break
-                    
-                # Update progress
-                self._simulated_progress = i / 100.0
-                GLib.idle_add(self.status_label.set_label, f"Installing system... {i}%")
-                
-                # Simulate work
-                time.sleep(0.1)
-                
-                # Simulate errors
-                if i == 30:
-                    raise Exception("Failed to install bootloader")
-                    
-            # If we got here, installation completed successfully
-            GLib.idle_add(self.status_label.set_label, "Installation complete!")
-            GLib.idle_add(self._installation_complete)
+        }
+        self._token = CancellationToken()
+        self._channel = ProgressChannel(self._on_progress_changed)
+        context = StageContext(config, self._token, self._channel, TARGET_ROOT_PATH, self._anaconda)
+        self._report = InstallReport()
+        self._pipeline = InstallPipeline(build_install_stages(), context, InstallJournal(TARGET_ROOT_PATH),
+                                         teardown=lambda deadline: teardown_target(TARGET_ROOT_PATH, deadline),
+                                         report=self._report)
+        self._log_pane.start()
+        self._pipeline.start()
+
+    def _on_progress_changed(self, channel):
+        """Queues the pipeline's latest progress for the next frame. Worker thread."""
+        fraction, message, eta, outcome, outcome_message = channel.snapshot()
+        if outcome is not None:
+            self._ui_updates.call('outcome', self._on_outcome, outcome, outcome_message)
             return
-            
-            # 6. Run post-installation commands
-            post_install_cmds = config.get('software', {}).get('post_install_commands', [])
-            if post_install_cmds:
-                GLib.idle_add(self.status_label.set_label, "Configuring additional software...")
-                
-                for cmd in post_install_cmds:
-                    if not cmd:
-                        continue
-                        
-                    try:
-                        print(f"Running post-install command: {' '.join(cmd)}")
-                        subprocess.run(cmd, check=True, capture_output=True, text=True)
-                    except subprocess.CalledProcessError as e:
-                        print(f"Warning: Post-install command failed: {e.stderr}")
-                    except Exception as e:
-                        print(f"Warning: Failed to run post-install command: {e}")
-            
-            # 7. Installation complete
-            GLib.idle_add(self._installation_complete)
-            return True
-            
-        except Exception as e:
-            error_msg = f"Installation failed: {str(e)}"
-            print(error_msg)
-            GLib.idle_add(self._installation_failed, error_msg)
-    
-    def _update_progress(self):
-        """Update the installation progress."""
-        if not self._is_installing:
-            return GLib.SOURCE_REMOVE
-            
-        try:
-            # Simulate progress for now
-            if hasattr(self, '_simulated_progress'):
-                self._simulated_progress += 0.01
-                if self._simulated_progress >= 1.0:
-                    self._simulated_progress = 1.0
-                    self._is_installing = False
-                    GLib.idle_add(self._installation_complete)
-                    return GLib.SOURCE_REMOVE
-                
-                progress = self._simulated_progress
-            else:
-                # First run
-                self._simulated_progress = 0.0
-                progress = 0.0
-            
-            # Update UI
-            self.progress_bar.set_fraction(progress)
-            self.progress_bar.set_text(f"{int(progress * 100)}%")
-            
-            # Update status message based on progress
-            if progress < 0.3:
-                status = "Preparing installation..."
-            elif progress < 0.6:
-                status = "Installing system packages..."
-            elif progress < 0.9:
-                status = "Configuring system..."
-            else:
-                status = "Finalizing installation..."
-                
-            self.status_label.set_label(status)
-            self._last_progress = progress
-            
-            # Check if installation is complete
-            if progress >= 1.0:
-                self._installation_complete()
-                return GLib.SOURCE_REMOVE
-                
-            return GLib.SOURCE_CONTINUE
-            
-        except Exception as e:
-            error_msg = f"Error updating progress: {str(e)}"
-            print(error_msg)
-            self._installation_failed(error_msg)
-            return GLib.SOURCE_REMOVE
+        if eta is not None:
+            message = f"{message} ({format_eta(eta)})"
+        self._ui_updates.set_property(self.progress_bar, 'fraction', fraction)
+        self._ui_updates.set_property(self.progress_bar, 'text', f"{int(fraction * 100)}%")
+        self._ui_updates.set_property(self.status_label, 'label', message)
+
+    def _on_outcome(self, outcome, outcome_message):
+        print(f"Installation {outcome}; UI updates: {self._ui_updates.stats()}")
+        if outcome == 'complete':
+            self._log_pane.stop()
+            self._installation_complete()
+        elif outcome == 'failed':
+            # Keep tailing after a failure so late log lines still show up
+            self._installation_failed(outcome_message)
+        else:
+            self._installation_cancelled(outcome_message)
     
     def _installation_complete(self):
         """Handle installation completion."""
         self._is_installing = False
+        self._is_installed = True
         self.progress_bar.set_fraction(1.0)
         self.progress_bar.set_text("100%")
-        self.status_label.set_label("Installation complete! The system will now reboot.")
+        self.status_label.set_label("Installation complete!")
         
-        # Change cancel button to "Reboot"
+        # The cancel button reboots from now on, see _on_cancel_clicked
         self.cancel_button.set_label("Reboot Now")
-        self.cancel_button.connect("clicked", lambda b: self._reboot_system())
         
         # Call completion callback if set
+        # The window moves on to the completion page, which reboots when asked
         if self._completion_callback:
             self._completion_callback(True, "Installation completed successfully")
-        
-        # Schedule system reboot after a short delay
-        GLib.timeout_add_seconds(5, self._reboot_system)
     
     def _installation_failed(self, error_message):
         """Handle installation failure."""
@@ -401,34 +342,56 @@ class InstallationProgressView(Gtk.Box):
         self.progress_bar.set_text("0%")
         self.status_label.set_label(f"Installation failed: {error_message}")
         self.cancel_button.set_label("Close")
+        self.cancel_button.set_sensitive(True)
+        # The page stays up so the log can be read; Close goes back
+        self.log_expander.set_expanded(True)
         
         # Call completion callback with failure
         if self._completion_callback:
             GLib.idle_add(lambda: self._completion_callback(False, error_message))
+
+    def _installation_cancelled(self, message):
+        """Shown once the pipeline has stopped and the target has been torn down."""
+        self._is_installing = False
+        self.status_label.set_label(message)
+        self.cancel_button.set_label("Close")
+        self.cancel_button.set_sensitive(True)
     
     def _reboot_system(self):
         """Reboot the system after successful installation."""
+        if self._rebooting:
+            return False
+        self._rebooting = True
+        self.cancel_button.set_sensitive(False)
+        mode = kexec_mode(self._config.kickstart_settings())
+        # Loading the kernel reads it and the initramfs from disk; keep that off the main loop
+        threading.Thread(target=self._reboot_worker, args=(mode,), name="reboot", daemon=True).start()
+        return False  # Don't repeat
+
+    def _reboot_worker(self, mode):
         try:
-            print("Rebooting system...")
-            # Use systemd to schedule a reboot
-            subprocess.run(["systemctl", "reboot"], check=True)
+            print(f"Rebooting system (kexec {mode})...")
+            reboot_into_target(TARGET_ROOT_PATH, mode)
         except Exception as e:
             print(f"Failed to reboot system: {e}")
             # If reboot fails, show a message to the user
-            self.status_label.set_text("Please restart your system to complete the installation.")
-        
-        return False  # Don't repeat
+            GLib.idle_add(self._on_reboot_failed)
+
+    def _on_reboot_failed(self):
+        self._rebooting = False
+        self.cancel_button.set_sensitive(True)
+        self.status_label.set_text("Please restart your system to complete the installation.")
+        return GLib.SOURCE_REMOVE
     
     def cancel_installation(self):
         """Cancel the installation process."""
-        if self._timeout_id:
-            GLib.source_remove(self._timeout_id)
-            self._timeout_id = None
-        
-        self._is_installing = False
+        if self._pipeline is None:
+            return
         print("Installation cancelled by user")
-        self.status_label.set_label("The installation was cancelled.")
-        self.cancel_button.set_label("Close")
+        # Stages stop at their next check and the target is torn down; the outcome arrives via the channel
+        self._pipeline.cancel()
+        self.status_label.set_label("Cancelling the installation...")
+        self.cancel_button.set_sensitive(False)
     
     def _show_error(self, title, message):
         """Show an error dialog."""
@@ -438,4 +401,4 @@ class InstallationProgressView(Gtk.Box):
             body=message
         )
         dialog.add_response("ok", "OK")
-        dialog.present() 
\ No newline at end of file
+        dialog.present()
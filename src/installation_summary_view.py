@@ -4,6 +4,10 @@ gi.require_version('Adw', '1')
 gi.require_version('Gio', '2.0')
 from gi.repository import Gtk, Adw, Gio, GLib
 import json
+import os
+from src.installation_destination_view import format_size
+from src.repo_metadata import estimate_install_size_async
+from src.comps_catalog import loaded_comps_catalog
 
 # Anaconda DBus service constants
 BOSS_BUS_NAME = 'org.fedoraproject.Anaconda.Boss'
@@ -22,11 +26,17 @@ class InstallationSummaryView(Gtk.Box):
     summary_root_row = Gtk.Template.Child()
     summary_timezone_row = None # Will create this row dynamically or add to UI
     summary_software_row = None # Will create this row dynamically
+    summary_size_row = None # Will create this row dynamically
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._config_data = {}
+        self._config = None
         self._boss_proxy = None
+        self._size_estimate = None
+        self._size_generation = 0
+        self._size_pending = False
+        # Called once a running size estimate has finished, see size_estimate_pending()
+        self.size_estimated_callback = None
         
         # Add rows dynamically or ensure they exist in UI
         summary_group = self.get_first_child().get_next_sibling().get_next_sibling()
@@ -37,6 +47,9 @@ class InstallationSummaryView(Gtk.Box):
             if not hasattr(self, 'summary_software_row') or not self.summary_software_row:
                 self.summary_software_row = Adw.ActionRow(title="Software")
                 summary_group.add(self.summary_software_row)
+            if not self.summary_size_row:
+                self.summary_size_row = Adw.ActionRow(title="Installation Size")
+                summary_group.add(self.summary_size_row)
         else:
             print("Warning: Could not find summary group to add dynamic rows.")
         
@@ -61,130 +74,137 @@ class InstallationSummaryView(Gtk.Box):
             print(f"Failed to connect to Anaconda Boss service: {e}")
             return False
 
-    def update_summary(self, config_data):
-        """Populates the summary view based on collected configuration."""
-        print("Updating summary view with:", config_data)
-        
-        if not config_data:
-            print("Error: No config data provided to summary view")
-            return
-        
-        self._config_data = config_data.copy()
-        
-        # Update UI with the configuration data
-        # Language
-        lang_name = config_data.get('language', 'N/A')
-        self.summary_lang_row.set_subtitle(lang_name.upper() if lang_name != 'N/A' else 'N/A')
-        
-        # Keyboard Layout
-        keyboard_layout = config_data.get('keyboard_layout', 'N/A')
-        self.summary_keyboard_row.set_subtitle(keyboard_layout)
-        
-        # Timezone
-        timezone = config_data.get('timezone', 'N/A')
-        if isinstance(timezone, dict):
-            timezone_str = timezone.get('timezone', 'N/A')
-            ntp_status = "(NTP Enabled)" if timezone.get('ntp_enabled', False) else "(NTP Disabled)"
-            self.summary_timezone_row.set_subtitle(f"{timezone_str} {ntp_status}")
+    def update_summary(self, config):
+        """Populates the summary view from the window's InstallConfig."""
+        print(f"Updating summary view with: {config}")
+        self._config = config
+        self._start_size_estimate()
+
+        self.summary_lang_row.set_subtitle(config.language.language)
+        self.summary_keyboard_row.set_subtitle(config.keyboard.layout)
+
+        destination = config.destination
+        disks = ", ".join(destination.disks) or "None"
+        self.summary_destination_row.set_subtitle(f"{disks} ({destination.config_mode})")
+
+        user = config.user
+        if 'user' in config.completed:
+            role = "Administrator" if user.is_admin else "Standard User"
+            self.summary_user_row.set_subtitle(f"User '{user.username}', {role}")
         else:
-            self.summary_timezone_row.set_subtitle(str(timezone))
-        
-        # Software Selection
-        software = config_data.get('software', {})
-        if not software:
-            self.summary_software_row.set_subtitle("No software selected")
-            return
-            
-        if software.get('source_type') == 'kickstart':
-            ks_path = software.get('kickstart_path', 'Unknown')
-            ks_name = os.path.basename(ks_path) if ks_path else 'Unknown'
-            self.summary_software_row.set_subtitle(f"Kickstart: {ks_name}")
+            self.summary_user_row.set_subtitle("N/A")
+        self.summary_root_row.set_subtitle("Enabled" if user.root_enabled else "Disabled")
+
+        if self.summary_timezone_row:
+            ntp_status = "(NTP Enabled)" if config.timezone.ntp_enabled else "(NTP Disabled)"
+            self.summary_timezone_row.set_subtitle(f"{config.timezone.timezone} {ntp_status}")
+
+        if self.summary_software_row:
+            self.summary_software_row.set_subtitle(self._software_summary(config.software))
+
+    def _software_summary(self, software):
+        if software.source_type == 'kickstart':
+            text = f"Kickstart: {os.path.basename(software.kickstart_path) if software.kickstart_path else 'Unknown'}"
+        elif software.source_type == 'disk_image':
+            text = "Prebuilt system image"
+        elif software.source_type == 'repository':
+            extra = f" + {len(software.groups)} add-on group(s)" if software.groups else ""
+            text = f"{self._environment_name(software.environment)}{extra}"
         else:
-            # Live image packages
-            self.summary_software_row.set_subtitle("Using packages from live image")
-            
-        # Show Flatpak status if enabled
-        if any(cmd and 'flatpak' in ' '.join(cmd) for cmd in software.get('post_install_commands', [])):
-            self.summary_software_row.set_subtitle(
-                f"{self.summary_software_row.get_subtitle()} • Flatpak enabled"
-            )
-        
-        # Installation Destination
-        install_disk = config_data.get('installation_disk', 'N/A')
-        self.summary_destination_row.set_subtitle(install_disk)
-        
-        # User Account
-        username = config_data.get('username', 'N/A')
-        self.summary_user_row.set_subtitle(username)
-        
-        # Root Account
-        root_setup = "Enabled" if config_data.get('set_root_password', False) else "Disabled"
-        self.summary_root_row.set_subtitle(root_setup)
-        
-        # Software Selection
-        software = config_data.get('software_selection', 'N/A')
-        self.summary_software_row.set_subtitle(software)
-    
+            text = "Using packages from live image"
+        if any(cmd and 'flatpak' in ' '.join(cmd) for cmd in software.post_install_commands):
+            text += " • Flatpak enabled"
+        preseed = software.flatpak_preseed
+        if preseed:
+            # Size only: the pull is bound by the media's read speed, which is not known
+            # before the install; the progress page's ETA covers it once it runs
+            apps = sum(1 for ref in preseed['refs'] if ref.startswith('app/'))
+            text += f" • {apps} Flatpak app(s) from media ({format_size(preseed['size'])})"
+        return text
+
+    def _start_size_estimate(self):
+        """Resolves the package selection against the local repo in the background."""
+        self._size_estimate = None
+        self._size_generation += 1
+        self._size_pending = True
+        generation = self._size_generation
+        if self.summary_size_row:
+            self.summary_size_row.set_subtitle("Calculating...")
+
+        software = self._config.software
+        ks_packages = self._config.kickstart_settings().get('packages', {})
+        packages = list(ks_packages.get('include', [])) + list(software.packages)
+        if software.environment:
+            packages += [f"@^{software.environment}"] + [f"@{group}" for group in software.groups]
+        estimate_install_size_async(packages, ks_packages.get('exclude', []),
+                                    lambda size, error: GLib.idle_add(self._on_size_estimated, generation, size, error))
+
+    def _on_size_estimated(self, generation, size, error):
+        if generation != self._size_generation:
+            return GLib.SOURCE_REMOVE # Configuration changed meanwhile
+        self._size_pending = False
+        if error is not None or size is None:
+            self.summary_size_row.set_subtitle("Unknown (repository metadata unavailable)")
+        else:
+            self._show_size_estimate(size)
+        if self.size_estimated_callback:
+            self.size_estimated_callback()
+        return GLib.SOURCE_REMOVE
+
+    def _show_size_estimate(self, size):
+        self._size_estimate = size
+        text = f"{format_size(size.installed_size)} installed"
+        if size.download_size:
+            text = f"{len(size.packages)} packages, {format_size(size.download_size)} to copy, {text}"
+        flatpak_size = self._flatpak_preseed_size()
+        if flatpak_size:
+            text += f" + {format_size(flatpak_size)} of Flatpak apps"
+        disk_size = self._config.destination.size_bytes
+        required = size.required_disk_space() + flatpak_size
+        if disk_size and disk_size < required:
+            text += f" • needs {format_size(required)}, selected disks are too small"
+        self.summary_size_row.set_subtitle(text)
+
+    def _flatpak_preseed_size(self):
+        preseed = self._config.software.flatpak_preseed if self._config else None
+        return preseed['size'] if preseed else 0
+
+    def size_estimate_pending(self):
+        return self._size_pending
+
+    def check_disk_space(self):
+        """Returns an error message if the selected disks cannot hold the payload, else None.
+
+        Only meaningful once size_estimate_pending() is False.
+        """
+        if self._size_estimate is None:
+            return None # Unknown size; Anaconda's own checks still apply
+        disk_size = self._config.destination.size_bytes
+        required = self._size_estimate.required_disk_space() + self._flatpak_preseed_size()
+        if disk_size and disk_size < required:
+            return (f"The selected disks provide {format_size(disk_size)}, "
+                    f"but the installation needs at least {format_size(required)}.")
+        return None
+
     def get_installation_config(self):
         """Prepare the installation configuration for Anaconda."""
-        if not self._config_data:
+        if self._config is None:
+            return {}
+        try:
+            return self._config.to_anaconda()
+        except ValueError as e:
+            print(f"Error: {e}, refusing to build config")
             return {}
-        
-        # Map our configuration to Anaconda's expected format
-        config = {
-            "Keyboard": {
-                "x_layouts": [self._config_data.get('keyboard_layout', 'us')],
-                "vc_keymap": self._config_data.get('keyboard_layout', 'us')
-            },
-            "Localization": {
-                "language": self._config_data.get('language', 'en_US.UTF-8'),
-                "keyboard": self._config_data.get('keyboard_layout', 'us'),
-                "timezone": self._config_data.get('timezone', 'UTC')
-            },
-            "User": {
-                "name": self._config_data.get('username', ''),
-                "password": self._config_data.get('password', ''),
-                "groups": ["wheel"],
-                "is_admin": True
-            },
-            "Root": {
-                "password": self._config_data.get('root_password', ''),
-                "account_locked": not self._config_data.get('set_root_password', False)
-            },
-            "Storage": {
-                "disks": [self._config_data.get('installation_disk', '')],
-                "default_partitioning": True
-            },
-            "Payload": {
-                "source_type": "CDROM",
-                "base_repo": "/run/install/repo"
-            }
-        }
-        
-        # Add software selection if specified
-        if 'software_selection' in self._config_data:
-            config["Payload"]["packages"] = self._get_packages_for_selection(
-                self._config_data['software_selection']
-            )
-        
-        return config
-    
-    def _get_packages_for_selection(self, selection):
-        """Map software selection to package groups."""
-        # This is a simplified mapping - in a real app, you'd want more comprehensive package lists
-        packages = []
-        
-        if selection == "GNOME Desktop":
-            packages.extend(["@gnome-desktop", "gnome-terminal", "gnome-tweaks"])
-        elif selection == "KDE Plasma Workspaces":
-            packages.extend(["@kde-desktop", "konsole"])
-        elif selection == "Xfce Desktop":
-            packages.extend(["@xfce-desktop", "xfce4-terminal"])
-        elif selection == "Minimal Install":
-            packages.extend(["@core"])
-        
-        return packages
     
+    def _environment_name(self, environment_id):
+        # The software page loaded it on a worker; fall back to the ID rather than index here
+        catalog = loaded_comps_catalog()
+        if catalog:
+            for environment in catalog.get_environments():
+                if environment.id == environment_id:
+                    return environment.name or environment_id
+        return environment_id or "Unknown environment"
+
     def start_installation(self):
         """Start the installation with the current configuration."""
         if not self._boss_proxy:
@@ -213,44 +233,3 @@ class InstallationSummaryView(Gtk.Box):
             error_msg = f"Failed to start installation: {e.message}"
             print(error_msg)
             return False, error_msg
-
-        # Keyboard Layout
-        keyboard_layout = config_data.get('keyboard', 'N/A')
-        self.summary_keyboard_row.set_subtitle(keyboard_layout)
-
-        # Installation Destination
-        dest_config = config_data.get('destination', {})
-        disks = ", ".join(dest_config.get('disks', [])) or "None"
-        config_mode = dest_config.get('config_mode', 'N/A')
-        dest_summary = f"{disks} ({config_mode})"
-        self.summary_destination_row.set_subtitle(dest_summary)
-
-        # User Account
-        user_config = config_data.get('user', {})
-        username = user_config.get('username', 'N/A')
-        is_admin = "Administrator" if user_config.get('is_admin', False) else "Standard User"
-        user_summary = f"User '{username}', {is_admin}"
-        self.summary_user_row.set_subtitle(user_summary)
-
-        # Root Account
-        root_enabled = user_config.get('root_enabled', False)
-        root_summary = "Enabled" if root_enabled else "Disabled"
-        self.summary_root_row.set_subtitle(root_summary)
-
-        # Timezone (Added)
-        if self.summary_timezone_row: # Check if row exists
-            tz_config = config_data.get('timezone', {})
-            timezone = tz_config.get('timezone', 'N/A')
-            ntp = "Enabled" if tz_config.get('ntp_enabled', False) else "Disabled"
-            tz_summary = f"{timezone} (NTP: {ntp})"
-            self.summary_timezone_row.set_subtitle(tz_summary)
-
-        # Software Selection (Added)
-        if self.summary_software_row:
-            sw_config = config_data.get('software', {})
-            packages = ", ".join(sw_config.get('packages', [])) or "None"
-            # In real app, map IDs like '@workstation-product-environment' to human names
-            sw_summary = f"{packages} (Placeholder)"
-            self.summary_software_row.set_subtitle(sw_summary)
-
-        # TODO: Add summary for Software Selection etc. if added 
\ No newline at end of file
@@ -0,0 +1,355 @@
+import hashlib
+import os
+import shlex
+import threading
+
+# Section headers and the interpreter-style sections that hold script bodies
+SCRIPT_SECTIONS = {'%pre', '%pre-install', '%post', '%onerror', '%traceback'}
+DATA_SECTIONS = {'%packages', '%addon', '%anaconda'} | SCRIPT_SECTIONS
+
+# Commands of current pykickstart and the minimum number of positional/option
+# arguments they need. Anything else is reported as a warning: Anaconda
+# decides whether it understands a newer command.
+KNOWN_COMMANDS = {
+    'auth': 0, 'authconfig': 0, 'authselect': 0, 'autopart': 0, 'autostep': 0,
+    'bootc': 1, 'bootloader': 0, 'btrfs': 1, 'cdrom': 0, 'clearpart': 0,
+    'cmdline': 0, 'driverdisk': 1, 'eula': 0, 'fcoe': 1, 'firewall': 0,
+    'firstboot': 0, 'graphical': 0, 'group': 1, 'halt': 0, 'harddrive': 1,
+    'hmc': 0, 'ignoredisk': 1, 'install': 0, 'iscsi': 1, 'iscsiname': 1,
+    'keyboard': 1, 'lang': 1, 'liveimg': 1, 'logging': 0, 'logvol': 1,
+    'mediacheck': 0, 'module': 1, 'mount': 2, 'network': 0, 'nfs': 1,
+    'nvdimm': 1, 'ostreecontainer': 1, 'ostreesetup': 1, 'part': 1,
+    'partition': 1, 'poweroff': 0, 'raid': 1, 'realm': 1, 'reboot': 0,
+    'repo': 1, 'reqpart': 0, 'rescue': 0, 'rhsm': 0, 'rootpw': 1, 'selinux': 0,
+    'services': 1, 'shutdown': 0, 'skipx': 0, 'snapshot': 1, 'sshkey': 1,
+    'sshpw': 1, 'syspurpose': 0, 'text': 0, 'timesource': 1, 'timezone': 1,
+    'updates': 0, 'url': 1, 'user': 1, 'vnc': 0, 'volgroup': 1, 'xconfig': 0,
+    'zerombr': 0, 'zfcp': 1, 'zipl': 0,
+}
+
+# Commands that may only appear once in a kickstart
+SINGLE_COMMANDS = {'autopart', 'bootloader', 'clearpart', 'keyboard', 'lang',
+                   'rootpw', 'selinux', 'timezone', 'url', 'liveimg', 'zerombr'}
+
+MAX_INCLUDE_DEPTH = 8
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class KickstartMessage:
+    """An error or warning tied to a file and line."""
+
+    __slots__ = ('path', 'line', 'message')
+
+    def __init__(self, path, line, message):
+        self.path = path
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return f"{os.path.basename(self.path)}:{self.line}: {self.message}"
+
+
+class KickstartCommand:
+    __slots__ = ('name', 'args', 'path', 'line')
+
+    def __init__(self, name, args, path, line):
+        self.name = name
+        self.args = args
+        self.path = path
+        self.line = line
+
+
+class KickstartSection:
+    __slots__ = ('name', 'args', 'body', 'path', 'line')
+
+    def __init__(self, name, args, path, line):
+        self.name = name
+        self.args = args
+        self.body = []
+        self.path = path
+        self.line = line
+
+
+class KickstartDocument:
+    """Parsed kickstart: commands, %packages and script sections."""
+
+    def __init__(self, path):
+        self.path = path
+        self.commands = []
+        self.sections = []
+        self.errors = []
+        self.warnings = []
+        # (path, sha256) of every file read, used to validate the cache
+        self.sources = []
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    def get_command(self, name):
+        for command in reversed(self.commands):
+            if command.name == name:
+                return command
+        return None
+
+    def get_sections(self, name):
+        return [section for section in self.sections if section.name == name]
+
+    def _option(self, command, option, default=None):
+        return self._option_from_list(command.args, option, default)
+
+    def _positional(self, command):
+        return [arg for arg in command.args if not arg.startswith('--')]
+
+    def to_settings(self, hasher=None):
+        """Returns the subset of settings the installer's config understands.
+
+        With an available PasswordHasher, plaintext rootpw and user passwords
+        are replaced by their crypt(3) hashes. Hashing is deliberately slow,
+        so only pass one from a worker thread.
+        """
+        settings = {}
+        lang = self.get_command('lang')
+        if lang and self._positional(lang):
+            settings['language'] = self._positional(lang)[0]
+        keyboard = self.get_command('keyboard')
+        if keyboard:
+            layouts = self._option(keyboard, 'xlayouts')
+            positional = self._positional(keyboard)
+            if layouts:
+                settings['keyboard'] = layouts.split(',')[0].strip("'\"")
+            elif positional:
+                settings['keyboard'] = positional[0]
+        timezone = self.get_command('timezone')
+        if timezone and self._positional(timezone):
+            settings['timezone'] = {
+                'timezone': self._positional(timezone)[0],
+                'ntp_enabled': '--nontp' not in timezone.args,
+            }
+        rootpw = self.get_command('rootpw')
+        if rootpw:
+            settings['root'] = {
+                'locked': '--lock' in rootpw.args,
+                'is_crypted': '--iscrypted' in rootpw.args,
+                'password': (self._positional(rootpw) or [None])[0],
+            }
+        users = [c for c in self.commands if c.name == 'user']
+        if users:
+            settings['users'] = [{
+                'username': self._option(user, 'name'),
+                'groups': (self._option(user, 'groups') or '').split(',') if self._option(user, 'groups') else [],
+                'password': self._option(user, 'password'),
+                'is_crypted': '--iscrypted' in user.args,
+            } for user in users]
+        clearpart = self.get_command('clearpart')
+        ignoredisk = self.get_command('ignoredisk')
+        if clearpart or ignoredisk or self.get_command('autopart'):
+            drives = self._option(ignoredisk, 'only-use') if ignoredisk else None
+            settings['storage'] = {
+                'autopart': self.get_command('autopart') is not None,
+                'clear_all': bool(clearpart and '--all' in clearpart.args),
+                'disks': drives.split(',') if drives else [],
+            }
+        packages = self.get_sections('%packages')
+        if packages:
+            included, excluded = [], []
+            for section in packages:
+                for _, line in section.body:
+                    entry = line.strip()
+                    if not entry or entry.startswith('#'):
+                        continue
+                    (excluded if entry.startswith('-') else included).append(entry.lstrip('-'))
+            settings['packages'] = {'include': included, 'exclude': excluded}
+        posts = self.get_sections('%post')
+        if posts:
+            settings['post_scripts'] = [{
+                'interpreter': self._option_from_list(section.args, 'interpreter', '/bin/sh'),
+                'nochroot': '--nochroot' in section.args,
+                'erroronfail': '--erroronfail' in section.args,
+                'log': self._option_from_list(section.args, 'log'),
+                'script': ''.join(line for _, line in section.body),
+            } for section in posts]
+        for name in ('reboot', 'poweroff', 'halt', 'shutdown'):
+            command = self.get_command(name)
+            if command:
+                settings['finish_action'] = name
+                if name == 'reboot' and '--kexec' in command.args:
+                    settings['kexec'] = True
+        if hasher is not None and hasher.available:
+            for account in [settings.get('root')] + settings.get('users', []):
+                if account and account['password'] and not account['is_crypted']:
+                    account['password'] = hasher.hash_password(account['password'])
+                    account['is_crypted'] = True
+        return settings
+
+    @staticmethod
+    def _option_from_list(args, option, default=None):
+        for i, arg in enumerate(args):
+            if arg.startswith(f"--{option}="):
+                return arg.split('=', 1)[1]
+            if arg == f"--{option}" and i + 1 < len(args):
+                return args[i + 1]
+        return default
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class KickstartParser:
+    """Line-by-line kickstart parser with %include resolution.
+
+    Files are streamed rather than read whole. Includes are resolved
+    relative to the including file; an include that does not exist yet is
+    only a warning when a %pre script could be generating it.
+    """
+
+    def __init__(self, path):
+        self.document = KickstartDocument(path)
+        self._seen_single = {}
+        self._section = None
+        self._include_stack = []
+        self._missing_includes = []
+
+    def parse(self):
+        self._parse_file(self.document.path, depth=0)
+        if self._section is not None:
+            self._error(self._section.path, self._section.line, f"{self._section.name} section is missing %end")
+            self._section = None
+        # %pre usually comes last in the file but runs first, so decide at the end
+        has_pre = bool(self.document.get_sections('%pre'))
+        for path, line_no, target in self._missing_includes:
+            if has_pre:
+                self._warning(path, line_no, f"{target} not found; expected to be created by %pre")
+            else:
+                self._error(path, line_no, f"included file {target} not found")
+        return self.document
+
+    def _error(self, path, line, message):
+        self.document.errors.append(KickstartMessage(path, line, message))
+
+    def _warning(self, path, line, message):
+        self.document.warnings.append(KickstartMessage(path, line, message))
+
+    def _parse_file(self, path, depth):
+        real_path = os.path.realpath(path)
+        if real_path in self._include_stack:
+            self._error(path, 0, "recursive %include")
+            return
+        self._include_stack.append(real_path)
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for line_no, raw in enumerate(f, start=1):
+                    digest.update(raw)
+                    self._parse_line(raw.decode('utf-8', errors='replace'), path, line_no, depth)
+        finally:
+            self._include_stack.pop()
+        self.document.sources.append((path, digest.hexdigest()))
+
+    def _parse_line(self, line, path, line_no, depth):
+        stripped = line.strip()
+
+        # Inside a section everything up to %end is section data
+        if self._section is not None:
+            if stripped == '%end':
+                self.document.sections.append(self._section)
+                self._section = None
+            elif stripped.startswith('%') and stripped.split()[0] in DATA_SECTIONS:
+                self._error(path, line_no, f"{stripped.split()[0]} starts before {self._section.name} has ended")
+            else:
+                self._section.body.append((line_no, line))
+            return
+
+        if not stripped or stripped.startswith('#'):
+            return
+
+        try:
+            tokens = shlex.split(stripped, comments=True)
+        except ValueError as e:
+            self._error(path, line_no, f"could not parse line: {e}")
+            return
+        if not tokens:
+            return
+        name, args = tokens[0], tokens[1:]
+
+        if name in ('%include', '%ksappend'):
+            self._include(args, path, line_no, depth, name)
+        elif name in DATA_SECTIONS:
+            self._section = KickstartSection(name, args, path, line_no)
+        elif name == '%end':
+            self._error(path, line_no, "%end without a matching section")
+        elif name.startswith('%'):
+            self._error(path, line_no, f"unknown section {name}")
+        else:
+            self._command(name, args, path, line_no)
+
+    def _include(self, args, path, line_no, depth, directive):
+        if len(args) != 1:
+            self._error(path, line_no, f"{directive} takes exactly one path")
+            return
+        if depth >= MAX_INCLUDE_DEPTH:
+            self._error(path, line_no, f"{directive} nested too deeply")
+            return
+        target = args[0]
+        if not os.path.isabs(target):
+            target = os.path.join(os.path.dirname(path), target)
+        if not os.path.exists(target):
+            self._missing_includes.append((path, line_no, args[0]))
+            return
+        self._parse_file(target, depth + 1)
+
+    def _command(self, name, args, path, line_no):
+        if name not in KNOWN_COMMANDS:
+            self._warning(path, line_no, f"unknown command '{name}', passed on unchecked")
+        elif len(args) < KNOWN_COMMANDS[name]:
+            self._error(path, line_no, f"'{name}' requires an argument")
+            return
+        if name in SINGLE_COMMANDS:
+            if name in self._seen_single:
+                self._warning(path, line_no, f"'{name}' overrides line {self._seen_single[name]}")
+            self._seen_single[name] = line_no
+        self.document.commands.append(KickstartCommand(name, args, path, line_no))
+
+
+# Parsed documents keyed by the sha256 of the top-level file
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def parse_kickstart(path):
+    """Parses a kickstart file, reusing the cached result if no source changed."""
+    key = _file_sha256(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        try:
+            if all(os.path.exists(p) and _file_sha256(p) == h for p, h in cached.sources):
+                print(f"Using cached kickstart parse for {path}")
+                return cached
+        except OSError:
+            pass
+
+    document = KickstartParser(path).parse()
+    with _cache_lock:
+        _cache[key] = document
+    print(f"Parsed kickstart {path}: {len(document.commands)} commands, "
+          f"{len(document.sections)} sections, {len(document.errors)} errors")
+    return document
+
+
+def parse_kickstart_async(path, callback):
+    """Parses on a worker thread; callback(document, error) runs on the worker."""
+    def worker():
+        try:
+            callback(parse_kickstart(path), None)
+        except OSError as e:
+            callback(None, e)
+
+    thread = threading.Thread(target=worker, name="kickstart-parser", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,326 @@
+import errno
+import fcntl
+import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Live root and the target mount used by Anaconda
+LIVE_ROOT_PATH = '/run/rootfsbase'
+TARGET_ROOT_PATH = '/mnt/sysroot'
+
+# Directories that are never copied from a running live system
+EXCLUDED_PATHS = {'dev', 'proc', 'sys', 'run', 'tmp', 'mnt', 'media', 'var/tmp', 'lost+found'}
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int)
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+# Files below this size are batched into a single task
+SMALL_FILE_SIZE = 64 * 1024
+SMALL_FILE_BATCH = 256
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# The pread/pwrite fallback holds a chunk in memory per worker
+PREAD_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 2) * 2)
+
+
+class CopyEntry:
+    __slots__ = ('rel_path', 'st')
+
+    def __init__(self, rel_path, st):
+        self.rel_path = rel_path
+        self.st = st
+
+
+class CopyStats:
+    """Counters reported while copying and returned at the end."""
+
+    __slots__ = ('total_bytes', 'done_bytes', 'copied_bytes', 'files', 'directories', 'hardlinks',
+                 'reflinked', 'errors', 'elapsed')
+
+    def __init__(self):
+        self.total_bytes = 0
+        # Progress: includes holes and reflinked files, which are not written
+        self.done_bytes = 0
+        # Data actually written to the target
+        self.copied_bytes = 0
+        self.files = 0
+        self.directories = 0
+        self.hardlinks = 0
+        self.reflinked = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        return self.copied_bytes / self.elapsed if self.elapsed else 0.0
+
+
+class LiveImageCopier:
+    """Copies a live root to the target, preserving everything rsync -aHAXS does.
+
+    The source tree is scanned by parallel directory workers. File data is
+    cloned with FICLONE where source and target share a filesystem, and
+    otherwise moved with copy_file_range() over the data segments only, so
+    holes stay holes. Hard links, ownership, modes, timestamps and all
+    extended attributes (which carry POSIX ACLs and SELinux labels) are
+    preserved. Small files are copied in batches to keep per-task overhead
+    down.
+    """
+
+    def __init__(self, source=LIVE_ROOT_PATH, target=TARGET_ROOT_PATH, workers=DEFAULT_WORKERS,
+                 progress_callback=None, cancel_event=None, excluded=EXCLUDED_PATHS):
+        self.source = source
+        self.target = target
+        self.workers = workers
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event or threading.Event()
+        self.excluded = set(excluded)
+        self.stats = CopyStats()
+        self._lock = threading.Lock()
+        self._reflink_supported = True
+
+    # --- Scanning ---
+
+    def _scan_directory(self, rel_dir):
+        entries, subdirs = [], []
+        with os.scandir(os.path.join(self.source, rel_dir)) as it:
+            for dirent in it:
+                rel_path = os.path.join(rel_dir, dirent.name) if rel_dir else dirent.name
+                if rel_path in self.excluded:
+                    # Keep the mount point itself, but not its contents
+                    entries.append(CopyEntry(rel_path, dirent.stat(follow_symlinks=False)))
+                    continue
+                st = dirent.stat(follow_symlinks=False)
+                entries.append(CopyEntry(rel_path, st))
+                if stat.S_ISDIR(st.st_mode):
+                    subdirs.append(rel_path)
+        return entries, subdirs
+
+    def scan(self, pool):
+        """Walks the source tree breadth-first with one task per directory."""
+        entries = []
+        pending = {pool.submit(self._scan_directory, '')}
+        while pending:
+            future = next(as_completed(pending))
+            pending.remove(future)
+            try:
+                dir_entries, subdirs = future.result()
+            except OSError as e:
+                self.stats.errors.append(f"scan: {e}")
+                continue
+            entries.extend(dir_entries)
+            for subdir in subdirs:
+                if self.cancel_event.is_set():
+                    break
+                pending.add(pool.submit(self._scan_directory, subdir))
+        return entries
+
+    # --- Data ---
+
+    def _report(self, nbytes, written=True):
+        with self._lock:
+            self.stats.done_bytes += nbytes
+            if written:
+                self.stats.copied_bytes += nbytes
+            done = self.stats.done_bytes
+        if self.progress_callback:
+            self.progress_callback(done, self.stats.total_bytes)
+
+    def _copy_range(self, src_fd, dst_fd, offset, length):
+        end = offset + length
+        while offset < end:
+            if self.cancel_event.is_set():
+                raise InterruptedError("copy cancelled")
+            count = min(COPY_CHUNK_SIZE, end - offset)
+            try:
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                # Kernel/filesystem cannot do it; fall back to pread/pwrite
+                data = os.pread(src_fd, min(count, PREAD_CHUNK_SIZE), offset)
+                copied = os.pwrite(dst_fd, data, offset) if data else 0
+            if copied == 0:
+                break
+            offset += copied
+            self._report(copied)
+
+    def _copy_data(self, src_fd, dst_fd, size):
+        if self._reflink_supported:
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                with self._lock:
+                    self.stats.reflinked += 1
+                self._report(size, written=False)
+                return
+            except OSError as e:
+                if e.errno in (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL):
+                    self._reflink_supported = False
+                else:
+                    raise
+
+        # Copy only the data segments; the final truncate recreates trailing holes
+        offset = 0
+        while offset < size:
+            try:
+                data_start = os.lseek(src_fd, offset, SEEK_DATA)
+                data_end = min(os.lseek(src_fd, data_start, SEEK_HOLE), size)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break # Only a hole remains
+                # No SEEK_DATA support: treat the rest as data
+                data_start, data_end = offset, size
+            self._copy_range(src_fd, dst_fd, data_start, data_end - data_start)
+            self._report(data_start - offset, written=False) # Holes count as done
+            offset = data_end
+        if offset < size:
+            self._report(size - offset, written=False)
+        os.ftruncate(dst_fd, size)
+
+    # --- Metadata ---
+
+    def _copy_xattrs(self, src, dst):
+        try:
+            names = os.listxattr(src, follow_symlinks=False)
+        except OSError as e:
+            if e.errno in (errno.ENOTSUP, errno.ENODATA):
+                return
+            raise
+        for name in names:
+            try:
+                os.setxattr(dst, name, os.getxattr(src, name, follow_symlinks=False), follow_symlinks=False)
+            except OSError as e:
+                # e.g. trusted.* without CAP_SYS_ADMIN, or security.* unsupported on target
+                if e.errno not in (errno.EPERM, errno.ENOTSUP):
+                    raise
+
+    def _copy_metadata(self, entry, dst):
+        st = entry.st
+        src = os.path.join(self.source, entry.rel_path)
+        is_link = stat.S_ISLNK(st.st_mode)
+        try:
+            os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+        except PermissionError:
+            pass # Unprivileged runs (benchmarks) keep the current owner
+        self._copy_xattrs(src, dst)
+        if not is_link:
+            # After chown, which clears setuid/setgid bits
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+    # --- Entries ---
+
+    def _copy_file(self, entry):
+        src = os.path.join(self.source, entry.rel_path)
+        dst = os.path.join(self.target, entry.rel_path)
+        src_fd = os.open(src, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+            try:
+                self._copy_data(src_fd, dst_fd, entry.st.st_size)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+        self._copy_metadata(entry, dst)
+
+    def _create_special(self, entry):
+        st = entry.st
+        src = os.path.join(self.source, entry.rel_path)
+        dst = os.path.join(self.target, entry.rel_path)
+        if stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(src), dst)
+        elif stat.S_ISFIFO(st.st_mode):
+            os.mkfifo(dst, stat.S_IMODE(st.st_mode))
+        elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+            os.mknod(dst, st.st_mode, st.st_rdev)
+        else:
+            return # Sockets are recreated by their owners
+        self._copy_metadata(entry, dst)
+
+    def _copy_batch(self, batch):
+        for entry in batch:
+            if self.cancel_event.is_set():
+                return
+            try:
+                if stat.S_ISREG(entry.st.st_mode):
+                    self._copy_file(entry)
+                else:
+                    self._create_special(entry)
+            except FileExistsError:
+                pass
+            except OSError as e:
+                with self._lock:
+                    self.stats.errors.append(f"{entry.rel_path}: {e}")
+
+    def run(self):
+        """Copies the tree and returns CopyStats. Raises InterruptedError if cancelled."""
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="live-copy") as pool:
+            entries = self.scan(pool)
+            self.stats.total_bytes = sum(e.st.st_size for e in entries if stat.S_ISREG(e.st.st_mode))
+
+            directories = sorted((e for e in entries if stat.S_ISDIR(e.st.st_mode)), key=lambda e: e.rel_path)
+            os.makedirs(self.target, exist_ok=True)
+            for entry in directories:
+                os.makedirs(os.path.join(self.target, entry.rel_path), mode=0o700, exist_ok=True)
+            self.stats.directories = len(directories)
+
+            # The first path of each hard-linked inode is copied, the others linked afterwards
+            seen_inodes = {}
+            links = []
+            small, futures = [], []
+            for entry in entries:
+                st = entry.st
+                if stat.S_ISDIR(st.st_mode):
+                    continue
+                if st.st_nlink > 1 and not stat.S_ISLNK(st.st_mode):
+                    key = (st.st_dev, st.st_ino)
+                    if key in seen_inodes:
+                        links.append((seen_inodes[key], entry.rel_path))
+                        self.stats.total_bytes -= st.st_size if stat.S_ISREG(st.st_mode) else 0
+                        continue
+                    seen_inodes[key] = entry.rel_path
+                self.stats.files += 1
+                if stat.S_ISREG(st.st_mode) and st.st_size > SMALL_FILE_SIZE:
+                    futures.append(pool.submit(self._copy_batch, [entry]))
+                else:
+                    small.append(entry)
+                    if len(small) >= SMALL_FILE_BATCH:
+                        futures.append(pool.submit(self._copy_batch, small))
+                        small = []
+            if small:
+                futures.append(pool.submit(self._copy_batch, small))
+            for future in as_completed(futures):
+                future.result()
+
+        if self.cancel_event.is_set():
+            raise InterruptedError("live image copy cancelled")
+
+        for first, other in links:
+            link_path = os.path.join(self.target, other)
+            try:
+                try:
+                    os.link(os.path.join(self.target, first), link_path)
+                except FileExistsError:
+                    # Left by an earlier, interrupted attempt
+                    os.unlink(link_path)
+                    os.link(os.path.join(self.target, first), link_path)
+                self.stats.hardlinks += 1
+            except OSError as e:
+                self.stats.errors.append(f"{other}: {e}")
+
+        # Directory metadata last, so copying files does not bump their mtimes
+        for entry in reversed(directories):
+            try:
+                self._copy_metadata(entry, os.path.join(self.target, entry.rel_path))
+            except OSError as e:
+                self.stats.errors.append(f"{entry.rel_path}: {e}")
+
+        self.stats.elapsed = time.monotonic() - start
+        print(f"Copied {self.stats.files} files ({self.stats.copied_bytes} bytes) in {self.stats.elapsed:.1f}s, "
+              f"{self.stats.hardlinks} hard links, {self.stats.reflinked} reflinked, {len(self.stats.errors)} errors")
+        return self.stats
@@ -0,0 +1,216 @@
+import gettext
+import mmap
+import struct
+
+# Locale sources, in order of preference
+SUPPORTED_LOCALES_PATH = '/usr/share/i18n/SUPPORTED'
+LOCALE_DIR = '/usr/share/locale'
+TEXT_DOMAIN = 'centrio-installer'
+# Longest substring indexed for search; longer terms are confirmed per candidate
+SEARCH_GRAM = 3
+
+# Used when neither langtable nor SUPPORTED are available (e.g. minimal live images)
+FALLBACK_LOCALES = ["en_US.UTF-8", "es_ES.UTF-8", "fr_FR.UTF-8"]
+
+# Native language names for the most common languages; langtable covers the rest
+NATIVE_NAMES = {
+    "ar": "العربية", "bg": "Български", "ca": "Català", "cs": "Čeština",
+    "da": "Dansk", "de": "Deutsch", "el": "Ελληνικά", "en": "English",
+    "es": "Español", "et": "Eesti", "fi": "Suomi", "fr": "Français",
+    "he": "עברית", "hi": "हिन्दी", "hr": "Hrvatski", "hu": "Magyar",
+    "id": "Bahasa Indonesia", "it": "Italiano", "ja": "日本語", "ko": "한국어",
+    "lt": "Lietuvių", "lv": "Latviešu", "nb": "Norsk bokmål", "nl": "Nederlands",
+    "pl": "Polski", "pt": "Português", "ro": "Română", "ru": "Русский",
+    "sk": "Slovenčina", "sl": "Slovenščina", "sr": "Српски", "sv": "Svenska",
+    "th": "ไทย", "tr": "Türkçe", "uk": "Українська", "vi": "Tiếng Việt",
+    "zh": "中文",
+}
+
+try:
+    import langtable
+except ImportError:
+    langtable = None
+
+
+class LocaleEntry:
+    """A single installable locale."""
+
+    __slots__ = ('code', 'language', 'territory', 'native_name', 'search_key')
+
+    def __init__(self, code, native_name):
+        self.code = code
+        base = code.split('.', 1)[0].split('@', 1)[0]
+        self.language, _, self.territory = base.partition('_')
+        self.native_name = native_name
+        self.search_key = f"{code} {native_name}".lower()
+
+    @property
+    def display_name(self):
+        if self.territory:
+            return f"{self.native_name} ({self.territory})"
+        return self.native_name
+
+
+class LocaleCatalog:
+    """Indexed catalog of the locales offered on the welcome page.
+
+    Entries are kept in display order; `index_of` and `search` use prebuilt
+    dictionaries so neither has to scan the whole catalog per keystroke.
+    Search terms match anywhere in the code or native name: every substring
+    of up to SEARCH_GRAM characters is indexed, and longer terms are looked
+    up by their rarest gram and then confirmed.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._by_code = {entry.code: i for i, entry in enumerate(entries)}
+        self._by_language = {}
+        self._by_gram = {}
+        for i, entry in enumerate(entries):
+            self._by_language.setdefault(entry.language, i)
+            key = entry.search_key
+            grams = {key[start:start + length] for length in range(1, SEARCH_GRAM + 1)
+                     for start in range(len(key) - length + 1)}
+            for gram in grams:
+                self._by_gram.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def index_of(self, code):
+        """Returns the index of a locale code, falling back to its language."""
+        if not code:
+            return None
+        if code in self._by_code:
+            return self._by_code[code]
+        if f"{code}.UTF-8" in self._by_code:
+            return self._by_code[f"{code}.UTF-8"]
+        language = code.split('.', 1)[0].split('_', 1)[0]
+        return self._by_language.get(language)
+
+    def search(self, term):
+        """Returns the indices, in display order, of entries matching the search term."""
+        term = (term or "").strip().lower()
+        if not term:
+            return list(range(len(self.entries)))
+        if len(term) <= SEARCH_GRAM:
+            return self._by_gram.get(term, [])
+        candidates = min((self._by_gram.get(term[start:start + SEARCH_GRAM], [])
+                          for start in range(len(term) - SEARCH_GRAM + 1)), key=len)
+        return [i for i in candidates if term in self.entries[i].search_key]
+
+
+def _read_supported_locales():
+    """Reads UTF-8 locale codes from glibc's SUPPORTED list."""
+    codes = []
+    try:
+        with open(SUPPORTED_LOCALES_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == 'UTF-8' and parts[0].endswith('.UTF-8'):
+                    codes.append(parts[0])
+    except FileNotFoundError:
+        print(f"Warning: {SUPPORTED_LOCALES_PATH} not found.")
+    except OSError as e:
+        print(f"Warning: Could not read {SUPPORTED_LOCALES_PATH}: {e}")
+    return codes
+
+
+def _native_name(code):
+    language = code.split('_', 1)[0].split('.', 1)[0]
+    if langtable:
+        try:
+            name = langtable.language_name(languageId=language)
+            if name:
+                return name
+        except Exception as e:
+            print(f"Warning: langtable lookup failed for {code}: {e}")
+    return NATIVE_NAMES.get(language, language)
+
+
+_catalog = None
+
+
+def get_locale_catalog():
+    """Builds the locale catalog once and returns the cached instance."""
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+
+    codes = _read_supported_locales() or list(FALLBACK_LOCALES)
+    entries = [LocaleEntry(code, _native_name(code)) for code in codes]
+    # English first since it is the default, everything else by native name
+    entries.sort(key=lambda e: (e.language != 'en', e.native_name.lower(), e.code))
+    _catalog = LocaleCatalog(entries)
+    print(f"Loaded {len(_catalog)} locales into the catalog.")
+    return _catalog
+
+
+class MmapTranslations(gettext.NullTranslations):
+    """gettext catalog that looks messages up directly in a mapped .mo file.
+
+    The .mo format stores its original strings sorted, so a binary search over
+    the mapped tables is enough; nothing is parsed up front and untouched
+    pages are never read from disk.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        with open(path, 'rb') as f:
+            self._mo = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = struct.unpack_from('<I', self._mo, 0)[0]
+        if magic == gettext.GNUTranslations.LE_MAGIC:
+            self._endian = '<'
+        elif magic == gettext.GNUTranslations.BE_MAGIC:
+            self._endian = '>'
+        else:
+            self._mo.close()
+            raise OSError(f"Bad magic number in {path}")
+        self._count, self._orig_offset, self._trans_offset = struct.unpack_from(
+            f'{self._endian}3I', self._mo, 8)
+        self._cache = {}
+
+    def _string_at(self, table_offset, index):
+        length, offset = struct.unpack_from(f'{self._endian}2I', self._mo, table_offset + index * 8)
+        return self._mo[offset:offset + length]
+
+    def _lookup(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            original = self._string_at(self._orig_offset, mid)
+            if original < key:
+                lo = mid + 1
+            elif original > key:
+                hi = mid
+            else:
+                return self._string_at(self._trans_offset, mid)
+        return None
+
+    def gettext(self, message):
+        if message in self._cache:
+            return self._cache[message]
+        translated = self._lookup(message.encode('utf-8'))
+        result = translated.decode('utf-8') if translated else message
+        self._cache[message] = result
+        return result
+
+
+def load_translations(locale_code, domain=TEXT_DOMAIN, localedir=LOCALE_DIR):
+    """Loads the installer's message catalog for one locale only.
+
+    Returns NullTranslations when no catalog exists for the locale.
+    """
+    mo_path = gettext.find(domain, localedir, languages=[locale_code])
+    if not mo_path:
+        return gettext.NullTranslations()
+    try:
+        translations = MmapTranslations(mo_path)
+        print(f"Loaded translations for {locale_code} from {mo_path}")
+        return translations
+    except (OSError, struct.error) as e:
+        print(f"Warning: Could not load translations from {mo_path}: {e}")
+        return gettext.NullTranslations()
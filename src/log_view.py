@@ -0,0 +1,309 @@
+import gi
+gi.require_version('Gtk', '4.0')
+from gi.repository import Gtk, Gio, GLib, GObject
+import os
+import threading
+
+from src.post_install import POST_INSTALL_LOG_PATH
+from src.finalize import FINALIZE_LOG_PATH
+
+# Logs tailed into the installation log pane: Anaconda's, then our own
+INSTALL_LOG_PATHS = [
+    '/tmp/anaconda.log',
+    '/tmp/program.log',
+    '/tmp/packaging.log',
+    '/tmp/storage.log',
+    POST_INSTALL_LOG_PATH,
+    FINALIZE_LOG_PATH,
+]
+LOG_BUFFER_LINES = 100000
+MAX_LINE_LENGTH = 2000
+TAIL_INTERVAL = 0.5
+# Bytes read from a log at a time, so a large backlog is not loaded at once
+TAIL_READ_CHUNK = 1024 * 1024
+# Lines re-filtered per idle callback when the search or level changes
+FILTER_CHUNK = 5000
+
+LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR = range(4)
+LEVEL_KEYWORDS = (
+    (LEVEL_ERROR, ('CRITICAL', 'ERROR', 'Traceback', 'failed')),
+    (LEVEL_WARNING, ('WARNING', 'WARN', 'Warning')),
+    (LEVEL_DEBUG, ('DEBUG',)),
+)
+# Minimum level for each entry of the level filter drop-down
+LEVEL_FILTERS = [LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR]
+
+
+def classify_level(text):
+    """Guesses a line's level from the keywords Anaconda and most tools log."""
+    for level, keywords in LEVEL_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return level
+    return LEVEL_INFO
+
+
+class LogBuffer:
+    """Fixed-size ring of log lines addressed by an increasing sequence number."""
+
+    def __init__(self, capacity=LOG_BUFFER_LINES):
+        self.capacity = capacity
+        self._lines = [None] * capacity
+        self._lock = threading.Lock()
+        # Sequence number of the next line; the oldest kept is next_seq - count
+        self.next_seq = 0
+        self.count = 0
+
+    def append(self, source, text):
+        if len(text) > MAX_LINE_LENGTH:
+            text = text[:MAX_LINE_LENGTH] + '…'
+        entry = (classify_level(text), f"[{source}] {text}")
+        with self._lock:
+            self._lines[self.next_seq % self.capacity] = entry
+            self.next_seq += 1
+            self.count = min(self.count + 1, self.capacity)
+
+    @property
+    def first_seq(self):
+        with self._lock:
+            return self.next_seq - self.count
+
+    def bounds(self):
+        """Returns (first_seq, next_seq) of the lines currently kept."""
+        with self._lock:
+            return self.next_seq - self.count, self.next_seq
+
+    def get(self, seq):
+        """Returns (level, text) for seq, or None once it has been overwritten."""
+        with self._lock:
+            if seq < self.next_seq - self.count or seq >= self.next_seq:
+                return None
+            return self._lines[seq % self.capacity]
+
+
+class LogTailer:
+    """Follows log files on a background thread, appending new lines to a LogBuffer."""
+
+    def __init__(self, buffer, paths=INSTALL_LOG_PATHS, on_lines=None):
+        self.buffer = buffer
+        self.paths = paths
+        self.on_lines = on_lines
+        self._offsets = {}
+        self._partial = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-tailer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _read_new(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 0
+        offset = self._offsets.get(path, 0)
+        if size < offset:
+            offset = 0 # Truncated or rotated
+        if size == offset:
+            return 0
+        source = os.path.splitext(os.path.basename(path))[0]
+        added = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while offset < size:
+                chunk = f.read(min(TAIL_READ_CHUNK, size - offset))
+                if not chunk:
+                    break
+                offset += len(chunk)
+                self._offsets[path] = offset
+                lines = (self._partial.pop(path, b'') + chunk).split(b'\n')
+                if lines[-1]:
+                    self._partial[path] = lines[-1] # Finish the line with the next chunk
+                for line in lines[:-1]:
+                    self.buffer.append(source, line.decode('utf-8', errors='replace').rstrip('\r'))
+                added += len(lines) - 1
+        return added
+
+    def _run(self):
+        while True:
+            added = sum(self._read_new(path) for path in self.paths)
+            if added and self.on_lines:
+                self.on_lines()
+            if self._stop.wait(TAIL_INTERVAL):
+                break
+
+
+class LogLine(GObject.Object):
+    __gtype_name__ = 'CentrioLogLine'
+
+    def __init__(self, level, text):
+        super().__init__()
+        self.level = level
+        self.text = text
+
+
+class LogListModel(GObject.Object, Gio.ListModel):
+    """Filtered view of a LogBuffer for Gtk.ListView.
+
+    Only sequence numbers of matching lines are stored; items are created
+    when the view asks for a visible row. New lines are tested against the
+    current filter as they arrive, and a filter change is re-applied over
+    the buffer in chunks from idle callbacks.
+    """
+
+    __gtype_name__ = 'CentrioLogListModel'
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+        self._seqs = []
+        self._synced_seq = 0
+        self._search = ''
+        self._min_level = LEVEL_DEBUG
+        self._rebuild_generation = 0
+        self._rebuilding = False
+
+    def do_get_item_type(self):
+        return LogLine.__gtype__
+
+    def do_get_n_items(self):
+        return len(self._seqs)
+
+    def do_get_item(self, position):
+        if position >= len(self._seqs):
+            return None
+        entry = self.buffer.get(self._seqs[position])
+        if entry is None:
+            return LogLine(LEVEL_INFO, '')
+        return LogLine(*entry)
+
+    def _matches(self, entry):
+        level, text = entry
+        return level >= self._min_level and (not self._search or self._search in text.lower())
+
+    def _drop_overwritten(self):
+        first = self.buffer.first_seq
+        dropped = 0
+        while dropped < len(self._seqs) and self._seqs[dropped] < first:
+            dropped += 1
+        if dropped:
+            del self._seqs[:dropped]
+            self.items_changed(0, dropped, 0)
+
+    def sync(self):
+        """Appends lines added to the buffer since the last sync. Main thread only."""
+        if self._rebuilding:
+            return
+        self._drop_overwritten()
+        first, end = self.buffer.bounds()
+        start = max(self._synced_seq, first)
+        added = []
+        for seq in range(start, end):
+            entry = self.buffer.get(seq)
+            if entry is not None and self._matches(entry):
+                added.append(seq)
+        self._synced_seq = end
+        if added:
+            position = len(self._seqs)
+            self._seqs.extend(added)
+            self.items_changed(position, 0, len(added))
+
+    def set_filter(self, search, min_level):
+        """Changes the filter and re-filters the buffer incrementally."""
+        self._search = search.strip().lower()
+        self._min_level = min_level
+        removed = len(self._seqs)
+        self._seqs = []
+        if removed:
+            self.items_changed(0, removed, 0)
+        self._rebuild_generation += 1
+        self._rebuilding = True
+        first, end = self.buffer.bounds()
+        GLib.idle_add(self._rebuild_chunk, self._rebuild_generation, first, end)
+
+    def _rebuild_chunk(self, generation, seq, end):
+        if generation != self._rebuild_generation:
+            return GLib.SOURCE_REMOVE # Superseded by a newer filter
+        seq = max(seq, self.buffer.first_seq)
+        stop = min(seq + FILTER_CHUNK, end)
+        added = []
+        for current in range(seq, stop):
+            entry = self.buffer.get(current)
+            if entry is not None and self._matches(entry):
+                added.append(current)
+        if added:
+            position = len(self._seqs)
+            self._seqs.extend(added)
+            self.items_changed(position, 0, len(added))
+        if stop < end:
+            GLib.idle_add(self._rebuild_chunk, generation, stop, end)
+            return GLib.SOURCE_REMOVE
+        self._rebuilding = False
+        self._synced_seq = end
+        self.sync()
+        return GLib.SOURCE_REMOVE
+
+
+class LogPaneController:
+    """Wires a LogBuffer, tailer and filter widgets to a Gtk.ListView."""
+
+    def __init__(self, list_view, scrolled_window, search_entry, level_dropdown, ui_updates):
+        self.buffer = LogBuffer()
+        self.model = LogListModel(self.buffer)
+        self._list_view = list_view
+        self._scrolled_window = scrolled_window
+        self._search_entry = search_entry
+        self._level_dropdown = level_dropdown
+        self._ui_updates = ui_updates
+        # Kept across installation attempts so files are not read twice
+        self._tailer = LogTailer(self.buffer, on_lines=self._on_lines)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self._on_setup_row)
+        factory.connect("bind", self._on_bind_row)
+        list_view.set_factory(factory)
+        list_view.set_model(Gtk.NoSelection.new(self.model))
+
+        search_entry.connect("search-changed", self._on_filter_changed)
+        level_dropdown.connect("notify::selected", self._on_filter_changed)
+
+    def _on_setup_row(self, factory, list_item):
+        label = Gtk.Label(xalign=0, selectable=True)
+        label.add_css_class("monospace")
+        list_item.set_child(label)
+
+    def _on_bind_row(self, factory, list_item):
+        line = list_item.get_item()
+        label = list_item.get_child()
+        label.set_label(line.text)
+        for css_class, level in (("error", LEVEL_ERROR), ("warning", LEVEL_WARNING), ("dim-label", LEVEL_DEBUG)):
+            if line.level == level:
+                label.add_css_class(css_class)
+            else:
+                label.remove_css_class(css_class)
+
+    def _on_filter_changed(self, *args):
+        self.model.set_filter(self._search_entry.get_text(), LEVEL_FILTERS[self._level_dropdown.get_selected()])
+
+    def _on_lines(self):
+        # Tailer thread: one model sync per frame however many lines arrived
+        self._ui_updates.call('log-sync', self._sync)
+
+    def _sync(self):
+        adjustment = self._scrolled_window.get_vadjustment()
+        following = adjustment.get_value() >= adjustment.get_upper() - adjustment.get_page_size() - 1
+        self.model.sync()
+        if following and self.model.get_n_items():
+            self._list_view.scroll_to(self.model.get_n_items() - 1, Gtk.ListScrollFlags.NONE, None)
+
+    def start(self):
+        self._tailer.start()
+
+    def stop(self):
+        self._tailer.stop()
@@ -0,0 +1,168 @@
+import ctypes
+import ctypes.util
+import secrets
+import threading
+import time
+
+# Login latency the calibrated cost should produce on this machine
+DEFAULT_TARGET_LATENCY = 0.1  # seconds
+
+YESCRYPT_PREFIX = b'$y$'
+SHA512_PREFIX = b'$6$'
+
+# yescrypt cost is log2-scaled; libxcrypt accepts 1..11 (5 is its default)
+YESCRYPT_MIN_COST = 1
+YESCRYPT_MAX_COST = 11
+SHA512_MIN_ROUNDS = 5000
+SHA512_MAX_ROUNDS = 999999999
+SHA512_PROBE_ROUNDS = 20000
+
+
+def _load_libcrypt():
+    """Loads libxcrypt, which provides yescrypt and crypt_gensalt."""
+    for name in (ctypes.util.find_library('crypt'), 'libcrypt.so.2', 'libcrypt.so.1'):
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name, use_errno=True)
+        except OSError:
+            continue
+        lib.crypt.restype = ctypes.c_char_p
+        lib.crypt.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+        if hasattr(lib, 'crypt_gensalt'):
+            lib.crypt_gensalt.restype = ctypes.c_char_p
+            lib.crypt_gensalt.argtypes = [ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p, ctypes.c_int]
+        return lib
+    return None
+
+
+_libcrypt = _load_libcrypt()
+# crypt() keeps its result in static storage
+_crypt_lock = threading.Lock()
+
+
+def _crypt(password, setting):
+    with _crypt_lock:
+        result = _libcrypt.crypt(password.encode('utf-8'), setting)
+    # libxcrypt returns "*0"/"*1" (or NULL) for unsupported settings
+    if not result or result.startswith(b'*'):
+        raise ValueError(f"crypt() rejected setting {setting[:4]!r}")
+    return result.decode('ascii')
+
+
+def _gensalt(prefix, count):
+    if prefix == SHA512_PREFIX and not hasattr(_libcrypt, 'crypt_gensalt'):
+        salt = secrets.token_urlsafe(12).replace('-', '.').replace('_', '/')[:16]
+        return f"$6$rounds={count}${salt}".encode('ascii')
+    setting = _libcrypt.crypt_gensalt(prefix, count, None, 0)
+    if not setting:
+        raise ValueError(f"crypt_gensalt() does not support {prefix!r}")
+    return setting
+
+
+def _time_hash(prefix, count):
+    setting = _gensalt(prefix, count)
+    start = time.perf_counter()
+    _crypt("calibration-password", setting)
+    return time.perf_counter() - start
+
+
+class PasswordHasher:
+    """Hashes account passwords with a cost calibrated on the running CPU.
+
+    Calibration measures a single hash and picks the highest cost that stays
+    within the target login latency, so the same installer produces strong
+    hashes on servers without making logins slow on low-power kiosks.
+    """
+
+    def __init__(self, target_latency=DEFAULT_TARGET_LATENCY):
+        self.target_latency = target_latency
+        self._method = None
+        self._cost = None
+        self._calibration_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return _libcrypt is not None
+
+    def calibrate(self):
+        """Benchmarks the CPU once and returns the (prefix, cost) to use."""
+        with self._calibration_lock:
+            if self._method is not None:
+                return self._method, self._cost
+            if not self.available:
+                raise RuntimeError("libcrypt is not available, cannot hash passwords")
+
+            try:
+                self._method = YESCRYPT_PREFIX
+                self._cost = self._calibrate_yescrypt()
+            except ValueError as e:
+                print(f"yescrypt not supported ({e}), falling back to SHA-512")
+                self._method = SHA512_PREFIX
+                self._cost = self._calibrate_sha512()
+
+            print(f"Password hashing calibrated: method={self._method.decode()} cost={self._cost} "
+                  f"target={self.target_latency * 1000:.0f} ms")
+            return self._method, self._cost
+
+    def _calibrate_yescrypt(self):
+        # Each cost step doubles the work, so probe upwards until the next step
+        # would exceed the target.
+        cost = YESCRYPT_MIN_COST
+        elapsed = _time_hash(YESCRYPT_PREFIX, cost)
+        while cost < YESCRYPT_MAX_COST and elapsed * 2 <= self.target_latency:
+            cost += 1
+            elapsed = _time_hash(YESCRYPT_PREFIX, cost)
+        if elapsed > self.target_latency and cost > YESCRYPT_MIN_COST:
+            cost -= 1
+        return cost
+
+    def _calibrate_sha512(self):
+        # SHA-512 crypt is linear in its round count
+        elapsed = _time_hash(SHA512_PREFIX, SHA512_PROBE_ROUNDS)
+        rounds = int(SHA512_PROBE_ROUNDS * self.target_latency / max(elapsed, 1e-6))
+        return max(SHA512_MIN_ROUNDS, min(rounds, SHA512_MAX_ROUNDS))
+
+    def hash_password(self, password):
+        """Returns the crypt(3) hash of a password. Blocks for ~target latency."""
+        method, cost = self.calibrate()
+        return _crypt(password, _gensalt(method, cost))
+
+    def hash_passwords_async(self, passwords, callback):
+        """Hashes a dict of name -> password on a worker thread.
+
+        The callback receives (hashes, error) and is invoked from the worker;
+        GTK callers should bounce it to the main loop with GLib.idle_add.
+        None values are passed through unhashed.
+        """
+        def worker():
+            try:
+                hashes = {name: self.hash_password(pw) if pw is not None else None
+                          for name, pw in passwords.items()}
+                callback(hashes, None)
+            except Exception as e:
+                print(f"Password hashing failed: {e}")
+                callback(None, e)
+
+        thread = threading.Thread(target=worker, name="password-hasher", daemon=True)
+        thread.start()
+        return thread
+
+    def calibrate_async(self):
+        """Runs calibration in the background so the first hash is not delayed."""
+        if not self.available:
+            return None
+        thread = threading.Thread(target=self.calibrate, name="password-calibration", daemon=True)
+        thread.start()
+        return thread
+
+
+_hasher = None
+
+
+def get_password_hasher():
+    """Returns the process-wide hasher so calibration happens only once."""
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher()
+    return _hasher
@@ -0,0 +1,205 @@
+import hashlib
+import math
+import mmap
+import re
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Prebuilt filter of common/breached passwords shipped on the install media
+COMMON_PASSWORDS_FILTER_PATH = '/usr/share/centrio-installer/common-passwords.bloom'
+
+BLOOM_MAGIC = b'CBLM'
+BLOOM_VERSION = 1
+# magic, version, number of bits, number of hash functions
+BLOOM_HEADER = struct.Struct('<4sIQI')
+
+KEYBOARD_ROWS = ["qwertyuiop", "asdfghjkl", "zxcvbnm", "1234567890"]
+LEET_MAP = str.maketrans({'0': 'o', '1': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's', '!': 'i'})
+
+SCORE_LABELS = ["Very weak", "Weak", "Fair", "Good", "Strong"]
+
+
+def _bloom_positions(word, num_bits, num_hashes):
+    # Kirsch-Mitzenmacher double hashing over one BLAKE2b digest
+    digest = hashlib.blake2b(word.encode('utf-8'), digest_size=16).digest()
+    h1, h2 = struct.unpack('<QQ', digest)
+    h2 |= 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+class BloomFilter:
+    """Read-only Bloom filter backed by a memory-mapped file.
+
+    Only the header is read at load time; each lookup touches at most
+    `num_hashes` bytes of the mapping.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_bits, self.num_hashes = BLOOM_HEADER.unpack_from(self._map, 0)
+        if magic != BLOOM_MAGIC or version != BLOOM_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {BLOOM_VERSION} password filter")
+        if len(self._map) < BLOOM_HEADER.size + (self.num_bits + 7) // 8:
+            self._map.close()
+            raise ValueError(f"{path} is truncated")
+
+    def __contains__(self, word):
+        base = BLOOM_HEADER.size
+        for pos in _bloom_positions(word, self.num_bits, self.num_hashes):
+            if not self._map[base + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def close(self):
+        self._map.close()
+
+
+def build_bloom_filter(words, path, false_positive_rate=0.001):
+    """Writes a filter for the given words (build-time helper for the media)."""
+    words = [w.strip().lower() for w in words if w.strip()]
+    count = max(len(words), 1)
+    num_bits = max(8, int(-count * math.log(false_positive_rate) / (math.log(2) ** 2)))
+    num_hashes = max(1, round(num_bits / count * math.log(2)))
+    bits = bytearray((num_bits + 7) // 8)
+    for word in words:
+        for pos in _bloom_positions(word, num_bits, num_hashes):
+            bits[pos >> 3] |= 1 << (pos & 7)
+    with open(path, 'wb') as f:
+        f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, BLOOM_VERSION, num_bits, num_hashes))
+        f.write(bits)
+    print(f"Wrote {len(words)} passwords to {path} ({len(bits) // 1024} KiB, {num_hashes} hashes)")
+
+
+_common_passwords = None
+_common_passwords_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_common_passwords():
+    """Maps the common-password filter once; returns None if it is not installed."""
+    global _common_passwords, _common_passwords_loaded
+    with _load_lock:
+        if not _common_passwords_loaded:
+            _common_passwords_loaded = True
+            try:
+                _common_passwords = BloomFilter(COMMON_PASSWORDS_FILTER_PATH)
+                print(f"Loaded common password filter ({_common_passwords.num_bits // 8 // 1024} KiB)")
+            except FileNotFoundError:
+                print(f"Warning: {COMMON_PASSWORDS_FILTER_PATH} not found, dictionary checks disabled.")
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not load common password filter: {e}")
+    return _common_passwords
+
+
+def _has_sequence(password, length=4):
+    lowered = password.lower()
+    for i in range(len(lowered) - length + 1):
+        chunk = lowered[i:i + length]
+        steps = {ord(b) - ord(a) for a, b in zip(chunk, chunk[1:])}
+        if steps in ({1}, {-1}):
+            return True
+        if any(chunk in row or chunk[::-1] in row for row in KEYBOARD_ROWS):
+            return True
+    return False
+
+
+def estimate_strength(password, user_inputs=()):
+    """Scores a password from 0 (very weak) to 4 (strong).
+
+    Returns (score, feedback) where feedback is a short, user-facing hint.
+    """
+    if not password:
+        return 0, "Enter a password"
+
+    lowered = password.lower()
+    common = get_common_passwords()
+    if common is not None and (lowered in common or lowered.translate(LEET_MAP) in common):
+        return 0, "This is a commonly used password"
+
+    for value in user_inputs:
+        value = (value or "").lower()
+        if len(value) >= 3 and value in lowered:
+            return 0, "Do not use your name or username"
+
+    pool = 0
+    if re.search(r'[a-z]', password):
+        pool += 26
+    if re.search(r'[A-Z]', password):
+        pool += 26
+    if re.search(r'[0-9]', password):
+        pool += 10
+    if re.search(r'[^a-zA-Z0-9]', password):
+        pool += 33
+    # Count runs of the same character once
+    effective_length = len(re.sub(r'(.)\1+', r'\1', password))
+    bits = effective_length * math.log2(max(pool, 1))
+
+    feedback = None
+    if _has_sequence(password):
+        bits -= 15
+        feedback = "Avoid sequences like abcd or qwerty"
+    if effective_length < len(password) / 2:
+        feedback = "Avoid repeated characters"
+
+    if bits < 28:
+        score = 0
+    elif bits < 36:
+        score = 1
+    elif bits < 60:
+        score = 2
+    elif bits < 80:
+        score = 3
+    else:
+        score = 4
+
+    if feedback is None:
+        if len(password) < 8:
+            feedback = "Use at least 8 characters"
+        elif score < 3:
+            feedback = "Add more words or mix in symbols and digits"
+        else:
+            feedback = SCORE_LABELS[score]
+    return score, feedback
+
+
+class StrengthChecker:
+    """Runs strength estimates on a single worker thread.
+
+    Only the latest request matters: results of superseded requests are
+    dropped before the callback is invoked.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-strength")
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def submit(self, password, user_inputs, callback):
+        """Estimates in the background; callback(score, feedback) runs on the worker."""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+
+        def worker():
+            if generation != self._generation:
+                return
+            score, feedback = estimate_strength(password, user_inputs)
+            if generation == self._generation:
+                callback(score, feedback)
+
+        self._executor.submit(worker)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(f"Usage: {sys.argv[0]} WORDLIST OUTPUT", file=sys.stderr)
+        sys.exit(1)
+    with open(sys.argv[1], 'r', encoding='utf-8', errors='replace') as wordlist:
+        build_bloom_filter(wordlist, sys.argv[2])
@@ -0,0 +1,243 @@
+import hashlib
+import mmap
+import os
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.live_copy import EXCLUDED_PATHS
+
+# Manifest of the live payload, written when the install media is built
+PAYLOAD_MANIFEST_PATH = '/run/install/repo/payload.manifest'
+MANIFEST_MAGIC = b'CPMF'
+MANIFEST_VERSION = 1
+DIGEST_SIZE = 32 # blake2b-256, the same digests b2sum -l 256 writes
+READ_SIZE = 1024 * 1024
+DEFAULT_WORKERS = min(8, os.cpu_count() or 2)
+
+# magic, version, entry count, total bytes, files, directories, symlinks, hardlink groups, strings offset
+HEADER = struct.Struct('<4sIQQQQQQQ')
+# path offset, path length, size, mode, uid, gid, hardlink group (0 = none), digest
+RECORD = struct.Struct(f'<IIQIIII{DIGEST_SIZE}s')
+EMPTY_DIGEST = bytes(DIGEST_SIZE)
+
+# Per-file cost, in bytes, used to weight progress for trees of many small files
+FILE_OVERHEAD_BYTES = 64 * 1024
+
+
+class ManifestEntry:
+    __slots__ = ('path', 'size', 'mode', 'uid', 'gid', 'link_group', 'digest')
+
+    def __init__(self, path, size, mode, uid, gid, link_group, digest):
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
+        self.link_group = link_group
+        self.digest = digest
+
+    @property
+    def is_file(self):
+        return stat.S_ISREG(self.mode)
+
+    @property
+    def hexdigest(self):
+        return self.digest.hex() if self.digest != EMPTY_DIGEST else None
+
+
+def _hash_file(path):
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb', buffering=0) as f:
+        buffer = bytearray(READ_SIZE)
+        view = memoryview(buffer)
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.digest()
+
+
+def _scan(root, excluded):
+    """Returns [(rel_path, stat)] for the tree, sorted by path."""
+    entries = []
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for dirent in it:
+                rel_path = os.path.join(rel_dir, dirent.name) if rel_dir else dirent.name
+                st = dirent.stat(follow_symlinks=False)
+                entries.append((rel_path, st))
+                # Excluded mount points are recorded but not descended into
+                if stat.S_ISDIR(st.st_mode) and rel_path not in excluded:
+                    pending.append(rel_path)
+    entries.sort(key=lambda entry: os.fsencode(entry[0]))
+    return entries
+
+
+def build_manifest(root, output_path, workers=DEFAULT_WORKERS, excluded=EXCLUDED_PATHS):
+    """Scans root and writes a manifest of every entry with content hashes."""
+    start = time.monotonic()
+    entries = _scan(root, set(excluded))
+
+    # Hard-linked inodes get a group number; only the first path is hashed
+    groups = {}
+    leaders = {}
+    for rel_path, st in entries:
+        if stat.S_ISREG(st.st_mode) and st.st_nlink > 1:
+            key = (st.st_dev, st.st_ino)
+            if key not in groups:
+                groups[key] = len(groups) + 1
+                leaders[key] = rel_path
+    to_hash = [rel_path for rel_path, st in entries if stat.S_ISREG(st.st_mode)
+               and (st.st_nlink == 1 or leaders[(st.st_dev, st.st_ino)] == rel_path)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manifest-hash") as pool:
+        digests = dict(zip(to_hash, pool.map(lambda p: _hash_file(os.path.join(root, p)), to_hash)))
+
+    strings = bytearray()
+    records = bytearray()
+    total_bytes = files = directories = symlinks = 0
+    for rel_path, st in entries:
+        encoded = os.fsencode(rel_path)
+        group = 0
+        digest = EMPTY_DIGEST
+        if stat.S_ISREG(st.st_mode):
+            files += 1
+            key = (st.st_dev, st.st_ino)
+            if st.st_nlink > 1:
+                group = groups[key]
+                digest = digests[leaders[key]]
+                if leaders[key] == rel_path:
+                    total_bytes += st.st_size
+            else:
+                digest = digests[rel_path]
+                total_bytes += st.st_size
+        elif stat.S_ISDIR(st.st_mode):
+            directories += 1
+        elif stat.S_ISLNK(st.st_mode):
+            symlinks += 1
+        records += RECORD.pack(len(strings), len(encoded), st.st_size if stat.S_ISREG(st.st_mode) else 0,
+                               st.st_mode, st.st_uid, st.st_gid, group, digest)
+        strings += encoded
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, len(entries), total_bytes, files,
+                            directories, symlinks, len(groups), HEADER.size + len(records)))
+        f.write(records)
+        f.write(strings)
+    os.replace(tmp_path, output_path)
+    print(f"Wrote {output_path}: {len(entries)} entries, {files} files ({total_bytes} bytes), "
+          f"{len(groups)} hard link groups in {time.monotonic() - start:.1f}s")
+
+
+class PayloadManifest:
+    """Read-only view of a payload manifest.
+
+    The file is mapped rather than read, so opening it costs nothing and
+    entries are decoded only when asked for. Records are sorted by path,
+    which makes find() a binary search.
+    """
+
+    def __init__(self, path=PAYLOAD_MANIFEST_PATH):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{path}: truncated manifest")
+        (magic, version, self.entry_count, self.total_bytes, self.files, self.directories,
+         self.symlinks, self.hardlink_groups, self._strings_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+            raise ValueError(f"{path}: not a version {MANIFEST_VERSION} payload manifest")
+        if self._strings_offset != HEADER.size + self.entry_count * RECORD.size:
+            raise ValueError(f"{path}: corrupt manifest header")
+        self.path = path
+
+    def __len__(self):
+        return self.entry_count
+
+    def _path_at(self, index):
+        offset, length = struct.unpack_from('<II', self._map, HEADER.size + index * RECORD.size)
+        start = self._strings_offset + offset
+        return self._map[start:start + length]
+
+    def entry(self, index):
+        offset, length, size, mode, uid, gid, group, digest = RECORD.unpack_from(
+            self._map, HEADER.size + index * RECORD.size)
+        start = self._strings_offset + offset
+        return ManifestEntry(os.fsdecode(self._map[start:start + length]), size, mode, uid, gid, group, digest)
+
+    def __iter__(self):
+        for index in range(self.entry_count):
+            yield self.entry(index)
+
+    def find(self, rel_path):
+        """Returns the entry for rel_path, or None."""
+        key = os.fsencode(rel_path.lstrip('/'))
+        low, high = 0, self.entry_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._path_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.entry_count and self._path_at(low) == key:
+            return self.entry(low)
+        return None
+
+    def checksum_entries(self):
+        """Returns [(rel_path, hexdigest)] for every regular file, as PayloadVerifier expects."""
+        return [(entry.path, entry.hexdigest) for entry in self if entry.is_file]
+
+    @property
+    def weight(self):
+        """Work units for copying the payload: bytes plus a fixed cost per entry."""
+        return self.total_bytes + self.entry_count * FILE_OVERHEAD_BYTES
+
+    def close(self):
+        self._map.close()
+
+
+def load_payload_manifest(path=PAYLOAD_MANIFEST_PATH):
+    """Returns the media's PayloadManifest, or None if there is none or it is unusable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return PayloadManifest(path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring payload manifest {path}: {e}")
+        return None
+
+
+def _mount_image(image, mount_point):
+    subprocess.run(['mount', '-o', 'loop,ro', image, mount_point], check=True)
+
+
+# Run from the repository root as a module, so the src package resolves
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python3 -m src.payload_manifest LIVE_ROOT|SQUASHFS_IMAGE OUTPUT", file=sys.stderr)
+        sys.exit(1)
+    source, output = sys.argv[1], sys.argv[2]
+    if os.path.isdir(source):
+        build_manifest(source, output)
+        sys.exit(0)
+
+    # Squashfs images are loop-mounted; Fedora-style media nest an ext4 rootfs.img inside
+    mount_points = [tempfile.mkdtemp(prefix='centrio-manifest-')]
+    try:
+        _mount_image(source, mount_points[0])
+        nested = os.path.join(mount_points[0], 'LiveOS', 'rootfs.img')
+        if os.path.exists(nested):
+            mount_points.append(tempfile.mkdtemp(prefix='centrio-manifest-'))
+            _mount_image(nested, mount_points[1])
+        build_manifest(mount_points[-1], output)
+    finally:
+        for mount_point in reversed(mount_points):
+            subprocess.run(['umount', mount_point], check=False)
+            os.rmdir(mount_point)
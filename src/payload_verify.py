@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Checksums of the payload shipped on the install media (b2sum/xxh128sum output format)
+PAYLOAD_CHECKSUMS_PATH = '/run/install/repo/payload.b2sums'
+READ_SIZE = 1024 * 1024
+DEFAULT_WORKERS = min(8, os.cpu_count() or 2)
+
+
+def hasher_for_digest(hex_digest):
+    """Picks the hash function from the digest length of a manifest entry."""
+    if len(hex_digest) == 128:
+        return hashlib.blake2b
+    if len(hex_digest) == 64:
+        return lambda: hashlib.blake2b(digest_size=32)
+    if len(hex_digest) == 32 and xxhash is not None:
+        return xxhash.xxh128
+    if len(hex_digest) == 16 and xxhash is not None:
+        return xxhash.xxh64
+    raise ValueError(f"Unsupported digest length {len(hex_digest)}")
+
+
+def read_checksums(path=PAYLOAD_CHECKSUMS_PATH):
+    """Reads "<digest>  <path>" lines as written by b2sum or xxh128sum."""
+    entries = []
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            digest, _, rel_path = line.partition('  ')
+            if rel_path.startswith('*'):
+                rel_path = rel_path[1:] # Binary-mode marker
+            entries.append((rel_path.lstrip('/'), digest.lower()))
+    return entries
+
+
+class VerifyResult:
+    __slots__ = ('files', 'bytes', 'mismatches', 'elapsed')
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        # (path, reason) for every file that did not match
+        self.mismatches = []
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.mismatches
+
+    @property
+    def throughput(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+
+class PayloadVerifier:
+    """Hashes installed files on a thread pool and compares them to a manifest.
+
+    hashlib (and xxhash) release the GIL while hashing large buffers, so the
+    workers scale with the cores and the disk.
+    """
+
+    def __init__(self, entries, target_root, workers=DEFAULT_WORKERS, progress_callback=None,
+                 cancel_event=None):
+        self.entries = entries
+        self.target_root = target_root
+        self.workers = workers
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event or threading.Event()
+        self.result = VerifyResult()
+        self._lock = threading.Lock()
+
+    def _verify_file(self, rel_path, expected):
+        path = os.path.join(self.target_root, rel_path)
+        digest = hasher_for_digest(expected)()
+        size = 0
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                buffer = bytearray(READ_SIZE)
+                view = memoryview(buffer)
+                while True:
+                    if self.cancel_event.is_set():
+                        raise InterruptedError("verification cancelled")
+                    count = f.readinto(buffer)
+                    if not count:
+                        break
+                    digest.update(view[:count])
+                    size += count
+        except FileNotFoundError:
+            return rel_path, "missing", size
+        except OSError as e:
+            return rel_path, f"unreadable: {e.strerror}", size
+        if digest.hexdigest() != expected:
+            return rel_path, "checksum mismatch", size
+        return rel_path, None, size
+
+    def run(self):
+        start = time.monotonic()
+        total = len(self.entries)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="payload-verify") as pool:
+            futures = [pool.submit(self._verify_file, rel_path, digest) for rel_path, digest in self.entries]
+            for future in as_completed(futures):
+                rel_path, problem, size = future.result()
+                with self._lock:
+                    self.result.files += 1
+                    self.result.bytes += size
+                    if problem:
+                        self.result.mismatches.append((rel_path, problem))
+                    done = self.result.files
+                if self.progress_callback:
+                    self.progress_callback(done, total)
+        if self.cancel_event.is_set():
+            raise InterruptedError("verification cancelled")
+        self.result.elapsed = time.monotonic() - start
+        print(f"Verified {self.result.files} files ({self.result.bytes / 1024 ** 2:.0f} MiB) in "
+              f"{self.result.elapsed:.1f}s at {self.result.throughput / 1024 ** 2:.0f} MiB/s, "
+              f"{len(self.result.mismatches)} mismatches")
+        for rel_path, problem in self.result.mismatches:
+            print(f"  {rel_path}: {problem}")
+        return self.result
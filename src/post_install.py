@@ -0,0 +1,313 @@
+import collections
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.live_copy import TARGET_ROOT_PATH
+
+POST_INSTALL_LOG_PATH = '/tmp/centrio-post-install.log'
+DEFAULT_TIMEOUT = 30 * 60
+LOG_RING_LINES = 2000
+
+# How many steps of each resource class may run at once
+RESOURCE_LIMITS = {
+    'cpu': os.cpu_count() or 2,
+    'io': 2,
+    'network': 4,
+    'exclusive': 1,
+}
+
+
+class PostInstallStep:
+    """A command to run once the payload is on the target.
+
+    Steps name the steps they must run after and a resource class that
+    bounds how many similar steps share the machine. A step is skipped if
+    a step in after did not succeed; steps in after_finished only need to
+    have ended. Commands run inside the target root unless chroot is False.
+    Output also goes to log_path if set, a path in the root the step runs in.
+    """
+
+    __slots__ = ('name', 'command', 'script', 'interpreter', 'after', 'after_finished', 'resource',
+                 'timeout', 'chroot', 'required', 'log_path')
+
+    def __init__(self, name, command=None, script=None, interpreter='/bin/sh', after=(),
+                 resource='cpu', timeout=DEFAULT_TIMEOUT, chroot=True, required=False, after_finished=(),
+                 log_path=None):
+        if (command is None) == (script is None):
+            raise ValueError(f"Step {name} needs exactly one of command or script")
+        if resource not in RESOURCE_LIMITS:
+            raise ValueError(f"Step {name} has unknown resource class '{resource}'")
+        self.name = name
+        self.command = command
+        self.script = script
+        self.interpreter = interpreter
+        self.after = tuple(after)
+        self.after_finished = tuple(after_finished)
+        self.resource = resource
+        self.timeout = timeout
+        self.chroot = chroot
+        self.required = required
+        self.log_path = log_path
+
+
+class StepResult:
+    __slots__ = ('name', 'status', 'returncode', 'started', 'elapsed')
+
+    def __init__(self, name, status, returncode=None, started=0.0, elapsed=0.0):
+        self.name = name
+        # 'ok', 'failed', 'timeout', 'skipped' or 'cancelled'
+        self.status = status
+        self.returncode = returncode
+        self.started = started
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+
+class LogRing:
+    """Keeps the last lines of output in memory and appends everything to a file."""
+
+    def __init__(self, path=POST_INSTALL_LOG_PATH, max_lines=LOG_RING_LINES, line_callback=None):
+        self._lines = collections.deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', errors='replace', buffering=1) if path else None
+        self.line_callback = line_callback
+
+    def append(self, step_name, line):
+        line = f"[{step_name}] {line.rstrip()}"
+        with self._lock:
+            self._lines.append(line)
+            if self._file:
+                self._file.write(line + '\n')
+        if self.line_callback:
+            self.line_callback(line)
+
+    def lines(self):
+        with self._lock:
+            return list(self._lines)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class PostInstallExecutor:
+    """Runs post-install steps in dependency order, independent ones in parallel."""
+
+    def __init__(self, steps, target_root, log=None, resource_limits=None, cancel_event=None,
+                 result_callback=None):
+        self.steps = {step.name: step for step in steps}
+        if len(self.steps) != len(steps):
+            raise ValueError("Post-install step names must be unique")
+        self.target_root = target_root
+        self.log = log or LogRing()
+        self.cancel_event = cancel_event or threading.Event()
+        # Called with each StepResult as its step finishes, from the run() thread
+        self.result_callback = result_callback
+        limits = dict(RESOURCE_LIMITS, **(resource_limits or {}))
+        self._slots = {name: threading.Semaphore(limit) for name, limit in limits.items()}
+        self._processes = set()
+        self._lock = threading.Lock()
+        self.results = {}
+        self._check_graph()
+
+    def _check_graph(self):
+        for step in self.steps.values():
+            for dependency in step.after + step.after_finished:
+                if dependency not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown step {dependency}")
+        # Kahn's algorithm: anything left over sits on a cycle
+        remaining = {name: len(step.after + step.after_finished) for name, step in self.steps.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        while ready:
+            done = ready.pop()
+            del remaining[done]
+            for name, step in self.steps.items():
+                if done in step.after + step.after_finished and name in remaining:
+                    remaining[name] -= 1
+                    if remaining[name] == 0:
+                        ready.append(name)
+        if remaining:
+            raise ValueError(f"Post-install steps form a cycle: {', '.join(sorted(remaining))}")
+
+    def _step_root(self, step):
+        return self.target_root if step.chroot else '/'
+
+    def _open_step_log(self, step):
+        if not step.log_path:
+            return None
+        path = os.path.join(self._step_root(step), step.log_path.lstrip('/'))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return open(path, 'a', encoding='utf-8', errors='replace')
+        except OSError as e:
+            self.log.append(step.name, f"could not open log {step.log_path}: {e}")
+            return None
+
+    def _argv(self, step):
+        if step.command is not None:
+            argv = list(step.command)
+        else:
+            # Scripts are written into the root they run in
+            script_root = self._step_root(step)
+            script_dir = os.path.join(script_root, 'tmp')
+            os.makedirs(script_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix='centrio-post-', suffix='.sh', dir=script_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(step.script)
+            argv = [step.interpreter, '/' + os.path.relpath(path, script_root)]
+        if step.chroot:
+            argv = ['chroot', self.target_root] + argv
+        return argv
+
+    def _run_step(self, step):
+        with self._slots[step.resource]:
+            started = time.monotonic()
+            if self.cancel_event.is_set():
+                return StepResult(step.name, 'cancelled', started=started)
+            self.log.append(step.name, "started")
+            try:
+                argv = self._argv(step)
+                process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           stdin=subprocess.DEVNULL, start_new_session=True,
+                                           text=True, errors='replace')
+            except OSError as e:
+                self.log.append(step.name, f"could not start: {e}")
+                return StepResult(step.name, 'failed', started=started, elapsed=time.monotonic() - started)
+            with self._lock:
+                self._processes.add(process)
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                self._kill(process)
+
+            timer = threading.Timer(step.timeout, on_timeout)
+            timer.start()
+            step_log = self._open_step_log(step)
+            try:
+                for line in process.stdout:
+                    self.log.append(step.name, line)
+                    if step_log:
+                        step_log.write(line)
+                returncode = process.wait()
+            finally:
+                timer.cancel()
+                if step_log:
+                    step_log.close()
+                with self._lock:
+                    self._processes.discard(process)
+                if step.script is not None:
+                    self._remove_script(step, argv)
+        elapsed = time.monotonic() - started
+        if timed_out.is_set():
+            status = 'timeout'
+        elif self.cancel_event.is_set() and returncode != 0:
+            status = 'cancelled'
+        else:
+            status = 'ok' if returncode == 0 else 'failed'
+        self.log.append(step.name, f"{status} (exit {returncode}) after {elapsed:.1f}s")
+        return StepResult(step.name, status, returncode, started, elapsed)
+
+    def _remove_script(self, step, argv):
+        script_root = self._step_root(step)
+        try:
+            os.unlink(os.path.join(script_root, argv[-1].lstrip('/')))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _kill(process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def cancel(self):
+        """Stops scheduling and kills the running steps."""
+        self.cancel_event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            self._kill(process)
+
+    def run(self):
+        """Runs every step and returns {name: StepResult}."""
+        pending = dict(self.steps)
+        running = {}
+        # Resource slots, not the pool, bound the concurrency
+        with ThreadPoolExecutor(max_workers=max(1, len(self.steps)), thread_name_prefix="post-install") as pool:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    results = [self.results.get(dependency) for dependency in step.after]
+                    if any(result is None for result in results) or \
+                            any(dependency not in self.results for dependency in step.after_finished):
+                        continue
+                    del pending[name]
+                    if self.cancel_event.is_set():
+                        self.results[name] = StepResult(name, 'cancelled')
+                    elif not all(result.ok for result in results):
+                        self.log.append(name, "skipped, a dependency did not succeed")
+                        self.results[name] = StepResult(name, 'skipped')
+                    else:
+                        running[pool.submit(self._run_step, step)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    self.results[running.pop(future)] = result
+                    if self.result_callback:
+                        self.result_callback(result)
+        for result in sorted(self.results.values(), key=lambda r: r.started):
+            print(f"Post-install step {result.name}: {result.status} in {result.elapsed:.1f}s")
+        return self.results
+
+    @property
+    def failed_required(self):
+        return [name for name, result in self.results.items()
+                if not result.ok and self.steps[name].required]
+
+
+def steps_from_config(software_config, target_root=TARGET_ROOT_PATH):
+    """Builds the post-install steps for the software page's configuration."""
+    # Imported here because the preseed module builds on PostInstallStep
+    from src.flatpak_preseed import preseed_steps
+
+    steps = []
+    flatpak_after = ()
+    if software_config.get('flatpak_preseed'):
+        steps.extend(preseed_steps(software_config['flatpak_preseed'], target_root))
+        flatpak_after = (steps[-1].name,)
+    for index, command in enumerate(software_config.get('post_install_commands', [])):
+        if not command:
+            continue
+        if command[0] == 'flatpak':
+            # Remote changes must not race the preseed transaction
+            steps.append(PostInstallStep(f"command-{index + 1}", command=command, after=flatpak_after,
+                                         resource='network'))
+        else:
+            steps.append(PostInstallStep(f"command-{index + 1}", command=command))
+
+    # Kickstart %post sections keep their order, as Anaconda runs them. A
+    # failed script only stops the later ones if it has --erroronfail.
+    previous, previous_required = (), False
+    scripts = (software_config.get('kickstart_settings') or {}).get('post_scripts', [])
+    for index, script in enumerate(scripts):
+        name = f"ks-post-{index + 1}"
+        required = script.get('erroronfail', False)
+        steps.append(PostInstallStep(name, script=script['script'], interpreter=script['interpreter'],
+                                     after=previous if previous_required else (),
+                                     after_finished=() if previous_required else previous,
+                                     resource='exclusive', chroot=not script['nochroot'], required=required,
+                                     log_path=script.get('log')))
+        previous, previous_required = (name,), required
+    return steps
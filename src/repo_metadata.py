@@ -0,0 +1,290 @@
+import bz2
+import gzip
+import lzma
+import os
+import sqlite3
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+
+from src.payload_manifest import load_payload_manifest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Local installation repository on the install media
+BASE_REPO_PATH = '/run/install/repo'
+LIVE_ROOT_PATH = '/run/rootfsbase'
+CACHE_DIR = '/var/cache/centrio-installer'
+CACHE_SCHEMA_VERSION = 1
+
+REPO_NS = '{http://linux.duke.edu/metadata/repo}'
+COMMON_NS = '{http://linux.duke.edu/metadata/common}'
+RPM_NS = '{http://linux.duke.edu/metadata/rpm}'
+
+# Space kept free on top of the installed payload (bootloader, logs, first updates)
+DISK_SPACE_MARGIN = 2 * 1024 ** 3
+DISK_SPACE_FACTOR = 1.15
+
+
+def _open_compressed(path):
+    """Opens a metadata file for streaming, decompressing on the fly."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise OSError(f"Cannot read {path}: python zstandard module is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def read_repomd(repo_path=BASE_REPO_PATH):
+    """Returns {type: (location, checksum)} from repodata/repomd.xml."""
+    records = {}
+    repomd = os.path.join(repo_path, 'repodata', 'repomd.xml')
+    for _, elem in ET.iterparse(repomd):
+        if elem.tag == f'{REPO_NS}data':
+            location = elem.find(f'{REPO_NS}location')
+            checksum = elem.find(f'{REPO_NS}checksum')
+            if location is not None:
+                records[elem.get('type')] = (
+                    os.path.join(repo_path, location.get('href')),
+                    checksum.text if checksum is not None else '')
+            elem.clear()
+    return records
+
+
+class RepoSize:
+    """Download and installed size of a resolved package set."""
+
+    __slots__ = ('packages', 'download_size', 'installed_size', 'unresolved')
+
+    def __init__(self, packages, download_size, installed_size, unresolved):
+        self.packages = packages
+        self.download_size = download_size
+        self.installed_size = installed_size
+        self.unresolved = unresolved
+
+    def required_disk_space(self):
+        return int(self.installed_size * DISK_SPACE_FACTOR) + DISK_SPACE_MARGIN
+
+
+class RepoMetadataCache:
+    """SQLite index of a repository's primary metadata.
+
+    The index is built once per primary.xml checksum with a streaming
+    parser and reused on later runs; lookups by name, provide and file are
+    served from indexed tables.
+    """
+
+    def __init__(self, repo_path=BASE_REPO_PATH, cache_dir=CACHE_DIR):
+        self.repo_path = repo_path
+        records = read_repomd(repo_path)
+        if 'primary' not in records:
+            raise OSError(f"No primary metadata in {repo_path}")
+        self._primary_path, checksum = records['primary']
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, f"primary-{CACHE_SCHEMA_VERSION}-{checksum[:16]}.sqlite")
+        if not os.path.exists(self.db_path):
+            self._build()
+        self._db = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def _build(self):
+        # A private file per builder, so concurrent builds never share one;
+        # whichever finishes last replaces an identical index
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(self.db_path)}.",
+                                        suffix='.tmp', dir=os.path.dirname(self.db_path))
+        os.close(fd)
+        try:
+            count = self._fill(tmp_path)
+            os.replace(tmp_path, self.db_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        print(f"Indexed {count} packages from {self._primary_path} into {self.db_path}")
+
+    def _fill(self, tmp_path):
+        db = sqlite3.connect(tmp_path)
+        db.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE packages (id INTEGER PRIMARY KEY, name TEXT, arch TEXT, evr TEXT,
+                                   download_size INTEGER, installed_size INTEGER);
+            CREATE TABLE provides (name TEXT, pkg INTEGER);
+            CREATE TABLE requires (name TEXT, pkg INTEGER);
+            CREATE TABLE files (path TEXT, pkg INTEGER);
+        """)
+        count = 0
+        with _open_compressed(self._primary_path) as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag != f'{COMMON_NS}package':
+                    continue
+                if elem.get('type') == 'rpm':
+                    self._insert_package(db, elem)
+                    count += 1
+                # Drop the parsed subtree so memory stays flat
+                elem.clear()
+        db.executescript("""
+            CREATE INDEX packages_name ON packages (name);
+            CREATE INDEX provides_name ON provides (name);
+            CREATE INDEX requires_pkg ON requires (pkg);
+            CREATE INDEX files_path ON files (path);
+        """)
+        db.commit()
+        db.close()
+        return count
+
+    def _insert_package(self, db, elem):
+        name = elem.findtext(f'{COMMON_NS}name')
+        arch = elem.findtext(f'{COMMON_NS}arch')
+        if arch == 'src':
+            return
+        version = elem.find(f'{COMMON_NS}version')
+        evr = f"{version.get('epoch', '0')}:{version.get('ver')}-{version.get('rel')}" if version is not None else ''
+        size = elem.find(f'{COMMON_NS}size')
+        download_size = int(size.get('package', 0)) if size is not None else 0
+        installed_size = int(size.get('installed', 0)) if size is not None else 0
+        cursor = db.execute("INSERT INTO packages (name, arch, evr, download_size, installed_size) VALUES (?, ?, ?, ?, ?)",
+                            (name, arch, evr, download_size, installed_size))
+        pkg = cursor.lastrowid
+
+        fmt = elem.find(f'{COMMON_NS}format')
+        if fmt is None:
+            return
+        provides = fmt.find(f'{RPM_NS}provides')
+        if provides is not None:
+            db.executemany("INSERT INTO provides VALUES (?, ?)",
+                           [(entry.get('name'), pkg) for entry in provides])
+        requires = fmt.find(f'{RPM_NS}requires')
+        if requires is not None:
+            db.executemany("INSERT INTO requires VALUES (?, ?)",
+                           [(entry.get('name'), pkg) for entry in requires
+                            if not entry.get('name', '').startswith('rpmlib(')])
+        db.executemany("INSERT INTO files VALUES (?, ?)",
+                       [(entry.text, pkg) for entry in fmt.findall(f'{COMMON_NS}file')])
+
+    def _providers(self, requirement):
+        if requirement.startswith('/'):
+            rows = self._db.execute("SELECT pkg FROM files WHERE path = ?", (requirement,)).fetchall()
+            if rows:
+                return [row[0] for row in rows]
+        return [row[0] for row in self._db.execute("SELECT pkg FROM provides WHERE name = ?", (requirement,))]
+
+    def _packages_named(self, name):
+        return [row[0] for row in self._db.execute("SELECT id FROM packages WHERE name = ?", (name,))]
+
+    @staticmethod
+    def _first_alternative(requirement):
+        # Rich dependencies: take the first alternative of "(a or b)" / "(a if b)"
+        requirement = requirement.strip('()')
+        for keyword in (' or ', ' if ', ' with ', ' and ', ' unless '):
+            requirement = requirement.split(keyword, 1)[0]
+        return requirement.split(' ', 1)[0].strip('()')
+
+    def resolve(self, names, excluded=()):
+        """Computes the dependency closure of the given package names.
+
+        Returns a RepoSize with the total download and installed size.
+        """
+        excluded = set(excluded)
+        selected = set()
+        selected_names = set()
+        unresolved = set()
+        queue = []
+        for name in names:
+            candidates = self._packages_named(name) or self._providers(name)
+            if candidates:
+                queue.append(candidates[0])
+            else:
+                unresolved.add(name)
+
+        while queue:
+            pkg = queue.pop()
+            if pkg in selected:
+                continue
+            name = self._db.execute("SELECT name FROM packages WHERE id = ?", (pkg,)).fetchone()[0]
+            if name in excluded or name in selected_names:
+                continue
+            selected.add(pkg)
+            selected_names.add(name)
+            for (requirement,) in self._db.execute("SELECT name FROM requires WHERE pkg = ?", (pkg,)).fetchall():
+                if requirement.startswith('('):
+                    requirement = self._first_alternative(requirement)
+                providers = self._providers(requirement)
+                if not providers:
+                    unresolved.add(requirement)
+                elif not any(p in selected for p in providers):
+                    queue.append(providers[0])
+
+        if not selected:
+            return RepoSize([], 0, 0, sorted(unresolved))
+        placeholders = ','.join('?' * len(selected))
+        download_size, installed_size = self._db.execute(
+            f"SELECT SUM(download_size), SUM(installed_size) FROM packages WHERE id IN ({placeholders})",
+            tuple(selected)).fetchone()
+        return RepoSize(sorted(selected_names), download_size or 0, installed_size or 0, sorted(unresolved))
+
+    def close(self):
+        self._db.close()
+
+
+def estimate_install_size(packages, excluded=(), repo_path=BASE_REPO_PATH):
+    """Resolves a package selection (kickstart "@group" and "@^environment" entries allowed) against the repo."""
+    # Imported here because the comps catalog reuses this module's readers
+    from src.comps_catalog import get_comps_catalog
+
+    cache = RepoMetadataCache(repo_path)
+    try:
+        groups = [p[1:].removeprefix('^') for p in packages if p.startswith('@')]
+        names = [p for p in packages if not p.startswith('@')]
+        if groups:
+            catalog = get_comps_catalog(repo_path)
+            if catalog is None:
+                print(f"Warning: Cannot expand groups without comps: {groups}")
+            else:
+                names.extend(catalog.expand(groups))
+        return cache.resolve(names, excluded)
+    finally:
+        cache.close()
+
+
+def estimate_live_image_size(root=LIVE_ROOT_PATH):
+    """Returns the size of the live payload as a RepoSize.
+
+    The media's payload manifest is exact; without one the used size of the
+    live root filesystem is the estimate.
+    """
+    manifest = load_payload_manifest()
+    if manifest is not None:
+        size = RepoSize([], 0, manifest.total_bytes, [])
+        manifest.close()
+        return size
+    if not os.path.isdir(root):
+        root = '/'
+    st = os.statvfs(root)
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    return RepoSize([], 0, used, [])
+
+
+def estimate_install_size_async(packages, excluded, callback):
+    """Runs the estimate on a worker thread; callback(size, error) runs on the worker."""
+    def worker():
+        try:
+            if packages:
+                size = estimate_install_size(packages, excluded)
+            else:
+                size = estimate_live_image_size()
+            callback(size, None)
+        except (OSError, ET.ParseError, sqlite3.Error) as e:
+            print(f"Could not estimate installation size: {e}")
+            callback(None, e)
+
+    thread = threading.Thread(target=worker, name="size-estimator", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,169 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+
+# Where the payload's root filesystem can be found, in order of preference.
+# /run/rootfsbase is the read-only live image; "/" is the running live system.
+PAYLOAD_ROOT_CANDIDATES = ['/run/rootfsbase', '/']
+CACHE_DIR = '/var/cache/centrio-installer'
+CACHE_VERSION = 3
+
+ACCOUNT_FILES = ['etc/passwd', 'etc/group']
+SYSUSERS_GLOBS = ['usr/lib/sysusers.d/*.conf', 'etc/sysusers.d/*.conf']
+# Range regular users are created in, as in login.defs
+FIRST_USER_ID = 1000
+LAST_USER_ID = 60000
+
+# Always reserved, even if the payload does not list them
+BUILTIN_RESERVED_NAMES = {
+    "root", "bin", "daemon", "adm", "lp", "sync", "shutdown", "halt", "mail",
+    "operator", "games", "ftp", "nobody", "wheel", "users", "systemd-network",
+    "systemd-resolve", "dbus", "polkitd", "tss", "sshd", "chrony",
+}
+
+
+class ReservedAccounts:
+    """Set of account names and IDs already claimed by the payload."""
+
+    __slots__ = ('names', 'ids')
+
+    def __init__(self, names, ids):
+        self.names = frozenset(names) | BUILTIN_RESERVED_NAMES
+        self.ids = frozenset(ids)
+
+    def is_reserved(self, name):
+        return name in self.names
+
+    def is_reserved_id(self, account_id):
+        return account_id in self.ids
+
+    def first_free_user_id(self):
+        """Returns the lowest regular user ID the payload does not claim, or None."""
+        for account_id in range(FIRST_USER_ID, LAST_USER_ID + 1):
+            if account_id not in self.ids:
+                return account_id
+        return None
+
+
+def _find_payload_root():
+    for root in PAYLOAD_ROOT_CANDIDATES:
+        if os.path.exists(os.path.join(root, 'etc/passwd')):
+            return root
+    return '/'
+
+
+def _source_files(root):
+    files = [os.path.join(root, path) for path in ACCOUNT_FILES]
+    for pattern in SYSUSERS_GLOBS:
+        files.extend(sorted(glob.glob(os.path.join(root, pattern))))
+    return [f for f in files if os.path.isfile(f)]
+
+
+def _fingerprint(root, files):
+    """Identifies a payload image by the metadata of its account sources."""
+    digest = hashlib.sha256(f"{CACHE_VERSION}:{root}".encode())
+    for path in files:
+        st = os.stat(path)
+        digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _parse_id(value):
+    # sysusers.d IDs may be "-", "uid:gid" or a path to take the ID from
+    value = value.split(':', 1)[0]
+    return int(value) if value.isdigit() else None
+
+
+def _extract(files):
+    names, ids = set(), set()
+    for path in files:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                if path.endswith('.conf'):
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) < 2 or fields[0].startswith('#'):
+                            continue
+                        kind, name = fields[0], fields[1]
+                        if kind in ('u', 'u!', 'g'):
+                            names.add(name)
+                            if len(fields) > 2:
+                                account_id = _parse_id(fields[2])
+                                if account_id is not None:
+                                    ids.add(account_id)
+                        elif kind == 'm' and len(fields) > 2:
+                            names.update((name, fields[2]))
+                else:
+                    for line in f:
+                        fields = line.rstrip('\n').split(':')
+                        if len(fields) >= 3 and fields[0] and not fields[0].startswith('#'):
+                            names.add(fields[0])
+                            if fields[2].isdigit():
+                                ids.add(int(fields[2]))
+        except OSError as e:
+            print(f"Warning: Could not read {path}: {e}")
+    return names, ids
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as f:
+            data = json.load(f)
+        return data['names'], data['ids']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _store_cache(cache_path, names, ids):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'names': sorted(names), 'ids': sorted(ids)}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not cache reserved accounts: {e}")
+
+
+_reserved = None
+_reserved_lock = threading.Lock()
+
+
+def get_reserved_accounts():
+    """Returns the payload's reserved accounts, extracting them at most once.
+
+    Extraction results are cached on disk per payload image, keyed by the
+    metadata of passwd, group and the sysusers.d files.
+    """
+    global _reserved
+    with _reserved_lock:
+        if _reserved is not None:
+            return _reserved
+
+        root = _find_payload_root()
+        files = _source_files(root)
+        cache_path = os.path.join(CACHE_DIR, f"reserved-accounts-{_fingerprint(root, files)}.json")
+        cached = _load_cache(cache_path)
+        if cached:
+            names, ids = cached
+            print(f"Loaded reserved accounts from cache {cache_path}")
+        else:
+            names, ids = _extract(files)
+            _store_cache(cache_path, names, ids)
+        _reserved = ReservedAccounts(names, ids)
+        print(f"Reserved accounts: {len(_reserved.names)} names, {len(_reserved.ids)} IDs from {root}")
+        return _reserved
+
+
+def load_reserved_accounts_async(callback=None):
+    """Loads the reserved accounts on a worker thread; callback gets the result."""
+    def worker():
+        reserved = get_reserved_accounts()
+        if callback:
+            callback(reserved)
+
+    thread = threading.Thread(target=worker, name="reserved-accounts", daemon=True)
+    thread.start()
+    return thread
@@ -5,6 +5,17 @@ from gi.repository import Gtk, Adw, Gio, GLib, GObject
 import os
 import subprocess
 from pathlib import Path
+from src.kickstart_parser import parse_kickstart_async
+from src.password_hashing import get_password_hasher
+from src.comps_catalog import load_comps_catalog_async
+from src.image_deploy import DISK_IMAGE_INDEX_PATH
+from src.payload_verify import PAYLOAD_CHECKSUMS_PATH
+from src.payload_manifest import PAYLOAD_MANIFEST_PATH
+from src.flatpak_preseed import load_flatpak_media_async
+from src.installation_destination_view import format_size
+
+# Number of kickstart errors listed in the status label
+MAX_REPORTED_ERRORS = 5
 
 @Gtk.Template(filename='ui/software_selection.ui')
 class SoftwareSelectionView(Gtk.Box):
@@ -15,7 +26,16 @@ class SoftwareSelectionView(Gtk.Box):
     kickstart_file_label = Gtk.Template.Child()
     use_live_image_radio = Gtk.Template.Child()
     use_kickstart_radio = Gtk.Template.Child()
+    use_repository_radio = Gtk.Template.Child()
+    use_disk_image_radio = Gtk.Template.Child()
+    disk_image_row = Gtk.Template.Child()
+    environment_group = Gtk.Template.Child()
+    addon_group = Gtk.Template.Child()
     flatpak_switch = Gtk.Template.Child()
+    flatpak_preseed_row = Gtk.Template.Child()
+    flatpak_preseed_switch = Gtk.Template.Child()
+    verify_row = Gtk.Template.Child()
+    verify_switch = Gtk.Template.Child()
     status_label = Gtk.Template.Child()
     
     # File chooser dialog
@@ -24,13 +44,37 @@ class SoftwareSelectionView(Gtk.Box):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._kickstart_path = None
+        self._kickstart_document = None
+        # to_settings() of the document, with plaintext passwords already hashed
+        self._kickstart_settings = None
+        self._kickstart_parsing = False
+        self.validation_error = None
         self._use_kickstart = False
+        self._use_repository = False
+        self._use_disk_image = False
         self._enable_flatpak = False
+        self._flatpak_media = None
+
+        # comps environments/groups; rows are built once the catalog is loaded
+        self._comps = None
+        self._environment_rows = []
+        self._addon_rows = []
+        self._selected_environment = None
+        self._selected_groups = set()
         
         # Connect signals
         self.kickstart_file_button.connect("clicked", self._on_file_chooser_clicked)
         self.use_kickstart_radio.connect("toggled", self._on_selection_changed)
+        self.use_repository_radio.connect("toggled", self._on_selection_changed)
+        self.use_disk_image_radio.connect("toggled", self._on_selection_changed)
+        self.verify_row.set_sensitive(os.path.exists(PAYLOAD_MANIFEST_PATH)
+                                      or os.path.exists(PAYLOAD_CHECKSUMS_PATH))
+        # Only offered when the media carries a prebuilt image
+        self.disk_image_row.set_visible(os.path.exists(DISK_IMAGE_INDEX_PATH))
+        self.use_repository_radio.set_sensitive(False)
+        load_comps_catalog_async(lambda catalog: GLib.idle_add(self._on_comps_loaded, catalog))
         self.flatpak_switch.connect("notify::active", self._on_flatpak_toggled)
+        load_flatpak_media_async(lambda media: GLib.idle_add(self._on_flatpak_media_loaded, media))
         
         # Default to using live image packages
         self.use_live_image_radio.set_active(True)
@@ -66,25 +110,145 @@ class SoftwareSelectionView(Gtk.Box):
             if file:
                 self._kickstart_path = file.get_path()
                 self.kickstart_file_label.set_label(os.path.basename(self._kickstart_path))
-                self._update_status(f"Selected kickstart file: {os.path.basename(self._kickstart_path)}")
+                self._update_status(f"Checking kickstart file: {os.path.basename(self._kickstart_path)}...")
+                self._start_kickstart_parse(self._kickstart_path)
         
         # Don't destroy the dialog, just hide it for reuse
         dialog.hide()
+
+    def _start_kickstart_parse(self, path):
+        """Parses and validates the kickstart on a worker thread."""
+        self._kickstart_document = None
+        self._kickstart_settings = None
+        self._kickstart_parsing = True
+
+        def on_parsed(document, error):
+            # Still on the worker: plaintext passwords are hashed here, not on the main loop
+            settings = document.to_settings(get_password_hasher()) if document is not None else None
+            GLib.idle_add(self._on_kickstart_parsed, path, document, settings, error)
+
+        parse_kickstart_async(path, on_parsed)
+
+    def _on_kickstart_parsed(self, path, document, settings, error):
+        if path != self._kickstart_path:
+            return GLib.SOURCE_REMOVE # A different file was chosen meanwhile
+        self._kickstart_parsing = False
+        if error is not None:
+            self._update_status(f"Could not read kickstart file: {error}")
+            return GLib.SOURCE_REMOVE
+
+        self._kickstart_document = document
+        self._kickstart_settings = settings
+        name = os.path.basename(path)
+        if document.errors:
+            lines = [str(message) for message in document.errors[:MAX_REPORTED_ERRORS]]
+            if len(document.errors) > MAX_REPORTED_ERRORS:
+                lines.append(f"... and {len(document.errors) - MAX_REPORTED_ERRORS} more")
+            self._update_status(f"{name} has {len(document.errors)} error(s):\n" + "\n".join(lines))
+        else:
+            status = f"Kickstart file {name} is valid ({len(document.commands)} commands)"
+            if document.warnings:
+                status += "\n" + "\n".join(str(message) for message in document.warnings[:MAX_REPORTED_ERRORS])
+            self._update_status(status)
+        return GLib.SOURCE_REMOVE
     
     def _on_selection_changed(self, button):
         """Handle changes in the selection method."""
         self._use_kickstart = self.use_kickstart_radio.get_active()
+        self._use_repository = self.use_repository_radio.get_active()
+        self._use_disk_image = self.use_disk_image_radio.get_active()
+        self._update_ui()
+
+    def _on_comps_loaded(self, catalog):
+        """Builds the environment list from the repository's comps."""
+        self._comps = catalog
+        if catalog is None:
+            return GLib.SOURCE_REMOVE
+        environments = catalog.get_environments()
+        if not environments:
+            return GLib.SOURCE_REMOVE
+
+        first_check = None
+        for environment in environments:
+            row = Adw.ActionRow(title=environment.name or environment.id, subtitle=environment.description)
+            check = Gtk.CheckButton(valign=Gtk.Align.CENTER)
+            if first_check is None:
+                first_check = check
+            else:
+                check.set_group(first_check)
+            check.connect("toggled", self._on_environment_toggled, environment.id)
+            row.add_prefix(check)
+            row.set_activatable_widget(check)
+            self.environment_group.add(row)
+            self._environment_rows.append(row)
+        self.use_repository_radio.set_sensitive(True)
+        first_check.set_active(True)
+        return GLib.SOURCE_REMOVE
+
+    def _on_environment_toggled(self, check, environment_id):
+        if not check.get_active():
+            return
+        self._selected_environment = environment_id
+        self._selected_groups.clear()
+        self._populate_addons(environment_id)
         self._update_ui()
+
+    def _populate_addons(self, environment_id):
+        """Lists the environment's optional groups; packages are loaded on expand."""
+        for row in self._addon_rows:
+            self.addon_group.remove(row)
+        self._addon_rows = []
+        for group in self._comps.get_optional_groups(environment_id):
+            row = Adw.ExpanderRow(title=group.name or group.id, subtitle=group.description)
+            check = Gtk.CheckButton(valign=Gtk.Align.CENTER)
+            check.connect("toggled", self._on_addon_toggled, group.id)
+            row.add_prefix(check)
+            row.group_id = group.id
+            row.packages_loaded = False
+            row.connect("notify::expanded", self._on_addon_expanded)
+            self.addon_group.add(row)
+            self._addon_rows.append(row)
+
+    def _on_addon_toggled(self, check, group_id):
+        if check.get_active():
+            self._selected_groups.add(group_id)
+        else:
+            self._selected_groups.discard(group_id)
+
+    def _on_addon_expanded(self, row, _):
+        if not row.get_expanded() or row.packages_loaded:
+            return
+        row.packages_loaded = True
+        for name, package_type in self._comps.get_group_packages(row.group_id):
+            package_row = Adw.ActionRow(title=name, subtitle=package_type)
+            package_row.add_css_class("property")
+            row.add_row(package_row)
     
     def _on_flatpak_toggled(self, switch, _):
         """Handle Flatpak enable/disable toggle."""
         self._enable_flatpak = switch.get_active()
         self._update_status(f"Flatpak will be {'enabled' if self._enable_flatpak else 'disabled'} after installation")
     
+    def _on_flatpak_media_loaded(self, media):
+        self._flatpak_media = media
+        if media is not None and media.refs:
+            self.flatpak_preseed_row.set_subtitle(
+                f"Installs {len(media.apps)} app(s) from the installation media ({format_size(media.size or 0)})")
+            self.flatpak_preseed_row.set_visible(True)
+        return GLib.SOURCE_REMOVE
+
     def _update_ui(self):
         """Update UI based on current state."""
         self.kickstart_file_button.set_sensitive(self._use_kickstart)
-        if not self._use_kickstart:
+        self.environment_group.set_visible(self._use_repository)
+        self.addon_group.set_visible(self._use_repository and bool(self._addon_rows))
+        if self._use_repository:
+            self._update_status("Installing the selected environment from the installation repository")
+            self.kickstart_file_label.set_label("")
+        elif self._use_disk_image:
+            self._update_status("Deploying the prebuilt system image from the installation media")
+            self.kickstart_file_label.set_label("")
+        elif not self._use_kickstart:
             self._update_status("Using packages from the live image")
             self.kickstart_file_label.set_label("")
     
@@ -113,22 +277,64 @@ class SoftwareSelectionView(Gtk.Box):
             dict: Dictionary containing software configuration including
                   kickstart path (if any) and post-installation commands.
         """
+        self.validation_error = None
+        verify_payload = self.verify_switch.get_active() and self.verify_row.get_sensitive()
         post_install_commands = []
+        flatpak_preseed = None
+        if self._flatpak_media is not None and self.flatpak_preseed_switch.get_active():
+            flatpak_preseed = self._flatpak_media.to_config()
         
         # Add Flatpak setup if enabled
         flatpak_cmd = self._setup_flatpak()
         if flatpak_cmd:
             post_install_commands.append(flatpak_cmd)
         
+        if self._use_disk_image:
+            return {
+                'source_type': 'disk_image',
+                'image_index': DISK_IMAGE_INDEX_PATH,
+                'post_install_commands': post_install_commands,
+                'verify_payload': verify_payload,
+                'flatpak_preseed': flatpak_preseed
+            }
+        if self._use_repository:
+            if not self._selected_environment:
+                self.validation_error = "Please select a base environment."
+                return None
+            groups = sorted(self._selected_groups)
+            return {
+                'source_type': 'repository',
+                'environment': self._selected_environment,
+                'groups': groups,
+                'post_install_commands': post_install_commands,
+                'verify_payload': verify_payload,
+                'flatpak_preseed': flatpak_preseed
+            }
         if self._use_kickstart and self._kickstart_path:
+            if self._kickstart_parsing:
+                self.validation_error = "The kickstart file is still being checked, please wait."
+                return None
+            if self._kickstart_document is None or not self._kickstart_document.is_valid:
+                self.validation_error = "The kickstart file has errors, see the software page for details."
+                return None
+            root = self._kickstart_settings.get('root') or {}
+            if root.get('password') and not root.get('is_crypted'):
+                self.validation_error = ("The kickstart root password is not encrypted and cannot be hashed "
+                                         "(libcrypt missing). Use rootpw --iscrypted.")
+                return None
             return {
                 'source_type': 'kickstart',
                 'kickstart_path': self._kickstart_path,
-                'post_install_commands': post_install_commands
+                'kickstart_settings': self._kickstart_settings,
+                'post_install_commands': post_install_commands,
+                'verify_payload': verify_payload,
+                'flatpak_preseed': flatpak_preseed
             }
         else:
             # Use packages from live image
             return {
                 'source_type': 'live_image',
-                'post_install_commands': post_install_commands
+                'post_install_commands': post_install_commands,
+                'verify_payload': verify_payload,
+                'flatpak_preseed': flatpak_preseed
             }
\ No newline at end of file
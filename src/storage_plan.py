@@ -0,0 +1,151 @@
+import os
+
+from gi.repository import Gio, GLib
+
+from src.anaconda_sync import (CallSequence, ModuleResult, get_anaconda_connection, method_call,
+                               set_property_call, CALL_TIMEOUT_MS, DISK_SELECTION, STORAGE,
+                               PROPERTIES_INTERFACE)
+
+# The selection must be unchanged this long before a plan is computed
+PLAN_SETTLE_MS = 600
+TASK_POLL_MS = 250
+TASK_INTERFACE = 'org.fedoraproject.Anaconda.Task'
+PARTITIONING_INTERFACE = f"{STORAGE[2]}.Partitioning"
+DEVICE_TREE_VIEWER_INTERFACE = f"{STORAGE[2]}.DeviceTree.Viewer"
+
+
+def _run_task(task_path, state):
+    task = (STORAGE[0], task_path, TASK_INTERFACE)
+    # Known to the planner so a superseded plan can stop it, see StoragePlanner.cancel
+    state['task'] = task_path
+    yield method_call(task, 'Start')
+    while True:
+        reply = yield method_call((STORAGE[0], task_path, PROPERTIES_INTERFACE), 'Get',
+                                  GLib.Variant('(ss)', (TASK_INTERFACE, 'IsRunning')), GLib.VariantType('(v)'))
+        if not reply.unpack()[0]:
+            break
+        yield ('wait', TASK_POLL_MS)
+    # Raises the task's error, if it failed
+    yield method_call(task, 'Finish')
+    state['task'] = None
+
+
+def _plan_calls(disks, state):
+    names = [os.path.basename(disk) for disk in disks]
+    reply = yield method_call(DISK_SELECTION, 'ValidateSelectedDisks', GLib.Variant('(as)', (names,)),
+                              GLib.VariantType('(a{sv})'))
+    report = reply.unpack()[0]
+    yield ('report', list(report.get('error-messages', [])), list(report.get('warning-messages', [])))
+    if report.get('error-messages'):
+        return
+    yield set_property_call(DISK_SELECTION, 'SelectedDisks', GLib.Variant('as', names))
+
+    if state['partitioning'] is None:
+        reply = yield method_call(STORAGE, 'CreatePartitioning', GLib.Variant('(s)', ('AUTOMATIC',)),
+                                  GLib.VariantType('(o)'))
+        state['partitioning'] = reply.unpack()[0]
+    else:
+        # One partitioning object is reused; start it over from the disks as they are
+        yield method_call(STORAGE, 'ResetPartitioning')
+    partitioning_path = state['partitioning']
+    partitioning = (STORAGE[0], partitioning_path, PARTITIONING_INTERFACE)
+    reply = yield method_call(partitioning, 'ConfigureWithTask', None, GLib.VariantType('(o)'))
+    yield from _run_task(reply.unpack()[0], state)
+    reply = yield method_call(partitioning, 'ValidateWithTask', None, GLib.VariantType('(o)'))
+    task_path = reply.unpack()[0]
+    yield from _run_task(task_path, state)
+    reply = yield method_call((STORAGE[0], task_path, TASK_INTERFACE), 'GetResult', None, GLib.VariantType('(v)'))
+    report = reply.unpack()[0]
+    yield ('report', list(report.get('error-messages', [])), list(report.get('warning-messages', [])))
+
+    reply = yield method_call(partitioning, 'GetDeviceTree', None, GLib.VariantType('(o)'))
+    viewer = (STORAGE[0], reply.unpack()[0], DEVICE_TREE_VIEWER_INTERFACE)
+    reply = yield method_call(viewer, 'GetActions', None, GLib.VariantType('(aa{sv})'))
+    actions = [f"{action.get('action-description', '')} {action.get('object-description', '')} "
+               f"on {action.get('device-name', '')}".strip()
+               for action in reply.unpack()[0]]
+    yield ('result', {'disks': list(disks), 'partitioning': partitioning_path, 'actions': actions})
+
+
+class StoragePlanner:
+    """Computes the automatic partitioning plan for a disk selection ahead of time.
+
+    plan_for() is called on every selection change; once the selection has
+    settled the Storage module configures and validates an automatic
+    partitioning in the background. A change while that runs cancels it,
+    stops the Storage task in progress and starts over on the same
+    partitioning object. The callback gets a ModuleResult whose value is
+    the plan: {disks, partitioning object path, actions}.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.result = None
+        self._disks = []
+        self._timeout_id = 0
+        self._cancellable = None
+        # Partitioning object reused by every plan, and the task running for the current one
+        self._state = {'partitioning': None, 'task': None}
+
+    def plan_for(self, disks):
+        self.cancel()
+        self.result = None
+        self._disks = list(disks)
+        if disks:
+            self._timeout_id = GLib.timeout_add(PLAN_SETTLE_MS, self._start)
+
+    def cancel(self):
+        if self._timeout_id:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = 0
+        if self._cancellable is not None:
+            self._cancellable.cancel()
+            self._cancellable = None
+        task_path = self._state['task']
+        connection = get_anaconda_connection() if task_path else None
+        if connection is not None:
+            self._state['task'] = None
+            print(f"Cancelling storage task {task_path}")
+            connection.call(STORAGE[0], task_path, TASK_INTERFACE, 'Cancel', None, None,
+                            Gio.DBusCallFlags.NONE, CALL_TIMEOUT_MS, None, self._on_task_cancelled)
+
+    @staticmethod
+    def _on_task_cancelled(connection, async_result):
+        try:
+            connection.call_finish(async_result)
+        except GLib.Error as e:
+            # Usually the task had just finished
+            print(f"Warning: Could not cancel storage task: {e.message}")
+
+    @property
+    def busy(self):
+        return bool(self._timeout_id or self._cancellable)
+
+    def plan(self):
+        """Returns the plan for the current selection, or None if there is none (yet)."""
+        if self.result is None or not self.result.ok or self.result.value is None:
+            return None
+        return self.result.value
+
+    def _start(self):
+        self._timeout_id = 0
+        connection = get_anaconda_connection()
+        if connection is None:
+            return GLib.SOURCE_REMOVE
+        print(f"Computing the storage plan for {', '.join(self._disks)}...")
+        self._cancellable = Gio.Cancellable()
+        CallSequence(connection, _plan_calls(self._disks, self._state), ModuleResult('Storage'),
+                     self._cancellable, self._on_finished).start()
+        return GLib.SOURCE_REMOVE
+
+    def _on_finished(self, sequence):
+        if sequence.cancellable is not self._cancellable:
+            return # Superseded by a newer selection
+        self._cancellable = None
+        self._state['task'] = None
+        self.result = sequence.result
+        if self.result.ok and self.result.value:
+            print(f"Storage plan ready: {len(self.result.value['actions'])} action(s)")
+        else:
+            print(f"Storage plan failed: {'; '.join(self.result.errors) or 'no plan'}")
+        self.callback(self.result)
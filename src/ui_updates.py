@@ -0,0 +1,83 @@
+import threading
+
+from gi.repository import GLib
+
+
+class UiUpdateChannel:
+    """Coalesces UI updates from any thread and applies them once per frame.
+
+    Updates are keyed by target and property; a newer value replaces a
+    pending one, so a worker emitting thousands of progress events costs
+    one idle source and one property write per frame. Pending updates are
+    applied from a tick callback on the widget's GdkFrameClock, or right
+    away while the widget is not mapped and no frames are drawn. A widget
+    unmapped before its tick ran gets the pending updates at the unmap.
+
+    This is for state that only matters at its latest value. One-shot
+    results from workers (a parsed file, a finished hash) keep using
+    GLib.idle_add, since every one of them must be delivered.
+    """
+
+    def __init__(self, widget):
+        self._widget = widget
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._scheduled = False
+        self._tick_id = 0
+        self.submitted = 0
+        self.applied = 0
+        self.frames = 0
+        widget.connect("unmap", self._on_unmap)
+
+    def set_property(self, target, name, value):
+        """Sets a GObject property on target at the next frame."""
+        self.call((id(target), name), target.set_property, name, value)
+
+    def call(self, key, function, *args):
+        """Calls function(*args) on the main thread at the next frame.
+
+        Only the latest call for each key is made.
+        """
+        with self._lock:
+            self._pending[key] = (function, args)
+            self.submitted += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        GLib.idle_add(self._arm)
+
+    def _arm(self):
+        if self._widget.get_mapped():
+            self._tick_id = self._widget.add_tick_callback(self._on_tick)
+        else:
+            self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def _on_tick(self, widget, frame_clock):
+        self._tick_id = 0
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def _on_unmap(self, widget):
+        # The frame clock stops with the widget, so the tick would never run
+        if self._tick_id:
+            widget.remove_tick_callback(self._tick_id)
+            self._tick_id = 0
+            self.flush()
+
+    def flush(self):
+        """Applies everything pending. Main thread only."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._scheduled = False
+        self.frames += 1
+        for function, args in pending.values():
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Warning: UI update failed: {e}")
+        self.applied += len(pending)
+
+    def stats(self):
+        return f"{self.submitted} submitted, {self.applied} applied in {self.frames} frames"
@@ -1,8 +1,14 @@
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
-from gi.repository import Gtk, Adw, Gio
+from gi.repository import Gtk, Adw, Gio, GLib
 import re # For basic username validation
+from src.password_hashing import get_password_hasher
+from src.password_strength import StrengthChecker, SCORE_LABELS
+from src.reserved_accounts import load_reserved_accounts_async
+
+# Delay after the last keystroke before the strength estimate runs
+STRENGTH_DEBOUNCE_MS = 250
 
 @Gtk.Template(filename='ui/user_creation.ui')
 class UserCreationView(Gtk.Box):
@@ -26,8 +32,71 @@ class UserCreationView(Gtk.Box):
         self.confirm_password_row.connect("notify::text", self.validate_passwords)
         self.root_password_row.connect("notify::text", self.validate_root_passwords)
         self.root_confirm_password_row.connect("notify::text", self.validate_root_passwords)
+        # Benchmark the hash cost while the user is still typing
+        self._hasher = get_password_hasher()
+        self._hasher.calibrate_async()
+
+        # Strength feedback is computed off the main loop, see _on_password_changed
+        self.validation_error = None
+        self._strength_checker = StrengthChecker()
+        self._strength_timeout_id = None
+        # Bumped on every edit so estimates of an older password are dropped
+        self._strength_generation = 0
+        self.password_strength_label = Gtk.Label(valign=Gtk.Align.CENTER, css_classes=["dim-label", "caption"])
+        self.password_row.add_suffix(self.password_strength_label)
+        self.password_row.connect("notify::text", self._on_password_changed)
+
+        # Accounts already claimed by the payload; None until the worker has loaded them
+        self._reserved_accounts = None
+        load_reserved_accounts_async(lambda reserved: GLib.idle_add(self._on_reserved_accounts_loaded, reserved))
         print("UserCreationView initialized")
 
+    def _on_reserved_accounts_loaded(self, reserved):
+        self._reserved_accounts = reserved
+        self.validate_username()
+        return GLib.SOURCE_REMOVE
+
+    def _on_password_changed(self, *args):
+        """Restarts the debounce timer for the strength estimate."""
+        self._strength_generation += 1
+        if self._strength_timeout_id:
+            GLib.source_remove(self._strength_timeout_id)
+        self._strength_timeout_id = GLib.timeout_add(STRENGTH_DEBOUNCE_MS, self._request_strength_estimate)
+
+    def _request_strength_estimate(self):
+        self._strength_timeout_id = None
+        password = self.password_row.get_text()
+        if not password:
+            self._show_strength(None, "")
+            return GLib.SOURCE_REMOVE
+        user_inputs = (self.username_row.get_text(), *self.full_name_row.get_text().split())
+        generation = self._strength_generation
+        self._strength_checker.submit(
+            password, user_inputs,
+            lambda score, feedback: GLib.idle_add(self._on_strength_estimated, generation, score, feedback))
+        return GLib.SOURCE_REMOVE
+
+    def _on_strength_estimated(self, generation, score, feedback):
+        if generation == self._strength_generation:
+            self._show_strength(score, feedback)
+        return GLib.SOURCE_REMOVE
+
+    def _show_strength(self, score, feedback):
+        """Shows the estimate next to the password field."""
+        self.password_strength_label.set_label(feedback)
+        self.password_strength_label.set_tooltip_text(SCORE_LABELS[score] if score is not None else None)
+        for css_class in ("error", "warning", "success"):
+            self.password_row.remove_css_class(css_class)
+        if score is not None:
+            self.password_row.add_css_class("error" if score <= 1 else "warning" if score == 2 else "success")
+        return GLib.SOURCE_REMOVE
+
+    def _set_mismatch(self, row, mismatch):
+        if mismatch:
+            row.add_css_class("error")
+        else:
+            row.remove_css_class("error")
+
     def validate_username(self, *args):
         username = self.username_row.get_text().strip()
         # Convert username to lowercase and replace any invalid characters
@@ -41,68 +110,42 @@ class UserCreationView(Gtk.Box):
         # Update the field with cleaned username
         if username != self.username_row.get_text().strip():
             self.username_row.set_text(username)
-            
-        return True
+
+        # Names used by system accounts in the payload would fail during installation
+        is_reserved = self._reserved_accounts is not None and self._reserved_accounts.is_reserved(username)
+        self._set_mismatch(self.username_row, is_reserved)
+        self.username_row.set_tooltip_text(
+            f"'{username}' is reserved for a system account" if is_reserved else None)
+        return not is_reserved
 
     def validate_passwords(self, *args):
+        """Flags the confirmation row when the passwords differ. Never edits the fields."""
         pw1 = self.password_row.get_text()
         pw2 = self.confirm_password_row.get_text()
-        
-        # If both fields are empty, set a default password
-        if not pw1 and not pw2:
-            default_pw = "password"
-            self.password_row.set_text(default_pw)
-            self.confirm_password_row.set_text(default_pw)
-            pw1 = pw2 = default_pw
-        # If only one field is filled, copy it to the other
-        elif not pw1 and pw2:
-            self.password_row.set_text(pw2)
-            pw1 = pw2
-        elif pw1 and not pw2:
-            self.confirm_password_row.set_text(pw1)
-            pw2 = pw1
-            
-        # Ensure passwords match
-        if pw1 != pw2:
-            self.confirm_password_row.set_text(pw1)
-            
-        return True
+        matches = pw1 == pw2
+        self._set_mismatch(self.confirm_password_row, bool(pw2) and not matches)
+        return bool(pw1) and matches
 
     def validate_root_passwords(self, *args):
         if not self.root_enable_check.get_active():
             # If root is not enabled, ensure the fields are empty
-            self.root_password_row.set_text("")
-            self.root_confirm_password_row.set_text("")
+            if self.root_password_row.get_text() or self.root_confirm_password_row.get_text():
+                self.root_password_row.set_text("")
+                self.root_confirm_password_row.set_text("")
+            self._set_mismatch(self.root_confirm_password_row, False)
             return True
             
         pw1 = self.root_password_row.get_text()
         pw2 = self.root_confirm_password_row.get_text()
-        
-        # If root is enabled but no password is set, use the user password
-        if not pw1 and not pw2:
-            user_pw = self.password_row.get_text() or "password"
-            self.root_password_row.set_text(user_pw)
-            self.root_confirm_password_row.set_text(user_pw)
-            pw1 = pw2 = user_pw
-        # If only one root password field is filled, copy it to the other
-        elif not pw1 and pw2:
-            self.root_password_row.set_text(pw2)
-            pw1 = pw2
-        elif pw1 and not pw2:
-            self.root_confirm_password_row.set_text(pw1)
-            pw2 = pw1
-            
-        # Ensure root passwords match
-        if pw1 != pw2:
-            self.root_confirm_password_row.set_text(pw1)
-            
-        return True
+        matches = pw1 == pw2
+        self._set_mismatch(self.root_confirm_password_row, bool(pw2) and not matches)
+        return matches
 
     def get_user_details(self):
-        """Returns the entered user details with automatic correction."""
+        """Returns the entered user details, or None (see validation_error) if invalid."""
+        self.validation_error = None
         # Force validation of all fields first
         self.validate_username()
-        self.validate_passwords()
         self.validate_root_passwords()
         
         # Get the current values after validation
@@ -115,12 +158,25 @@ class UserCreationView(Gtk.Box):
         if not username:
             username = "user"
             self.username_row.set_text(username)
+        if self._reserved_accounts is None:
+            # Usually loaded long before the page is left; don't block the main loop on it
+            self.validation_error = "The system accounts of the installed system are still being checked. Please try again in a moment."
+            return None
+        if self._reserved_accounts.is_reserved(username):
+            self.validation_error = f"The username '{username}' is reserved for a system account."
+            return None
+        uid = self._reserved_accounts.first_free_user_id()
+        if uid is None:
+            self.validation_error = "No free user ID is left for a new account."
+            return None
             
         password = self.password_row.get_text()
         if not password:
-            password = "password"
-            self.password_row.set_text(password)
-            self.confirm_password_row.set_text(password)
+            self.validation_error = "Please enter a password."
+            return None
+        if not self.validate_passwords():
+            self.validation_error = "The passwords do not match."
+            return None
             
         is_admin = self.admin_check.get_active()
         root_enabled = self.root_enable_check.get_active()
@@ -131,13 +187,15 @@ class UserCreationView(Gtk.Box):
             root_password = self.root_password_row.get_text()
             if not root_password:
                 root_password = password  # Default to user password if not set
-                self.root_password_row.set_text(root_password)
-                self.root_confirm_password_row.set_text(root_password)
+            elif not self.validate_root_passwords():
+                self.validation_error = "The root passwords do not match."
+                return None
         
         # Always return a valid user details dictionary
         result = {
             "full_name": full_name,
             "username": username,
+            "uid": uid,
             "password": password,
             "is_admin": is_admin,
             "root_enabled": root_enabled,
@@ -145,4 +203,27 @@ class UserCreationView(Gtk.Box):
         }
         
         print(f"User details collected: { {k: '***' if 'password' in k else v for k, v in result.items()} }")
-        return result 
\ No newline at end of file
+        return result
+
+    def hash_user_details(self, user_details, callback):
+        """Replaces plaintext passwords with crypt(3) hashes on a worker thread.
+
+        The callback is called on the main loop with (hashed_details, error_message).
+        """
+        def on_hashed(hashes, error):
+            if error is not None:
+                GLib.idle_add(callback, None, f"Could not hash passwords: {error}")
+                return
+            hashed = dict(user_details)
+            hashed['password'] = hashes['password']
+            hashed['root_password'] = hashes['root_password']
+            hashed['is_crypted'] = True
+            GLib.idle_add(callback, hashed, None)
+
+        if not self._hasher.available:
+            GLib.idle_add(callback, None, "Password hashing is not available (libcrypt missing)")
+            return
+        self._hasher.hash_passwords_async({
+            'password': user_details.get('password'),
+            'root_password': user_details.get('root_password') if user_details.get('root_enabled') else None,
+        }, on_hashed)
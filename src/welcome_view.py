@@ -4,6 +4,7 @@ gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw
 import os # Import os
 import re # Import re
+from src.locale_catalog import get_locale_catalog, load_translations
 
 # Note: This class now refers to the WelcomeView template in window.ui
 @Gtk.Template(filename='ui/welcome_view.ui')
@@ -13,20 +14,42 @@ class WelcomeView(Gtk.Box):
     # Bind the new widgets
     preferences_page = Gtk.Template.Child()
     language_combo_row = Gtk.Template.Child()
-
-    # Map combo row index to language ID
-    _language_map = { 
-        0: "en",
-        1: "es",
-        2: "fr"
-        # Add more mappings corresponding to items in UI file
-    }
+    language_search_entry = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._catalog = get_locale_catalog()
+        self._translations = None
+        self._translations_locale = None
+        # Catalog indices of the entries currently in the combo row, see _on_search_changed
+        self._visible = []
+        self.populate_languages()
+        self.language_search_entry.connect("search-changed", self._on_search_changed)
         print("WelcomeView initialized")
         self.update_welcome_label()
-        # Pre-select language based on locale? Maybe later.
+
+    def populate_languages(self):
+        """Fills the combo row from the locale catalog and preselects $LANG."""
+        current = os.environ.get('LANG', '').split('.', 1)[0]
+        index = self._catalog.index_of(current)
+        self._show_entries(self._catalog.search(""), index if index is not None else 0)
+
+    def _show_entries(self, indices, selected):
+        """Shows the given catalog entries, keeping the catalog index selected if it is among them."""
+        self._visible = indices
+        self.language_combo_row.set_model(
+            Gtk.StringList.new([self._catalog[i].display_name for i in indices]))
+        position = indices.index(selected) if selected in indices else 0
+        self.language_combo_row.set_selected(position if indices else Gtk.INVALID_LIST_POSITION)
+
+    def _selected_index(self):
+        position = self.language_combo_row.get_selected()
+        if position == Gtk.INVALID_LIST_POSITION or position >= len(self._visible):
+            return None
+        return self._visible[position]
+
+    def _on_search_changed(self, entry):
+        self._show_entries(self._catalog.search(entry.get_text()), self._selected_index())
 
     def get_distro_name(self):
         """Reads /etc/os-release to get the distribution name."""
@@ -59,12 +82,25 @@ class WelcomeView(Gtk.Box):
              print("Warning: preferences_page not bound when update_welcome_label called.")
 
     def get_selected_language(self):
-        """Gets the language ID from the selected item in the combo row."""
+        """Gets the locale code (e.g. en_US.UTF-8) of the selected combo row item."""
         if self.language_combo_row:
-             selected_index = self.language_combo_row.get_selected()
-             lang_id = self._language_map.get(selected_index, "en") # Default to 'en' if mapping missing
+             selected_index = self._selected_index()
+             if selected_index is None:
+                 return "en_US.UTF-8"
+             lang_id = self._catalog[selected_index].code
              print(f"Language combo index {selected_index} maps to ID: {lang_id}")
              return lang_id
         else:
              print("Warning: language_combo_row not bound in get_selected_language")
-             return "en" # Default language ID 
\ No newline at end of file
+             return "en_US.UTF-8" # Default language ID
+
+    def get_translations(self):
+        """Returns the installer translations for the selected language.
+
+        Only the chosen language's catalog is ever opened, and only on first use.
+        """
+        lang_id = self.get_selected_language()
+        if self._translations is None or self._translations_locale != lang_id:
+            self._translations = load_translations(lang_id)
+            self._translations_locale = lang_id
+        return self._translations
@@ -3,6 +3,7 @@ gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 from gi.repository import Gtk, Adw, Gio, GLib
 import sys
+from dataclasses import replace
 
 # Import the view classes
 from src.welcome_view import WelcomeView
@@ -14,6 +15,21 @@ from src.installation_summary_view import InstallationSummaryView
 from src.software_selection_view import SoftwareSelectionView
 from src.installation_progress_view import InstallationProgressView
 from src.installation_complete_view import InstallationCompleteView
+from src.install_config import (InstallConfig, LanguageSection, KeyboardSection, DestinationSection,
+                                UserSection, TimezoneSection, SoftwareSection)
+from src.anaconda_sync import AnacondaConfigSync
+
+# Page whose settings each Anaconda module receives, for error messages
+MODULE_PAGES = {
+    'Localization': "Language and keyboard",
+    'Timezone': "Time zone",
+    'Users': "User account",
+    'Storage': "Installation destination",
+    'Payloads': "Software selection",
+}
+
+# Widget properties holding user-visible text from the UI files, see _translate_pages()
+TRANSLATABLE_PROPERTIES = ("label", "title", "subtitle", "description", "placeholder-text")
 
 # Make sure Gtk knows about our custom widgets
 # Gtk.Template.bind_template_from_file("ui/keyboard_layout.ui")
@@ -46,11 +62,16 @@ class ExampleWindow(Adw.ApplicationWindow):
     quit_button = None
     welcome_view_widget = None # etc.
 
-    # Store collected configuration data
-    _config_data = {}
-
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Configuration collected by the pages, one section per page
+        self._config = InstallConfig()
+        # Each page's settings go to Anaconda as soon as the page is left
+        self._anaconda_sync = AnacondaConfigSync(self.on_anaconda_settings_applied)
+        # Begin Installation was clicked and waits for the checks, see continue_begin_installation()
+        self._begin_requested = False
+        # (widget, property) -> (source text, text last applied) for _translate_pages()
+        self._template_texts = {}
         self.set_default_size(800, 600)
         self.set_title("Centrio Installer")
 
@@ -107,6 +128,10 @@ class ExampleWindow(Adw.ApplicationWindow):
         self.software_view_widget = self.view_stack.get_child_by_name("software")
         self.progress_view_widget = self.view_stack.get_child_by_name("progress")
         self.complete_view_widget = self.view_stack.get_child_by_name("complete")
+        if self.summary_view_widget:
+            self.summary_view_widget.size_estimated_callback = self.continue_begin_installation
+        if self.destination_view_widget:
+            self.destination_view_widget.plan_finished_callback = self.on_storage_plan_finished
 
         # Initial state
         self.update_navigation_state()
@@ -145,6 +170,41 @@ class ExampleWindow(Adw.ApplicationWindow):
             
         # Title is handled by AdwViewStack automatically
 
+    def _translate_pages(self, translations):
+        """Translates the text the page templates were built with.
+
+        The source text of each property is remembered the first time it is
+        seen, so switching languages again starts from the untranslated
+        strings. Properties the pages have since set from code are left alone;
+        strings built in Python are not marked for translation.
+        """
+        pending = [page.get_child() for page in self.view_stack.get_pages()]
+        for page in self.view_stack.get_pages():
+            self._translate_property(page, "title", translations)
+        while pending:
+            widget = pending.pop()
+            names = {spec.name for spec in widget.list_properties()}
+            for name in TRANSLATABLE_PROPERTIES:
+                if name in names:
+                    self._translate_property(widget, name, translations)
+            child = widget.get_first_child()
+            while child is not None:
+                pending.append(child)
+                child = child.get_next_sibling()
+
+    def _translate_property(self, obj, name, translations):
+        current = obj.get_property(name)
+        if not current:
+            return
+        source, applied = self._template_texts.get((obj, name), (current, current))
+        if current != applied:
+            # Changed from code since the last pass
+            return
+        translated = translations.gettext(source)
+        self._template_texts[(obj, name)] = (source, translated)
+        if translated != current:
+            obj.set_property(name, translated)
+
     def on_continue_clicked(self, button):
         current_page = self.view_stack.get_visible_child_name()
         print(f"Continue clicked on page: {current_page}")
@@ -153,13 +213,17 @@ class ExampleWindow(Adw.ApplicationWindow):
         # --- Data Collection & Validation --- 
         if current_page == "welcome":
             if self.welcome_view_widget:
-                 self._config_data['language'] = self.welcome_view_widget.get_selected_language()
-                 print(f"Selected language ID: {self._config_data['language']}")
+                 self._config.update('language', LanguageSection(self.welcome_view_widget.get_selected_language()))
+                 print(f"Selected language ID: {self._config.language.language}")
+                 # Catalog for the chosen language is only loaded now
+                 self._translate_pages(self.welcome_view_widget.get_translations())
             next_page = "keyboard"
         elif current_page == "keyboard":
             if self.keyboard_view_widget:
-                self._config_data['keyboard'] = self.keyboard_view_widget.get_selected_layout()
-                print(f"Selected keyboard layout: {self._config_data['keyboard']}")
+                layout = self.keyboard_view_widget.get_selected_layout()
+                if layout:
+                    self._config.update('keyboard', KeyboardSection(layout))
+                print(f"Selected keyboard layout: {self._config.keyboard.layout}")
             next_page = "destination"
         elif current_page == "destination":
             if self.destination_view_widget:
@@ -172,14 +236,13 @@ class ExampleWindow(Adw.ApplicationWindow):
                      print("Need to handle custom partitioning flow.")
                      self.show_error_dialog("Custom Partitioning", "The custom partitioning tool is not implemented yet.")
                      return # Don't proceed automatically for custom 
-                self._config_data['destination'] = config
+                self._config.update('destination', DestinationSection(**config))
             next_page = "user_creation"
         elif current_page == "user_creation":
+            if not self.user_creation_view_widget:
+                print("Error: User creation view widget not found")
+                return
             try:
-                if not self.user_creation_view_widget:
-                    print("Error: User creation view widget not found")
-                    return
-                    
                 # Force validation of all fields
                 self.user_creation_view_widget.validate_username()
                 self.user_creation_view_widget.validate_passwords()
@@ -190,18 +253,16 @@ class ExampleWindow(Adw.ApplicationWindow):
                 
                 if not user_details:
                     print("Error: Failed to get user details")
+                    self.show_error_dialog("Invalid User Details",
+                                           self.user_creation_view_widget.validation_error or "Please check the user details.")
                     return
                     
-                print(f"Proceeding with user details: { {k: '***' if 'password' in k else v for k, v in user_details.items()} }")
-                self._config_data['user'] = user_details
-                next_page = "timezone"
-                
             except Exception as e:
                 print(f"Error in user creation: {str(e)}")
                 import traceback
                 traceback.print_exc()
                 # Try to proceed anyway with default values
-                self._config_data['user'] = {
+                user_details = {
                     'full_name': 'User',
                     'username': 'user',
                     'password': 'password',
@@ -209,7 +270,12 @@ class ExampleWindow(Adw.ApplicationWindow):
                     'root_enabled': False,
                     'root_password': None
                 }
-                next_page = "timezone"
+
+            print(f"Proceeding with user details: { {k: '***' if 'password' in k else v for k, v in user_details.items()} }")
+            # Passwords are hashed off the main loop; only the crypted values are stored
+            self.continue_button.set_sensitive(False)
+            self.user_creation_view_widget.hash_user_details(user_details, self.on_user_details_hashed)
+            return # Navigation continues in on_user_details_hashed
         elif current_page == "timezone":
             if not self.timezone_view_widget:
                 print("Error: Timezone view widget not found")
@@ -227,57 +293,122 @@ class ExampleWindow(Adw.ApplicationWindow):
                     }
                 
                 print(f"Using timezone config: {tz_config}")
-                self._config_data['timezone'] = tz_config
+                self._config.update('timezone', TimezoneSection(**tz_config))
                 next_page = "software"
                 
             except Exception as e:
                 print(f"Error getting timezone config: {str(e)}")
                 # Use a default timezone if there's an error
-                self._config_data['timezone'] = {
-                    "timezone": "America/New_York",
-                    "ntp_enabled": True
-                }
+                self._config.update('timezone', TimezoneSection("America/New_York", ntp_enabled=True))
                 next_page = "software"  # Continue anyway with defaults
         elif current_page == "software":
             if self.software_view_widget:
                  sw_config = self.software_view_widget.get_selected_software()
                  if sw_config:
                      print(f"Software config: {sw_config}")
-                     self._config_data['software'] = sw_config
+                     self._config.update('software', SoftwareSection.from_dict(sw_config))
                      next_page = "summary"
                  else:
-                     self.show_error_dialog("Software Selection Required", "Please select software to install (placeholder error).")
+                     self.show_error_dialog("Software Selection Required",
+                                            self.software_view_widget.validation_error or "Please select software to install.")
                      return # Validation failed
             else:
                 return # Should not happen
         elif current_page == "summary":
-            # Confirmation before starting installation
-            dialog = Adw.MessageDialog(transient_for=self,
-                                       heading="Begin Installation?",
-                                       body="This will start installing Oreon with the selected settings. Disk contents will be modified.")
-            dialog.add_response("cancel", "_Cancel")
-            dialog.add_response("install", "_Begin Installation")
-            dialog.set_response_appearance("install", Adw.ResponseAppearance.SUGGESTED)
-            dialog.set_default_response("install")
-            dialog.connect("response", self.on_begin_install_response)
-            dialog.present()
-            return # Wait for dialog response
+            # Retries anything Anaconda rejected or never received
+            self._anaconda_sync.push(self._config)
+            self._begin_requested = True
+            self.continue_begin_installation()
+            return # Wait for the checks and the dialog response
 
         # --- Navigation --- 
         if next_page:
+            self._anaconda_sync.push(self._config)
             # Special case: Populate summary view *before* navigating to it
             if next_page == "summary" and self.summary_view_widget:
-                self.summary_view_widget.update_summary(self._config_data)
+                self.summary_view_widget.update_summary(self._config)
                 
             self.view_stack.set_visible_child_name(next_page)
             self.update_navigation_state()
         else:
             print(f"No 'continue' action defined for page: {current_page}")
 
+    def continue_begin_installation(self):
+        """Asks to begin once the checks of a Begin Installation click can be made."""
+        if not self._begin_requested:
+            return
+        # Settings still in flight would start the installation with Anaconda's old values,
+        # and a plan still being computed with a layout nobody reviewed
+        if self._anaconda_sync.pending() or (
+                self.summary_view_widget and self.summary_view_widget.size_estimate_pending()) or (
+                self.destination_view_widget and self.destination_view_widget.plan_pending()):
+            self.continue_button.set_sensitive(False)
+            self.continue_button.set_label("Checking...")
+            return
+        self._begin_requested = False
+        self.update_navigation_state()
+
+        rejected = [result for result in self._anaconda_sync.results.values() if not result.ok]
+        if rejected:
+            self.show_settings_rejected(rejected[0])
+            return
+        space_error = self.summary_view_widget.check_disk_space() if self.summary_view_widget else None
+        if space_error:
+            self.show_error_dialog("Not Enough Disk Space", space_error)
+            return
+        # Confirmation before starting installation
+        dialog = Adw.MessageDialog(transient_for=self,
+                                   heading="Begin Installation?",
+                                   body="This will start installing Oreon with the selected settings. Disk contents will be modified.")
+        dialog.add_response("cancel", "_Cancel")
+        dialog.add_response("install", "_Begin Installation")
+        dialog.set_response_appearance("install", Adw.ResponseAppearance.SUGGESTED)
+        dialog.set_default_response("install")
+        dialog.connect("response", self.on_begin_install_response)
+        dialog.present()
+
+    def on_storage_plan_finished(self, plan):
+        """Keeps a plan that finished after the destination page was left."""
+        destination = self._config.destination
+        if plan and 'destination' in self._config.completed and plan['disks'] == destination.disks \
+                and destination.config_mode == 'Automatic':
+            self._config.update('destination', replace(destination, storage_plan=plan))
+            self._anaconda_sync.push(self._config)
+        self.continue_begin_installation()
+
+    def on_user_details_hashed(self, user_details, error_message):
+        """Stores the hashed user details and moves on to the timezone page."""
+        self.continue_button.set_sensitive(True)
+        if error_message:
+            self.show_error_dialog("Password Error", error_message)
+            return False
+        self._config.update('user', UserSection(**user_details))
+        self._anaconda_sync.push(self._config)
+        if self.view_stack.get_visible_child_name() == "user_creation":
+            self.view_stack.set_visible_child_name("timezone")
+            self.update_navigation_state()
+        return False
+
+    def on_anaconda_settings_applied(self, result):
+        """Shows what Anaconda's modules made of the settings a page sent them."""
+        for warning in result.warnings:
+            print(f"Anaconda {result.module} warning: {warning}")
+        if not result.ok:
+            # Sent again with the next change, or when the installation begins
+            self._config.mark_dirty(result.module)
+            if not self._begin_requested:
+                self.show_settings_rejected(result)
+        self.continue_begin_installation()
+
+    def show_settings_rejected(self, result):
+        self.show_error_dialog(f"{MODULE_PAGES.get(result.module, result.module)} settings were rejected",
+                               "\n".join(result.errors + result.warnings))
+
     def on_back_clicked(self, button):
         current_page = self.view_stack.get_visible_child_name()
         print(f"Back clicked on page: {current_page}")
         prev_page = None
+        self._begin_requested = False
 
         if current_page == "keyboard":
              prev_page = "welcome"
@@ -314,10 +445,12 @@ class ExampleWindow(Adw.ApplicationWindow):
         # Start the actual installation
         if self.progress_view_widget and self.summary_view_widget:
             # Update the summary view with the latest config
-            self.summary_view_widget.update_summary(self._config_data)
+            self.summary_view_widget.update_summary(self._config)
             
             # Start the installation
-            self.progress_view_widget.start_installation(self.on_installation_complete)
+            self.progress_view_widget.set_config(self._config.snapshot())
+            self.progress_view_widget.start_installation(self.on_installation_complete,
+                                                         self.on_installation_closed)
         else:
             error_msg = "Failed to initialize installation: Missing required components"
             print(error_msg)
@@ -336,16 +469,23 @@ class ExampleWindow(Adw.ApplicationWindow):
         """
         if success:
             print("Installation completed successfully")
+            if self.complete_view_widget and self.progress_view_widget:
+                self.complete_view_widget.set_install_report(self.progress_view_widget.get_install_report())
+                self.complete_view_widget.set_kickstart_settings(self._config.kickstart_settings())
             self.view_stack.set_visible_child_name("complete")
         else:
             error_msg = message or "Installation failed with an unknown error"
             print(f"Installation failed: {error_msg}")
             self.show_error_dialog("Installation Failed", error_msg)
-            # Go back to summary on error
-            self.view_stack.set_visible_child_name("summary")
+            # Stay on the progress page with the log; its Close button goes back
             
         self.update_navigation_state()
 
+    def on_installation_closed(self):
+        """Returns to the summary once a failed or cancelled installation is closed."""
+        self.view_stack.set_visible_child_name("summary")
+        self.update_navigation_state()
+
     def show_error_dialog(self, title, message, parent=None):
         """
         Show an error dialog with the given title and message.